@@ -0,0 +1,11 @@
+from rest_framework.permissions import IsAuthenticated
+
+from .serializers import UserSerializer
+from utils.async_views import async_api_view, render
+
+# Async versions of the account read views, served instead of views.py over ASGI (eshop/asgi_urls.py)
+
+
+@async_api_view(['GET'], permission_classes=[IsAuthenticated])
+async def current_user(request):
+    return render(UserSerializer(request.user, many=False).data)
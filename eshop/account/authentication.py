@@ -0,0 +1,142 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from utils.lru import LRUCache
+
+
+# Users of JWT-authenticated requests, cached so a request doesn't have to load its user.
+#
+# Lookups go to a small LRU+TTL cache in this process, then to the shared cache,
+# then to the database. Saving or deleting a user drops both cached copies here
+# and in the shared cache; other processes see the change once their local copy
+# expires, after USER_CACHE_LOCAL_TTL seconds at most. Without SHARED_CACHE
+# invalidations can't reach the other processes in time, and users are always
+# loaded from the database.
+
+local_users = LRUCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_LOCAL_TTL)
+
+
+def user_cache_key(pk):
+    return f'account:user:{pk}'
+
+
+# Always from the primary: a lagging replica's row of a user deactivated or
+# with a new password would pass check_user, and be cached like that
+def load_user(pk):
+    User = get_user_model()
+    try:
+        return User.objects.using(DEFAULT_DB_ALIAS).get(**{api_settings.USER_ID_FIELD: pk})
+    except (User.DoesNotExist, ValueError):
+        return None
+
+
+async def aload_user(pk):
+    User = get_user_model()
+    try:
+        return await User.objects.using(DEFAULT_DB_ALIAS).aget(**{api_settings.USER_ID_FIELD: pk})
+    except (User.DoesNotExist, ValueError):
+        return None
+
+
+def get_user(pk):
+    """The user with primary key `pk`, or None. The instance is the caller's own to modify."""
+    if not settings.SHARED_CACHE:
+        return load_user(pk)
+    key = user_cache_key(pk)
+
+    user = local_users.get(key)
+    if user is None:
+        user = cache.get(key)
+        if user is None:
+            user = load_user(pk)
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        local_users.set(key, user)
+
+    # views change request.user in place (update_user), never hand out the cached instance
+    return copy.copy(user)
+
+
+async def aget_user(pk):
+    """get_user for async views."""
+    if not settings.SHARED_CACHE:
+        return await aload_user(pk)
+    key = user_cache_key(pk)
+
+    user = local_users.get(key)
+    if user is None:
+        user = await cache.aget(key)
+        if user is None:
+            user = await aload_user(pk)
+            if user is None:
+                return None
+            await cache.aset(key, user, settings.USER_CACHE_TIMEOUT)
+        local_users.set(key, user)
+
+    return copy.copy(user)
+
+
+def invalidate_user(pk):
+    """
+    Drop the cached copies of a user, now and again after commit so a request
+    that read the old row meanwhile can't leave it cached.
+    """
+    key = user_cache_key(pk)
+
+    def drop():
+        local_users.delete(key)
+        cache.delete(key)
+
+    drop()
+    transaction.on_commit(drop)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with its per-request user lookup served from the user cache."""
+
+    def get_user(self, validated_token):
+        return self.check_user(get_user(self.get_user_id(validated_token)), validated_token)
+
+    # authenticate() for async views, without a thread hop for the user lookup
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user = await aget_user(self.get_user_id(validated_token))
+        return self.check_user(user, validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def check_user(self, user, validated_token):
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        return user
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from .hashing import hash_password, verify_password
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend with the password check (and any rehash) run on the password hashing pool."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, so an unknown username takes as long as a wrong password
+            hash_password(password)
+            return None
+
+        if verify_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
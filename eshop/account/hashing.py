@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# Password hashing off the request workers.
+#
+# Hashing or checking a password costs hundreds of milliseconds of CPU. It runs
+# on a pool of PASSWORD_HASH_WORKERS processes shared by the requests of this
+# web worker, so a burst of signups or logins can't take every core from the
+# catalog reads. At most PASSWORD_HASH_QUEUE calls wait or run at a time, past
+# that requests are turned away with 503 and Retry-After. A pool broken by a
+# worker process dying (OOM kill, segfault) fails its calls with 503 too and is
+# replaced by a new one on the next call.
+
+
+class PasswordHashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password requests, try again shortly.'
+    default_code = 'password_hashing_busy'
+
+    def __init__(self):
+        super().__init__()
+        # the exception handler turns it into Retry-After
+        self.wait = settings.PASSWORD_HASH_RETRY_AFTER
+
+
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+# workers are started fresh (not forked from a threaded server) and set Django up themselves
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eshop.settings')
+    django.setup()
+
+
+def get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            if settings.PASSWORD_HASH_POOL == 'process':
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context(method),
+                    initializer=_init_worker,
+                )
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash'
+                )
+            _slots = threading.BoundedSemaphore(settings.PASSWORD_HASH_QUEUE)
+        return _executor, _slots
+
+
+@receiver(setting_changed)
+def _reset_executor(setting, **kwargs):
+    global _executor
+    if setting.startswith('PASSWORD_HASH'):
+        with _executor_lock:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = None
+
+
+def _discard(executor):
+    global _executor
+    with _executor_lock:
+        # unless another call has replaced it already
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def run(func, *args):
+    """
+    Call func(*args) on the pool and wait for it. PasswordHashingBusy when the
+    queue is full or the pool broke.
+    """
+    executor, slots = get_executor()
+    if not slots.acquire(blocking=False):
+        raise PasswordHashingBusy()
+
+    try:
+        future = executor.submit(func, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _discard(executor)
+        raise PasswordHashingBusy()
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        _discard(executor)
+        raise PasswordHashingBusy()
+
+
+def hash_password(password):
+    """make_password on the pool."""
+    return run(hashers.make_password, password)
+
+
+def must_rehash(encoded):
+    """Whether a stored hash was made by another hasher or work factor than the configured one."""
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify_password(user, password):
+    """
+    user.check_password on the pool. A correct password stored with an old
+    hasher or work factor is hashed again and saved, unless the pool is busy.
+    """
+    if not run(hashers.check_password, password, user.password):
+        return False
+
+    if must_rehash(user.password):
+        try:
+            user.password = hash_password(password)
+        except PasswordHashingBusy:
+            # next time then
+            return True
+        user.save(update_fields=['password'])
+    return True
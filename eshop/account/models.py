@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 
 # Create your models here.
 class Profile(models.Model):
@@ -19,4 +19,13 @@ def save_profile(sender, instance, created, **kwargs):
     
     if created:
         profile = Profile(user=user)
-        profile.save()
\ No newline at end of file
+        profile.save()
+
+
+# JWT authentication caches users, drop the cached copy on any change (update_user, reset_password, deactivation)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    from .authentication import invalidate_user
+
+    invalidate_user(instance.pk)
@@ -1,3 +1,196 @@
-from django.test import TestCase
+import os
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.cache import cache
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import get_user, local_users, user_cache_key
+from . import hashing
+
+from notifications.models import QueuedEmail
 
 # Create your tests here.
+
+
+class ForgotPasswordTest(TestCase):
+
+    def test_reset_email_is_queued_not_sent(self):
+        User.objects.create(username='jane@eshop.com', email='jane@eshop.com')
+
+        res = self.client.post('/api/forgot_password/', {'email': 'jane@eshop.com'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = QueuedEmail.objects.get()
+        self.assertEqual(email.recipients, ['jane@eshop.com'])
+        self.assertIn(User.objects.get().profile.reset_password_token, email.body)
+
+
+# one test process, so its local memory cache is shared
+@override_settings(SHARED_CACHE=True)
+class CachedJWTAuthenticationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        self.user = User.objects.create(
+            username='jane@eshop.com', email='jane@eshop.com', first_name='Jane', password=make_password('secret123')
+        )
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def test_user_is_loaded_once(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/me/', **self.auth)
+
+        with self.assertNumQueries(0):
+            res = self.client.get('/api/me/', **self.auth)
+        self.assertEqual(res.json()['first_name'], 'Jane')
+
+        # another process, with only the shared cache warm
+        local_users.clear()
+        with self.assertNumQueries(0):
+            self.client.get('/api/me/', **self.auth)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_user_is_loaded_every_time_without_a_shared_cache(self):
+        self.client.get('/api/me/', **self.auth)
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/me/', **self.auth)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+    def test_update_user_invalidates(self):
+        self.client.get('/api/me/', **self.auth)
+
+        data = {'first_name': 'Janet', 'last_name': 'Doe', 'email': 'jane@eshop.com', 'password': ''}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/api/me/update/', data, content_type='application/json', **self.auth)
+
+        self.assertEqual(self.client.get('/api/me/', **self.auth).json()['first_name'], 'Janet')
+
+    def test_update_user_keeps_columns_changed_since_caching(self):
+        self.client.get('/api/me/', **self.auth)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+
+        data = {'first_name': 'Janet', 'last_name': 'Doe', 'email': 'jane@eshop.com', 'password': ''}
+        self.client.put('/api/me/update/', data, content_type='application/json', **self.auth)
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Janet')
+        self.assertTrue(user.is_staff)
+        self.assertTrue(check_password('secret123', user.password))
+
+    def test_reset_password_invalidates(self):
+        self.client.get('/api/me/', **self.auth)
+        self.user.profile.reset_password_token = 'token'
+        self.user.profile.reset_password_expire = datetime.now() + timedelta(minutes=5)
+        self.user.profile.save()
+
+        data = {'password': 'newsecret', 'confirm_password': 'newsecret'}
+        self.client.post('/api/reset_password/token', data, content_type='application/json')
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/me/', **self.auth)
+        self.assertTrue(check_password('newsecret', get_user(self.user.pk).password))
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/me/', **self.auth)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/api/me/', **self.auth).status_code, 401)
+
+    def test_cached_instance_is_not_shared(self):
+        get_user(self.user.pk).first_name = 'Changed'
+        self.assertEqual(get_user(self.user.pk).first_name, 'Jane')
+
+    def test_rotated_refresh_token_is_blacklisted(self):
+        res = self.client.post('/api/token/', {'username': 'jane@eshop.com', 'password': 'secret123'})
+        refresh = res.json()['refresh']
+
+        res = self.client.post('/api/token/refresh/', {'refresh': refresh})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.json()['refresh'], refresh)
+
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}).status_code, 401)
+
+    def test_async_current_user(self):
+        sync = self.client.get('/api/me/', **self.auth)
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            get = async_to_sync(self.async_client.get)
+            res = get('/api/me/', headers={'Authorization': self.auth['HTTP_AUTHORIZATION']})
+            self.assertEqual(get('/api/me/').status_code, 401)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, sync.content)
+
+
+class PasswordHashingTest(TestCase):
+
+    def register(self, email='sam@eshop.com'):
+        data = {'first_name': 'Sam', 'last_name': 'Lee', 'email': email, 'password': 'secret123'}
+        return self.client.post('/api/register/', data, content_type='application/json')
+
+    def test_register_hashes_on_the_pool(self):
+        self.assertEqual(self.register().status_code, 201)
+        self.assertTrue(check_password('secret123', User.objects.get().password))
+
+    def test_register_relies_on_the_unique_username(self):
+        self.register()
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.register()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json(), {'error': 'User already exists'})
+        self.assertEqual(User.objects.count(), 1)
+
+    @override_settings(PASSWORD_HASH_POOL='thread', PASSWORD_HASH_QUEUE=1)
+    def test_full_queue_sheds_load(self):
+        _, slots = hashing.get_executor()
+        slots.acquire()
+        try:
+            res = self.register()
+        finally:
+            slots.release()
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(User.objects.count(), 0)
+        self.assertEqual(self.register().status_code, 201)
+
+    def test_broken_pool_is_replaced(self):
+        executor, _ = hashing.get_executor()
+        # a worker process dying breaks the pool
+        self.assertRaises(BrokenProcessPool, executor.submit(os._exit, 1).result)
+
+        self.assertEqual(self.register().status_code, 503)
+        self.assertEqual(self.register().status_code, 201)
+        self.assertIsNot(hashing.get_executor()[0], executor)
+
+    def test_login_rehashes_old_work_factor(self):
+        hasher = PBKDF2PasswordHasher()
+        user = User.objects.create(
+            username='old@eshop.com', password=hasher.encode('secret123', hasher.salt(), iterations=1000)
+        )
+
+        res = self.client.post('/api/token/', {'username': 'old@eshop.com', 'password': 'secret123'})
+        self.assertEqual(res.status_code, 200)
+
+        user.refresh_from_db()
+        self.assertFalse(hashing.must_rehash(user.password))
+        self.assertTrue(check_password('secret123', user.password))
+
+        res = self.client.post('/api/token/', {'username': 'old@eshop.com', 'password': 'wrong'})
+        self.assertEqual(res.status_code, 401)
@@ -5,15 +5,16 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
 from django.contrib.auth.models import User
-from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from django.utils.crypto import get_random_string
-from django.core.mail import send_mail
 
 from datetime import timedelta, datetime
 
 from .serializers import SignUpSerializer, UserSerializer
+from .hashing import hash_password
 from utils.helpers import get_current_host
+from notifications.mail import enqueue_email
  
 #  Views
 @api_view(['POST'])
@@ -23,20 +24,22 @@ def register(request):
     user = SignUpSerializer(data=data)
     
     if user.is_valid():
-        if not User.objects.filter(username=data['email']).exists():
-            
-            user = User.objects.create(
-                first_name = data['first_name'],
-                last_name = data['last_name'],
-                email = data['email'],
-                username = data['email'],
-                password = make_password(data['password'])
-            )
-            
-            return Response({'success': 'User created successfully'}, status=status.HTTP_201_CREATED)
+        password = hash_password(data['password'])
         
-        else:
+        # the unique username catches existing users, no separate lookup
+        try:
+            with transaction.atomic():
+                user = User.objects.create(
+                    first_name = data['first_name'],
+                    last_name = data['last_name'],
+                    email = data['email'],
+                    username = data['email'],
+                    password = password
+                )
+        except IntegrityError:
             return Response({'error': 'User already exists'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'success': 'User created successfully'}, status=status.HTTP_201_CREATED)
     else:
         return Response(user.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -59,10 +62,13 @@ def update_user(request):
     user.email = data['email']
     user.username = data['email']
     
+    fields = ['first_name', 'last_name', 'email', 'username']
     if data['password'] != "":
-        user.password = make_password(data['password'])
+        user.password = hash_password(data['password'])
+        fields.append('password')
         
-    user.save()
+    # request.user may be a cached copy, only write what changed here
+    user.save(update_fields=fields)
     
     updated_user = UserSerializer(user, many=False)
     
@@ -89,7 +95,8 @@ def forgot_password(request):
     link = f'{host}api/reset_password/{token}'.format(host=host, token=token)
     body = "Your password reset link is: {link}".format(link=link)
     
-    send_mail(
+    # Queued, the send_queued_emails worker delivers it
+    enqueue_email(
         'Password reset for eshop',
         body,
         'noreply@eshop.com',
@@ -113,7 +120,7 @@ def reset_password(request, token):
     if data['password'] != data['confirm_password']:
         return Response({'error': 'Passwords do not match'}, status=status.HTTP_400_BAD_REQUEST)
     
-    user.password = make_password(data['password'])
+    user.password = hash_password(data['password'])
     user.profile.reset_password_token = ''
     user.profile.reset_password_expire = None
     
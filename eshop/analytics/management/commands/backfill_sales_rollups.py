@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from analytics.rollups import rebuild_rollups
+
+
+def parse_day(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+    return day
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily sales rollups from the order tables, for all days or from --start to --end. '
+        'Orders placed for those days while it runs may be missed, so prefer closed days.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_day, help='First day, YYYY-MM-DD')
+        parser.add_argument('--end', type=parse_day, help='Last day, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rollup rows inserted per query')
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(options['start'], options['end'], batch_size=options['batch_size'])
+        self.stdout.write(f'Wrote {written} rollup rows')
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('TOTAL', 'Total'), ('PRODUCT', 'Product'), ('CATEGORY', 'Category')], max_length=20)),
+                ('key', models.CharField(blank=True, default='', max_length=200)),
+                ('category', models.CharField(blank=True, default='', max_length=30)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', 'date'], name='sales_rollup_dimension_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key', 'date'), name='sales_rollup_unique')],
+            },
+        ),
+    ]
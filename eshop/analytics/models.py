@@ -0,0 +1,31 @@
+from django.db import models
+
+# Create your models here.
+class Dimension(models.TextChoices):
+    TOTAL = 'TOTAL'
+    PRODUCT = 'PRODUCT'
+    CATEGORY = 'CATEGORY'
+
+
+# Daily sales per product, per category and in total, kept up to date as orders are placed
+class SalesRollup(models.Model):
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=Dimension.choices)
+    # product id or category name, '' for the daily totals
+    key = models.CharField(max_length=200, blank=True, default='')
+    # category of the product, for product rows
+    category = models.CharField(max_length=30, blank=True, default='')
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key', 'date'], name='sales_rollup_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', 'date'], name='sales_rollup_dimension_idx'),
+        ]
+    
+    def __str__(self):
+        return f'{self.date} {self.dimension} {self.key}'
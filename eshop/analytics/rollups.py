@@ -0,0 +1,115 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from order.models import OrderItem
+from .models import SalesRollup, Dimension
+
+
+REVENUE_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def order_deltas(items):
+    """
+    What one order adds to the rollups, as {(dimension, key): [category, orders, units, revenue]}.
+    items are the order's OrderItems with their products loaded.
+    """
+    deltas = {}
+
+    def add(dimension, key, category, quantity, revenue):
+        delta = deltas.setdefault((dimension, key), [category, 1, 0, Decimal(0)])
+        delta[2] += quantity
+        delta[3] += revenue
+
+    for item in items:
+        quantity = int(item.quantity)
+        revenue = Decimal(str(item.price)) * quantity
+        add(Dimension.TOTAL, '', '', quantity, revenue)
+        # items of deleted products only count towards the totals
+        if item.product is not None:
+            add(Dimension.PRODUCT, str(item.product.id), item.product.category, quantity, revenue)
+            add(Dimension.CATEGORY, item.product.category, '', quantity, revenue)
+
+    return deltas
+
+
+def record_order(order, items):
+    """
+    Add a new order to its day's rollups: one insert for the missing rows and one
+    UPDATE that adds to all of them. Call in the transaction that creates the order.
+    """
+    deltas = order_deltas(items)
+    if not deltas:
+        return
+
+    day = timezone.localdate(order.created_at)
+    SalesRollup.objects.bulk_create(
+        [SalesRollup(date=day, dimension=dimension, key=key, category=delta[0]) for (dimension, key), delta in deltas.items()],
+        ignore_conflicts=True,
+    )
+
+    def increment(index, output_field):
+        return Case(
+            *[When(dimension=dimension, key=key, then=Value(delta[index])) for (dimension, key), delta in deltas.items()],
+            default=Value(0),
+            output_field=output_field,
+        )
+
+    rows = Q()
+    for dimension, key in deltas:
+        rows |= Q(dimension=dimension, key=key)
+
+    SalesRollup.objects.filter(rows, date=day).update(
+        orders=F('orders') + increment(1, IntegerField()),
+        units=F('units') + increment(2, IntegerField()),
+        revenue=F('revenue') + increment(3, REVENUE_FIELD),
+    )
+
+
+def rebuild_rollups(start=None, end=None, batch_size=1000):
+    """
+    Recompute the rollups of the days from start to end (inclusive, both optional)
+    from the order tables. Returns the number of rollup rows written.
+    """
+    items = OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+    rollups = SalesRollup.objects.all()
+    if start is not None:
+        items = items.filter(day__gte=start)
+        rollups = rollups.filter(date__gte=start)
+    if end is not None:
+        items = items.filter(day__lte=end)
+        rollups = rollups.filter(date__lte=end)
+
+    sales = {
+        'orders': Count('order', distinct=True),
+        'units': Sum('quantity'),
+        'revenue': Sum(F('price') * F('quantity'), output_field=REVENUE_FIELD),
+    }
+    with_product = items.filter(product__isnull=False)
+
+    rows = [
+        SalesRollup(date=row['day'], dimension=Dimension.TOTAL, **sales_of(row))
+        for row in items.values('day').annotate(**sales).order_by()
+    ] + [
+        SalesRollup(
+            date=row['day'], dimension=Dimension.PRODUCT, key=str(row['product']),
+            category=row['product__category'], **sales_of(row),
+        )
+        for row in with_product.values('day', 'product', 'product__category').annotate(**sales).order_by()
+    ] + [
+        SalesRollup(date=row['day'], dimension=Dimension.CATEGORY, key=row['product__category'], **sales_of(row))
+        for row in with_product.values('day', 'product__category').annotate(**sales).order_by()
+    ]
+
+    with transaction.atomic():
+        rollups.delete()
+        SalesRollup.objects.bulk_create(rows, batch_size=batch_size)
+
+    return len(rows)
+
+
+def sales_of(row):
+    return {'orders': row['orders'], 'units': row['units'], 'revenue': row['revenue']}
@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+
+class SalesSerializer(serializers.Serializer):
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class DailySalesSerializer(SalesSerializer):
+    date = serializers.DateField()
+
+
+class CategorySalesSerializer(SalesSerializer):
+    category = serializers.CharField(source='key')
+
+
+class ProductSalesSerializer(SalesSerializer):
+    product = serializers.IntegerField(source='key')
+    category = serializers.CharField()
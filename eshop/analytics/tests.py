@@ -0,0 +1,122 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.test import APITestCase
+
+from benchmarks.stubs import StubStripeClient
+from order.events import handle_checkout_session_completed
+from order.models import Order
+from product.models import Product
+from .models import SalesRollup, Dimension
+
+# Create your tests here.
+
+SHIPPING = {
+    'street': '1 Main St', 'city': 'London', 'state': 'London',
+    'zip_code': 'N1', 'country': 'UK', 'phone_no': '0123',
+}
+
+
+class SalesRollupTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        cls.kettle = Product.objects.create(name='Kettle', category='Kitchen', price='19.99', stock=100)
+        cls.toaster = Product.objects.create(name='Toaster', category='Kitchen', price='25.50', stock=100)
+        cls.lamp = Product.objects.create(name='Lamp', category='Home', price='10.00', stock=100)
+
+    def order(self, *items):
+        self.client.force_authenticate(self.user)
+        res = self.client.post('/api/orders/new/', {
+            **SHIPPING,
+            'orderItems': [{'product': p.id, 'quantity': q, 'price': float(p.price)} for p, q in items],
+        }, format='json')
+        self.assertEqual(res.status_code, 200)
+
+    def rollups(self):
+        return {
+            (r.dimension, r.key): (r.category, r.orders, r.units, str(r.revenue))
+            for r in SalesRollup.objects.all()
+        }
+
+    def place_orders(self):
+        self.order((self.kettle, 2), (self.toaster, 1))
+        self.order((self.kettle, 1), (self.lamp, 3))
+        handle_checkout_session_completed(
+            {'id': 'cs_1', 'amount_total': 1999, 'metadata': {**SHIPPING, 'user': str(self.user.id)}},
+            StubStripeClient(),
+        )
+
+    def test_orders_update_rollups(self):
+        self.place_orders()
+
+        self.assertEqual(self.rollups(), {
+            (Dimension.TOTAL, ''): ('', 3, 8, '135.46'),
+            (Dimension.PRODUCT, str(self.kettle.id)): ('Kitchen', 3, 4, '79.96'),
+            (Dimension.PRODUCT, str(self.toaster.id)): ('Kitchen', 1, 1, '25.50'),
+            (Dimension.PRODUCT, str(self.lamp.id)): ('Home', 1, 3, '30.00'),
+            (Dimension.CATEGORY, 'Kitchen'): ('', 3, 5, '105.46'),
+            (Dimension.CATEGORY, 'Home'): ('', 1, 3, '30.00'),
+        })
+
+    def test_backfill_matches_incremental_rollups(self):
+        self.place_orders()
+        expected = self.rollups()
+
+        SalesRollup.objects.all().delete()
+        call_command('backfill_sales_rollups', stdout=StringIO())
+
+        self.assertEqual(self.rollups(), expected)
+
+    def test_backfill_only_touches_given_days(self):
+        self.place_orders()
+        yesterday = timezone.localdate() - timedelta(days=1)
+        SalesRollup.objects.create(date=yesterday, dimension=Dimension.TOTAL, orders=1, units=1, revenue=1)
+
+        call_command('backfill_sales_rollups', '--end', str(yesterday), stdout=StringIO())
+
+        self.assertFalse(SalesRollup.objects.filter(date=yesterday).exists())
+        self.assertEqual(SalesRollup.objects.count(), 6)
+
+    def test_endpoint_reads_only_rollups(self):
+        self.place_orders()
+        self.client.force_authenticate(self.admin)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/analytics/sales/', {'resPerPage': 2})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(queries), 3)
+        self.assertFalse(any(Order._meta.db_table in q['sql'] for q in queries))
+
+        data = res.json()
+        self.assertEqual(data['totals'], {'orders': 3, 'units': 8, 'revenue': '135.46'})
+        self.assertEqual(data['days'], [{'orders': 3, 'units': 8, 'revenue': '135.46', 'date': str(timezone.localdate())}])
+        self.assertEqual([c['category'] for c in data['categories']], ['Kitchen', 'Home'])
+        self.assertEqual(data['products'], [
+            {'orders': 3, 'units': 4, 'revenue': '79.96', 'product': self.kettle.id, 'category': 'Kitchen'},
+            {'orders': 1, 'units': 3, 'revenue': '30.00', 'product': self.lamp.id, 'category': 'Home'},
+        ])
+
+    def test_endpoint_period(self):
+        self.client.force_authenticate(self.admin)
+        self.order((self.lamp, 1))
+        self.client.force_authenticate(self.admin)
+
+        res = self.client.get('/api/analytics/sales/', {'end': str(timezone.localdate() - timedelta(days=1))})
+        self.assertEqual(res.json()['totals']['orders'], 0)
+
+        self.assertEqual(self.client.get('/api/analytics/sales/', {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/sales/', {'start': '2025-02-01', 'end': '2025-01-01'}).status_code, 400)
+
+    def test_endpoint_is_admin_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/analytics/sales/').status_code, 403)
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('analytics/sales/', views.sales, name='sales_analytics'),
+]
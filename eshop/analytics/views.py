@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+
+from .models import SalesRollup, Dimension
+from .serializers import SalesSerializer, DailySalesSerializer, CategorySalesSerializer, ProductSalesSerializer
+from utils.pagination import get_page_size
+
+# Create your views here.
+
+DEFAULT_PERIOD_DAYS = 30
+
+
+# get a YYYY-MM-DD query parameter, None when absent, ValueError when invalid
+def get_day(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+# Sales between ?start= and ?end= (inclusive, defaults to the last 30 days), read from the rollups only
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def sales(request):
+    try:
+        end = get_day(request, 'end') or timezone.localdate()
+        start = get_day(request, 'start') or end - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    except ValueError:
+        return Response({'error': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if start > end:
+        return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+
+    rollups = SalesRollup.objects.filter(date__range=(start, end))
+    totals = {'orders': Sum('orders'), 'units': Sum('units'), 'revenue': Sum('revenue')}
+
+    days = list(rollups.filter(dimension=Dimension.TOTAL).order_by('date'))
+    categories = (
+        rollups.filter(dimension=Dimension.CATEGORY)
+        .values('key').annotate(**totals).order_by('-revenue', 'key')
+    )
+    # best sellers first, ?resPerPage= of them
+    products = (
+        rollups.filter(dimension=Dimension.PRODUCT)
+        .values('key', 'category').annotate(**totals).order_by('-revenue', 'key')[:get_page_size(request)]
+    )
+
+    return Response({
+        'start': start,
+        'end': end,
+        'totals': SalesSerializer({
+            'orders': sum(day.orders for day in days),
+            'units': sum(day.units for day in days),
+            'revenue': sum(day.revenue for day in days),
+        }).data,
+        'days': DailySalesSerializer(days, many=True).data,
+        'categories': CategorySalesSerializer(categories, many=True).data,
+        'products': ProductSalesSerializer(products, many=True).data,
+    })
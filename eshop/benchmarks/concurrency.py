@@ -0,0 +1,135 @@
+import asyncio
+import statistics
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from eshop.asgi_urls import ASYNC_VIEWS
+from utils.db_pool import connection_stats, reset_connection_stats
+from .runner import percentile
+
+
+# The read endpoints under concurrent load: the sync views served over WSGI by
+# `concurrency` threads, like a threaded WSGI server, against their async
+# versions served over ASGI by `concurrency` tasks on one event loop.
+
+
+def read_scenarios(scenarios):
+    """The scenarios of the endpoints that have an async version."""
+    return [scenario for scenario in scenarios if scenario.url_name in ASYNC_VIEWS and scenario.method == 'GET']
+
+
+def build_requests(scenario, ctx, requests):
+    built = []
+    for _ in range(requests):
+        n = ctx.next()
+        obj = scenario.prepare(ctx, n)
+        user = scenario.user(ctx, n, obj)
+        headers = {'Authorization': f'Bearer {ctx.token(user)}'} if user else {}
+        built.append((scenario.path(ctx, n, obj), headers))
+    return built
+
+
+def summarize(timings, statuses, elapsed):
+    timings = sorted(timings)
+    return {
+        # how many connections the run opened or took from the pool, and how long that took
+        'connections': connection_stats()['default'],
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        # requests in flight overlap, so this is requests over wall time
+        'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else None,
+        'statuses': {str(code): count for code, count in sorted(Counter(statuses).items())},
+    }
+
+
+def run_wsgi(requests, concurrency):
+    reset_connection_stats()
+    pending = list(reversed(requests))
+    lock = threading.Lock()
+    timings, statuses = [], []
+
+    def worker():
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    path, headers = pending.pop()
+                start = time.perf_counter()
+                response = client.get(path, headers=headers)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    timings.append(elapsed)
+                    statuses.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, statuses, time.perf_counter() - start)
+
+
+async def _run_asgi(requests, concurrency):
+    reset_connection_stats()
+    pending = list(reversed(requests))
+    timings, statuses = [], []
+
+    async def worker():
+        client = AsyncClient()
+        while pending:
+            path, headers = pending.pop()
+            start = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            timings.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    # the ORM's worker thread keeps a connection of its own
+    await sync_to_async(connections.close_all)()
+    return summarize(timings, statuses, elapsed)
+
+
+def run_asgi(requests, concurrency):
+    with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+        return asyncio.run(_run_asgi(requests, concurrency))
+
+
+def compare(scenarios, ctx, requests, concurrency, stdout=None):
+    """
+    Send `requests` requests per read scenario, `concurrency` at a time, over
+    WSGI and then over ASGI. Returns {scenario name: {'wsgi': ..., 'asgi': ...}}.
+    Both runs send the same requests and start with an empty cache.
+    """
+    results = {}
+    for scenario in read_scenarios(scenarios):
+        built = build_requests(scenario, ctx, requests)
+        cache.clear()
+        wsgi = run_wsgi(built, concurrency)
+        cache.clear()
+        results[scenario.name] = {'wsgi': wsgi, 'asgi': run_asgi(built, concurrency)}
+        if stdout is not None:
+            for server, result in results[scenario.name].items():
+                stdout.write(
+                    f"{scenario.name + ' ' + server:<32} p50 {result['p50_ms']:>9.2f}ms  "
+                    f"p95 {result['p95_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+                    f"{result['throughput_rps'] or 0:>8.1f} req/s  {result['statuses']}"
+                )
+    return results
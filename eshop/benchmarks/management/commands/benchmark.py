@@ -0,0 +1,125 @@
+import json
+import platform
+import warnings
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from account import urls as account_urls
+from analytics import urls as analytics_urls
+from order import urls as order_urls
+from product import urls as product_urls
+
+from benchmarks import concurrency, stubs
+from benchmarks.runner import run
+from benchmarks.scenarios import SCENARIOS, Context, uncovered_url_names
+from benchmarks.serialization import compare
+from benchmarks.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database and benchmark every route in product, order, account and analytics urls, '
+        'with Stripe, S3 and SMTP stubbed. Prints p50/p95/p99 latency, throughput and query counts, '
+        'then compares the read endpoints under concurrent load over WSGI and ASGI.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--images', type=int, default=3, help='Images per product')
+        parser.add_argument('--reviews', type=int, default=20, help='Reviews per product')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--items', type=int, default=3, help='Items per order')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per route')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per route')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the cache before every request')
+        parser.add_argument('--only', nargs='*', help='Only run scenarios whose name contains one of these')
+        parser.add_argument('--serializer-rows', type=int, default=100, help='Rows per serializer comparison, 0 to skip')
+        parser.add_argument(
+            '--concurrency', type=int, default=32, help='Requests in flight in the WSGI vs ASGI comparison',
+        )
+        parser.add_argument(
+            '--concurrent-requests', type=int, default=500,
+            help='Requests per read route in the WSGI vs ASGI comparison, 0 to skip',
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database afterwards')
+
+    def handle(self, *args, **options):
+        missing = uncovered_url_names(SCENARIOS, [product_urls, order_urls, account_urls, analytics_urls])
+        if missing:
+            raise CommandError(f'No benchmark scenario for: {", ".join(sorted(missing))}')
+
+        scenarios = SCENARIOS
+        if options['only']:
+            scenarios = [s for s in SCENARIOS if any(name in s.name for name in options['only'])]
+
+        # forgot_password stores a naive expiry time, once per request
+        warnings.filterwarnings('ignore', message='DateTimeField .* received a naive datetime', category=RuntimeWarning)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with override_settings(
+                STORAGES=stubs.STORAGES,
+                EMAIL_BACKEND=stubs.EMAIL_BACKEND,
+                STRIPE_CLIENT='benchmarks.stubs.StubStripeClient',
+            ):
+                self.stdout.write('Seeding...')
+                dataset = seed(
+                    products=options['products'], images=options['images'], reviews=options['reviews'],
+                    users=options['users'], orders=options['orders'], items=options['items'],
+                    random_seed=options['seed'],
+                )
+
+                results = run(
+                    scenarios, Context(dataset), options['iterations'], options['warmup'],
+                    options['cold_cache'], stdout=self.stdout,
+                )
+
+                servers = {}
+                if options['concurrent_requests']:
+                    self.stdout.write(f"WSGI vs ASGI, {options['concurrency']} requests in flight...")
+                    servers = concurrency.compare(
+                        scenarios, Context(dataset), options['concurrent_requests'], options['concurrency'],
+                        stdout=self.stdout,
+                    )
+
+                serialization = {}
+                if options['serializer_rows']:
+                    serialization = compare(options['serializer_rows'])
+                    for name, result in serialization.items():
+                        self.stdout.write(
+                            f"{name + ' per row':<32} serializer {result['serializer_us_per_row']:>9.2f}us  "
+                            f"projection {result['projection_us_per_row']:>9.2f}us"
+                        )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        if options['output']:
+            report = {
+                'environment': {
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'debug': settings.DEBUG,
+                },
+                'options': {
+                    key: options[key] for key in (
+                        'products', 'images', 'reviews', 'users', 'orders', 'items', 'seed',
+                        'iterations', 'warmup', 'cold_cache', 'serializer_rows', 'concurrency', 'concurrent_requests',
+                    )
+                },
+                'results': results,
+                'servers': servers,
+                'serialization': serialization,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f'Wrote {options["output"]}')
@@ -0,0 +1,91 @@
+import math
+import statistics
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def summarize(timings, queries, statuses):
+    timings = sorted(timings)
+    total = sum(timings)
+
+    return {
+        'requests': len(timings),
+        'p50_ms': round(percentile(timings, 50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'throughput_rps': round(len(timings) / total, 1) if total else None,
+        'queries_mean': round(statistics.fmean(queries), 2),
+        'queries_max': max(queries),
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+
+
+def run_scenario(scenario, ctx, iterations, warmup=0, cold_cache=False):
+    """
+    Send `warmup` untimed and `iterations` timed requests for one scenario,
+    one at a time, and return latency, throughput and query statistics.
+    """
+    client = APIClient()
+    timings, queries, statuses = [], [], []
+
+    for i in range(warmup + iterations):
+        n = ctx.next()
+        obj = scenario.prepare(ctx, n)
+
+        user = scenario.user(ctx, n, obj)
+        client.credentials(**({'HTTP_AUTHORIZATION': f'Bearer {ctx.token(user)}'} if user else {}))
+        send = getattr(client, scenario.method.lower())
+        path = scenario.path(ctx, n, obj)
+        data = scenario.data(ctx, n, obj)
+
+        kwargs = dict(scenario.headers)
+        if data is not None:
+            kwargs['data'] = data
+            if scenario.format:
+                kwargs['format'] = scenario.format
+            else:
+                kwargs['content_type'] = 'application/json'
+
+        if cold_cache:
+            cache.clear()
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = send(path, **kwargs)
+            # streamed bodies are produced while they are read
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(len(captured))
+            statuses.append(response.status_code)
+
+    return summarize(timings, queries, statuses)
+
+
+def run(scenarios, ctx, iterations, warmup=0, cold_cache=False, stdout=None):
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(scenario, ctx, iterations, warmup, cold_cache)
+        if stdout is not None:
+            result = results[scenario.name]
+            stdout.write(
+                f"{scenario.name:<32} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                f"p99 {result['p99_ms']:>9.2f}ms  {result['throughput_rps'] or 0:>8.1f} req/s  "
+                f"{result['queries_mean']:>6.1f} queries  {result['statuses']}"
+            )
+    return results
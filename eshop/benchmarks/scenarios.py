@@ -0,0 +1,262 @@
+import itertools
+import json
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from order.models import Order
+from product.models import Product, Review
+
+from .seed import WORDS
+
+
+# A 1x1 transparent GIF for image uploads
+GIF = (
+    b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+SHIPPING = {
+    'street': '1 Bench Street', 'city': 'London', 'state': 'London',
+    'zip_code': 'N1', 'country': 'UK', 'phone_no': '0123',
+}
+
+
+class Context:
+    """The seeded dataset plus a counter, so every iteration can pick different rows."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.counter = itertools.count()
+        self.tokens = {}
+
+    # a real JWT, so authentication costs are part of the measurement
+    def token(self, user):
+        if user.id not in self.tokens:
+            self.tokens[user.id] = str(AccessToken.for_user(user))
+        return self.tokens[user.id]
+
+    def next(self):
+        return next(self.counter)
+
+    def product(self, n):
+        return self.dataset.products[n % len(self.dataset.products)]
+
+    def order(self, n):
+        return self.dataset.orders[n % len(self.dataset.orders)]
+
+    def user(self, n):
+        return self.dataset.users[n % len(self.dataset.users)]
+
+
+class Scenario:
+    """
+    One request against one URL pattern.
+
+    prepare(ctx, n) runs untimed before each request and returns the object the
+    request works on; path(ctx, n, obj) and data(ctx, n, obj) build the request;
+    user(ctx, n, obj) returns the User to log in as, or None.
+    """
+
+    def __init__(self, url_name, method, path, data=None, user=None, prepare=None, format='json', headers=None, label=None):
+        self.url_name = url_name
+        self.label = label
+        self.method = method
+        self.path = path
+        self.data = data or (lambda ctx, n, obj: None)
+        self.user = user or (lambda ctx, n, obj: None)
+        self.prepare = prepare or (lambda ctx, n: None)
+        self.format = format
+        self.headers = headers or {}
+
+    @property
+    def name(self):
+        return f'{self.method} {self.label or self.url_name}'
+
+
+def admin(ctx, n, obj):
+    return ctx.dataset.admin
+
+
+def some_user(ctx, n, obj):
+    return ctx.user(n)
+
+
+def new_product(ctx, n):
+    return Product.objects.create(name=f'Bench delete {n}', category='Home', user=ctx.dataset.admin)
+
+
+def new_review(ctx, n):
+    product = ctx.product(n)
+    user = ctx.user(n)
+    Review.objects.get_or_create(product_id=product, user=user, defaults={'rating': 3, 'comment': 'bench'})
+    return product
+
+
+def new_order(ctx, n):
+    return Order.objects.create(user=ctx.dataset.admin, **SHIPPING)
+
+
+def reset_token(ctx, n):
+    user = ctx.user(n)
+    user.profile.reset_password_token = f'bench-token-{n}'
+    user.profile.reset_password_expire = timezone.now() + timedelta(days=1)
+    user.profile.save()
+    return user.profile.reset_password_token
+
+
+# 100 catalog rows, half of them updates of the previous iteration's
+def catalog_csv(n):
+    lines = ['sku,name,price,description,brand,category,stock']
+    lines += [f'BENCH-{n * 50 + i},Bench item {i},9.99,Imported bench item,Bench,Home,10' for i in range(100)]
+    return '\n'.join(lines).encode()
+
+
+def order_items(ctx, n, obj):
+    return {
+        **SHIPPING,
+        'orderItems': [
+            {'product': ctx.product(n + i), 'quantity': 1, 'price': 10, 'name': 'Bench', 'image': 'bench.jpg'}
+            for i in range(3)
+        ],
+    }
+
+
+def webhook_event(ctx, n, obj):
+    return json.dumps({
+        'id': f'evt_bench_{n}',
+        'type': 'checkout.session.completed',
+        'data': {'object': {
+            'id': f'cs_bench_{n}', 'amount_total': 1000,
+            'metadata': {**SHIPPING, 'user': str(ctx.dataset.admin.id)},
+        }},
+    })
+
+
+SCENARIOS = [
+    # product/urls.py
+    Scenario('products', 'GET', lambda ctx, n, obj: reverse('products')),
+    Scenario(
+        'products', 'GET', lambda ctx, n, obj: reverse('products') + f'?keyword={WORDS[n % len(WORDS)]}',
+        label='products?keyword',
+    ),
+    Scenario(
+        'product_facets', 'GET',
+        lambda ctx, n, obj: reverse('product_facets') + f'?keyword={WORDS[n % len(WORDS)]}',
+    ),
+    Scenario(
+        'new_product', 'POST', lambda ctx, n, obj: reverse('new_product'), user=admin,
+        data=lambda ctx, n, obj: {
+            'name': f'Bench {n}', 'price': 10, 'description': 'Bench product', 'brand': 'Bench',
+            'category': 'Home', 'stock': 10,
+        },
+    ),
+    Scenario(
+        'upload_product_images', 'POST', lambda ctx, n, obj: reverse('upload_product_images'), user=admin,
+        data=lambda ctx, n, obj: {
+            'product': ctx.product(n),
+            'images': [SimpleUploadedFile(f'bench-{n}-{i}.gif', GIF, 'image/gif') for i in range(3)],
+        },
+        format='multipart',
+    ),
+    Scenario(
+        'import_products', 'POST', lambda ctx, n, obj: reverse('import_products'), user=admin,
+        data=lambda ctx, n, obj: {'file': SimpleUploadedFile(f'catalog-{n}.csv', catalog_csv(n), 'text/csv')},
+        format='multipart',
+    ),
+    Scenario('export_products', 'GET', lambda ctx, n, obj: reverse('export_products'), user=admin),
+    Scenario('get_product_details', 'GET', lambda ctx, n, obj: reverse('get_product_details', args=[ctx.product(n)])),
+    Scenario(
+        'update_product', 'PUT', lambda ctx, n, obj: reverse('update_product', args=[ctx.product(n)]), user=admin,
+        data=lambda ctx, n, obj: {
+            'name': f'Updated {n}', 'price': 12, 'description': 'Updated', 'brand': 'Bench',
+            'category': 'Home', 'stock': 1_000_000, 'ratings': 3,
+        },
+    ),
+    Scenario(
+        'update_product', 'PATCH', lambda ctx, n, obj: reverse('update_product', args=[ctx.product(n)]), user=admin,
+        data=lambda ctx, n, obj: {'price': 12, 'stock_delta': 1},
+    ),
+    Scenario(
+        'bulk_update_products', 'POST', lambda ctx, n, obj: reverse('bulk_update_products'), user=admin,
+        data=lambda ctx, n, obj: {
+            'products': [
+                {'id': ctx.product(n + i), 'price': 10 + n % 5, 'stock_delta': 1}
+                for i in range(min(100, len(ctx.dataset.products)))
+            ],
+        },
+    ),
+    Scenario(
+        'delete_product', 'DELETE', lambda ctx, n, obj: reverse('delete_product', args=[obj.id]), user=admin,
+        prepare=new_product,
+    ),
+    Scenario(
+        'create_update_reviews', 'GET', lambda ctx, n, obj: reverse('create_update_reviews', args=[ctx.product(n)]),
+    ),
+    Scenario(
+        'create_update_reviews', 'POST', lambda ctx, n, obj: reverse('create_update_reviews', args=[ctx.product(n)]),
+        user=some_user, data=lambda ctx, n, obj: {'rating': n % 5 + 1, 'comment': 'Bench review'},
+    ),
+    Scenario(
+        'delete_review', 'DELETE', lambda ctx, n, obj: reverse('delete_review', args=[obj]), user=some_user,
+        prepare=new_review,
+    ),
+
+    # account/urls.py
+    Scenario(
+        'register', 'POST', lambda ctx, n, obj: reverse('register'),
+        data=lambda ctx, n, obj: {
+            'first_name': 'Bench', 'last_name': str(n), 'email': f'register{n}@bench.local', 'password': 'bench-password',
+        },
+    ),
+    Scenario('current_user', 'GET', lambda ctx, n, obj: reverse('current_user'), user=some_user),
+    Scenario(
+        'update_user', 'PUT', lambda ctx, n, obj: reverse('update_user'), user=some_user,
+        data=lambda ctx, n, obj: {
+            'first_name': 'Bench', 'last_name': str(n), 'email': ctx.user(n).email, 'password': '',
+        },
+    ),
+    Scenario(
+        'forgot_password', 'POST', lambda ctx, n, obj: reverse('forgot_password'),
+        data=lambda ctx, n, obj: {'email': ctx.user(n).email},
+    ),
+    Scenario(
+        'reset_password', 'POST', lambda ctx, n, obj: reverse('reset_password', args=[obj]), prepare=reset_token,
+        data=lambda ctx, n, obj: {'password': 'bench-password', 'confirm_password': 'bench-password'},
+    ),
+
+    # order/urls.py
+    Scenario('order_new', 'POST', lambda ctx, n, obj: reverse('order_new'), user=some_user, data=order_items),
+    Scenario('get_orders', 'GET', lambda ctx, n, obj: reverse('get_orders') + f'?page={n % 2 + 1}', user=admin),
+    Scenario('get_order', 'GET', lambda ctx, n, obj: reverse('get_order', args=[ctx.order(n)]), user=admin),
+    Scenario(
+        'process_order', 'PUT', lambda ctx, n, obj: reverse('process_order', args=[ctx.order(n)]), user=admin,
+        data=lambda ctx, n, obj: {'status': 'SHIPPED'},
+    ),
+    Scenario(
+        'delete_order', 'DELETE', lambda ctx, n, obj: reverse('delete_order', args=[obj.id]), user=admin,
+        prepare=new_order,
+    ),
+    Scenario('price_cart', 'POST', lambda ctx, n, obj: reverse('price_cart'), user=some_user, data=order_items),
+    Scenario(
+        'create_checkout_session', 'POST', lambda ctx, n, obj: reverse('create_checkout_session'),
+        user=some_user, data=order_items,
+    ),
+    Scenario(
+        'stripe_webhook', 'POST', lambda ctx, n, obj: reverse('stripe_webhook'),
+        data=webhook_event, format=None, headers={'HTTP_STRIPE_SIGNATURE': 'bench'},
+    ),
+
+    # analytics/urls.py
+    Scenario('sales_analytics', 'GET', lambda ctx, n, obj: reverse('sales_analytics'), user=admin),
+]
+
+
+def uncovered_url_names(scenarios, urlconfs):
+    """URL pattern names in the given urlconf modules that no scenario exercises."""
+    names = {pattern.name for urlconf in urlconfs for pattern in urlconf.urlpatterns}
+    return names - {scenario.url_name for scenario in scenarios}
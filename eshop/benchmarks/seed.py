@@ -0,0 +1,94 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from account.models import Profile
+from analytics.rollups import rebuild_rollups
+from order.models import Order, OrderItem
+from product.models import Category, Product, ProductImages, Review, rebuild_review_aggregates
+
+
+BRANDS = ['Apple', 'Samsung', 'Sony', 'Bosch', 'Ikea', 'Lego', 'Canon', 'Dell']
+WORDS = ['wireless', 'compact', 'premium', 'smart', 'classic', 'portable', 'ultra', 'eco', 'pro', 'mini']
+PASSWORD = 'benchmark-password'
+
+
+class Dataset:
+    """Ids of the seeded rows, handed to the scenarios."""
+
+    def __init__(self, admin, users, products, orders):
+        self.admin = admin
+        self.users = users
+        self.products = products
+        self.orders = orders
+
+
+def seed(products=1000, images=3, reviews=20, users=100, orders=500, items=3, random_seed=0):
+    """
+    Insert a benchmark dataset with bulk inserts. Every count is per product
+    (images, reviews) or per order (items), except products, users and orders.
+    """
+    rng = random.Random(random_seed)
+
+    password = make_password(PASSWORD)
+    admin = User.objects.create(
+        username='admin@bench.local', email='admin@bench.local', password=password, is_staff=True, is_superuser=True
+    )
+    user_rows = User.objects.bulk_create([
+        User(username=f'user{i}@bench.local', email=f'user{i}@bench.local', password=password, first_name='Bench', last_name=str(i))
+        for i in range(users)
+    ])
+    # bulk_create skips the post_save signal that creates profiles
+    Profile.objects.bulk_create([Profile(user=user) for user in user_rows])
+
+    product_rows = Product.objects.bulk_create([
+        Product(
+            name=' '.join(rng.sample(WORDS, 2)).title() + f' {i}',
+            price=Decimal(rng.randint(100, 99999)) / 100,
+            description=' '.join(rng.choices(WORDS, k=20)),
+            brand=rng.choice(BRANDS),
+            category=rng.choice(Category.values),
+            stock=1_000_000,
+            user=admin,
+        )
+        for i in range(products)
+    ])
+
+    ProductImages.objects.bulk_create([
+        ProductImages(product=product, image=f'products/bench-{product.id}-{j}.jpg')
+        for product in product_rows
+        for j in range(images)
+    ])
+
+    if user_rows:
+        Review.objects.bulk_create([
+            Review(product=product, user=user, rating=rng.randint(1, 5), comment=' '.join(rng.choices(WORDS, k=12)))
+            for product in product_rows
+            for user in rng.sample(user_rows, min(reviews, len(user_rows)))
+        ])
+    rebuild_review_aggregates(Product.objects.all())
+
+    order_rows = Order.objects.bulk_create([
+        Order(
+            user=rng.choice(user_rows) if user_rows else admin,
+            street='1 Bench Street', city='London', state='London', zip_code='N1', country='UK', phone_no='0123',
+            total_amount=0,
+        )
+        for _ in range(orders)
+    ])
+    if product_rows:
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, name=product.name, quantity=1, price=product.price)
+            for order in order_rows
+            for product in rng.sample(product_rows, min(items, len(product_rows)))
+        ])
+    rebuild_rollups()
+
+    return Dataset(
+        admin=admin,
+        users=user_rows,
+        products=[product.id for product in product_rows],
+        orders=[order.id for order in order_rows],
+    )
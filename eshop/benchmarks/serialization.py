@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from order.models import Order
+from order.serializers import OrderSerializer, order_projection
+from product.models import Product
+from product.serializers import ProductSerializer, product_projection
+
+
+def serializer_products(rows):
+    return ProductSerializer(ProductSerializer.setup_eager_loading(Product.objects.order_by('id')[:rows]), many=True).data
+
+
+def projection_products(rows):
+    return product_projection.serialize(product_projection.values(Product.objects.order_by('id')[:rows]))
+
+
+def serializer_orders(rows):
+    return OrderSerializer(Order.objects.prefetch_related('orderitems').order_by('id')[:rows], many=True).data
+
+
+def projection_orders(rows):
+    return order_projection.serialize(order_projection.values(Order.objects.order_by('id')[:rows]))
+
+
+# (name, current serializer, projection), each building `rows` rows from the database
+PAIRS = [
+    ('products', serializer_products, projection_products),
+    ('orders', serializer_orders, projection_orders),
+]
+
+
+def per_row_us(build, rows, iterations):
+    renderer = JSONRenderer()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        data = build(rows)
+        renderer.render(data)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) / max(len(data), 1) * 1_000_000, 2)
+
+
+def compare(rows=100, iterations=20):
+    """Median cost per row, queries and rendering included, of the serializers and their projections."""
+    results = {}
+    for name, serializer, projection in PAIRS:
+        results[name] = {
+            'rows': rows,
+            'serializer_us_per_row': per_row_us(serializer, rows, iterations),
+            'projection_us_per_row': per_row_us(projection, rows, iterations),
+        }
+    return results
@@ -0,0 +1,33 @@
+import json
+from decimal import Decimal
+
+from product.models import Product
+
+
+# Local stand-ins for outbound services, so benchmarks measure our code and not the network
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.InMemoryStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+class StubStripeClient:
+    """settings.STRIPE_CLIENT replacement that accepts every signature and answers locally."""
+
+    def construct_event(self, payload, sig_header, secret):
+        return json.loads(payload)
+
+    def create_checkout_session(self, **params):
+        return {'id': 'cs_bench', 'url': 'https://checkout.stripe.local/cs_bench', **params}
+
+    # one line item for the first product, the session id carries nothing
+    def list_line_items(self, session_id):
+        product = Product.objects.order_by('id').values('id', 'price').first()
+        return [{'product': product['id'], 'quantity': 1, 'price': Decimal(product['price']), 'image': ''}]
@@ -0,0 +1,66 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from account import urls as account_urls
+from analytics import urls as analytics_urls
+from order import urls as order_urls
+from product import urls as product_urls
+
+from . import concurrency, stubs
+from .runner import percentile, run
+from .scenarios import SCENARIOS, Context, uncovered_url_names
+from .serialization import PAIRS, compare
+from .seed import seed
+
+# Create your tests here.
+
+
+@override_settings(STORAGES=stubs.STORAGES, STRIPE_CLIENT='benchmarks.stubs.StubStripeClient')
+class BenchmarkTest(TestCase):
+
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(uncovered_url_names(SCENARIOS, [product_urls, order_urls, account_urls, analytics_urls]), set())
+
+    def test_every_scenario_succeeds_on_a_small_dataset(self):
+        dataset = seed(products=5, images=1, reviews=2, users=3, orders=3, items=2)
+
+        results = run(SCENARIOS, Context(dataset), iterations=2)
+
+        for name, result in results.items():
+            self.assertEqual(result['requests'], 2)
+            for code in result['statuses']:
+                self.assertLess(int(code), 300, name)
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_serializer_comparison(self):
+        seed(products=3, images=1, reviews=2, users=2, orders=2, items=2)
+
+        for name, serializer, projection in PAIRS:
+            self.assertEqual(projection(3), serializer(3), name)
+
+        results = compare(rows=3, iterations=1)
+        self.assertEqual(set(results), {'products', 'orders'})
+        self.assertGreater(results['products']['projection_us_per_row'], 0)
+
+
+# real threads, so the seeded rows have to be committed
+@override_settings(STORAGES=stubs.STORAGES)
+class ConcurrencyBenchmarkTest(TransactionTestCase):
+
+    def test_wsgi_and_asgi_serve_every_read_route(self):
+        dataset = seed(products=5, images=1, reviews=2, users=3, orders=3, items=2)
+
+        results = concurrency.compare(SCENARIOS, Context(dataset), requests=6, concurrency=3)
+
+        self.assertEqual(
+            {scenario.url_name for scenario in SCENARIOS if scenario.name in results},
+            {'products', 'get_product_details', 'get_orders', 'get_order', 'current_user'},
+        )
+        for name, servers in results.items():
+            for server, result in servers.items():
+                self.assertEqual(result['requests'], 6)
+                self.assertEqual(set(result['statuses']), {'200'}, f'{name} {server}')
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eshop.settings')
+# async versions of the read views where there is one
+os.environ.setdefault('ROOT_URLCONF', 'eshop.asgi_urls')
+# persistent connections aren't closed with the request under ASGI, use DATABASE_POOL there
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
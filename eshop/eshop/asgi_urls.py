@@ -0,0 +1,44 @@
+"""
+URL configuration served over ASGI (eshop/asgi.py).
+
+The same routes as eshop/urls.py, with the read endpoints that have an async
+version routed to it, so they run on the event loop instead of a worker thread.
+"""
+
+from django.urls import URLPattern, URLResolver
+
+from account import async_views as account_views
+from order import async_views as order_views
+from product import async_views as product_views
+
+from .urls import urlpatterns as sync_urlpatterns
+
+
+# url name -> async view
+ASYNC_VIEWS = {
+    'products': product_views.get_products,
+    'get_product_details': product_views.get_product,
+    'get_orders': order_views.get_orders,
+    'get_order': order_views.get_order,
+    'current_user': account_views.current_user,
+}
+
+
+def with_async_views(patterns):
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern) and pattern.name in ASYNC_VIEWS:
+            pattern = URLPattern(pattern.pattern, ASYNC_VIEWS[pattern.name], pattern.default_args, pattern.name)
+        elif isinstance(pattern, URLResolver) and pattern.namespace is None:
+            pattern = URLResolver(
+                pattern.pattern, with_async_views(pattern.url_patterns), pattern.default_kwargs,
+                pattern.app_name, pattern.namespace,
+            )
+        result.append(pattern)
+    return result
+
+
+urlpatterns = with_async_views(sync_urlpatterns)
+
+handler404 = 'utils.error_views.handler404'
+handler500 = 'utils.error_views.handler500'
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
 import dotenv 
 
 dotenv.load_dotenv()
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
     
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'django_filters',
     'storages',
     
@@ -54,9 +57,14 @@ INSTALLED_APPS = [
     'product',
     'account',
     'order',
+    'notifications',
+    'analytics',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'utils.instrumentation.PerformanceMiddleware',
+    'utils.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,6 +74,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation: Server-Timing header and the slowest requests per route
+PERF_INSTRUMENTATION = os.environ.get('PERF_INSTRUMENTATION', 'True') == 'True'
+# fraction of requests measured, lower it to cut the overhead
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 1.0))
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', 'True') == 'True'
+# slow requests kept per route
+PERF_SLOW_REQUESTS = int(os.environ.get('PERF_SLOW_REQUESTS', 20))
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -77,7 +93,22 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = False
 EMAIL_USE_SSL = False
 
-ROOT_URLCONF = 'eshop.urls'
+# Outbound email queue (python manage.py send_queued_emails)
+EMAIL_QUEUE_BATCH_SIZE = int(os.environ.get('EMAIL_QUEUE_BATCH_SIZE', 50))
+EMAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get('EMAIL_QUEUE_MAX_ATTEMPTS', 5))
+# seconds before the first retry, doubled on every further attempt
+EMAIL_QUEUE_RETRY_DELAY = int(os.environ.get('EMAIL_QUEUE_RETRY_DELAY', 30))
+# seconds a worker has to send the emails it claimed before others may take them over
+EMAIL_QUEUE_CLAIM_TIMEOUT = int(os.environ.get('EMAIL_QUEUE_CLAIM_TIMEOUT', 10 * 60))
+
+# Threads streaming uploaded product images to storage, shared by all requests
+IMAGE_UPLOAD_WORKERS = int(os.environ.get('IMAGE_UPLOAD_WORKERS', 8))
+# Bounding boxes of the variants made by the generate_image_variants worker
+IMAGE_THUMBNAIL_SIZE = (200, 200)
+IMAGE_WEB_SIZE = (1200, 1200)
+
+# eshop/asgi.py switches to eshop.asgi_urls, which routes to the async read views
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'eshop.urls')
 
 TEMPLATES = [
     {
@@ -103,7 +134,7 @@ WSGI_APPLICATION = 'eshop.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.environ.get('DATABASE_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.environ.get('DATABASE_NAME'),
         'USER': os.environ.get('DATABASE_USER'),
         'PASSWORD': os.environ.get('DATABASE_PASSWORD'),
@@ -112,24 +143,142 @@ DATABASES = {
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Queue concurrent writers on a file database instead of failing with "database table is locked"
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    DATABASES['default']['TEST'] = {'NAME': os.environ.get('DATABASE_TEST_NAME', BASE_DIR / 'test_db.sqlite3')}
+
+# Connection reuse (utils/db_pool.py). DATABASE_POOL=True checks connections out
+# of a psycopg 3 pool (PostgreSQL only), requests wait DATABASE_POOL_TIMEOUT
+# seconds for a free one and get a 503 after that. Otherwise every worker thread
+# keeps its connection for DATABASE_CONN_MAX_AGE seconds. Either way a
+# connection is checked before it is reused.
+if os.environ.get('DATABASE_POOL', 'False') == 'True':
+    from psycopg_pool import ConnectionPool
+
+    DATABASES['default']['OPTIONS'] = {
+        **DATABASES['default'].get('OPTIONS', {}),
+        'pool': {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 5)),
+            'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', 600)),
+            'check': ConnectionPool.check_connection,
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True') == 'True'
+DATABASE_POOL_RETRY_AFTER = int(os.environ.get('DATABASE_POOL_RETRY_AFTER', 1))
+
+# Read replicas, comma separated: host[:port] on PostgreSQL, database files on SQLite.
+# GET requests to REPLICA_READ_VIEWS read from them (utils/replicas.py). Clients
+# stick to the primary for REPLICA_STICKY_SECONDS after a write.
+DATABASE_READ_REPLICAS = []
+for i, replica in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(','))):
+    alias = f'replica_{i}'
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': replica}
+    else:
+        host, _, port = replica.partition(':')
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    # tests read the primary through the replica connections
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_READ_REPLICAS.append(alias)
+
+# The stock backends, counting and timing connection checkouts for utils/db_pool.py
+TRACKED_ENGINES = {
+    'django.db.backends.postgresql': 'utils.db_backends.postgresql',
+    'django.db.backends.sqlite3': 'utils.db_backends.sqlite3',
+}
+for database in DATABASES.values():
+    database['ENGINE'] = TRACKED_ENGINES.get(database['ENGINE'], database['ENGINE'])
+
+DATABASE_ROUTERS = ['utils.replicas.ReplicaRouter']
+REPLICA_READ_VIEWS = ['products', 'get_product_details', 'get_orders', 'get_order', 'current_user']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+REPLICA_STICKY_COOKIE = 'db_primary'
+
+# Cache shared by all worker processes: redis://host:6379/0 or memcached://host:11211.
+# The product and cart versions, the user cache and replica stickiness are only
+# right when every worker sees the same entries, so without one SHARED_CACHE is
+# False and they are off. A single process (runserver, tests) may set
+# SHARED_CACHE=True on its local memory cache.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }}
+elif CACHE_URL:
+    raise ImproperlyConfigured(f'CACHE_URL must be a redis:// or memcached:// URL, not {CACHE_URL!r}')
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+SHARED_CACHE = os.environ.get('SHARED_CACHE', str(bool(CACHE_URL))) == 'True'
+
 # exception handling
 REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'utils.custom_exception_handler.custom_exception_handler',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
     ),
 }
 
+# pagination
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 2))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+# exact, cached or estimate (planner estimate on PostgreSQL)
+PAGINATION_COUNT_MODE = os.environ.get('PAGINATION_COUNT_MODE', 'exact')
+PAGINATION_COUNT_CACHE_TIMEOUT = int(os.environ.get('PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+
+# seconds a rendered product response stays in the cache
+PRODUCT_CACHE_TIMEOUT = int(os.environ.get('PRODUCT_CACHE_TIMEOUT', 300))
+
+# upper bounds of the price facet buckets, a last bucket takes everything above
+PRODUCT_PRICE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+# class used for Stripe API calls, swap for a stub in tests
+STRIPE_CLIENT = os.environ.get('STRIPE_CLIENT', 'order.stripe_client.StripeClient')
+# Seconds a priced cart is reused by the checkout page, order and Stripe session (order/pricing.py)
+CART_PRICING_TIMEOUT = int(os.environ.get('CART_PRICING_TIMEOUT', 60))
+# Seconds a checkout session holds its stock (order/reservations.py). Its Stripe
+# session expires at the same time, which Stripe rejects unless it is at least 30
+# minutes after it receives the session: keep a couple of minutes over that for
+# the time the request takes and clock skew
+STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 32 * 60))
+# Seconds the stock stays held after that, for webhooks of last-moment payments still on their way
+STOCK_RESERVATION_GRACE = int(os.environ.get('STOCK_RESERVATION_GRACE', 5 * 60))
+
+# users of JWT-authenticated requests: entries kept per process, seconds a process
+# trusts its copy, seconds a user stays in the shared cache
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+USER_CACHE_LOCAL_TTL = int(os.environ.get('USER_CACHE_LOCAL_TTL', 10))
+USER_CACHE_TIMEOUT = int(os.environ.get('USER_CACHE_TIMEOUT', 300))
+
 SIMPLE_JWT = {
     # "SIGNING_KEY": SECRET_KEY,
     'ACCESS_TOKEN_LIFETIME': timedelta(days=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    # /api/token/refresh/ hands out a new refresh token and blacklists the old one
+    'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer', ),
     'AUTH_TOKEN_CLASSES': ("rest_framework_simplejwt.tokens.AccessToken", ), 
 }
 
 
+# Password hashing pool (account/hashing.py): process or thread workers, calls
+# waiting or running before requests get a 503, seconds clients are told to wait
+PASSWORD_HASH_POOL = os.environ.get('PASSWORD_HASH_POOL', 'process')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 1))
+
+# login (/api/token/, admin) checks passwords on the hashing pool
+AUTHENTICATION_BACKENDS = ['account.backends.PooledModelBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -17,7 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from utils.performance_views import slow_request_log
 
 
 urlpatterns = [
@@ -25,7 +27,10 @@ urlpatterns = [
     path('api/', include('product.urls')),
     path('api/', include('account.urls')),
     path('api/', include('order.urls')),
-    path('api/token/', TokenObtainPairView.as_view())
+    path('api/', include('analytics.urls')),
+    path('api/token/', TokenObtainPairView.as_view()),
+    path('api/token/refresh/', TokenRefreshView.as_view()),
+    path('api/performance/', slow_request_log, name='slow_request_log'),
 ]
 
 # Custom error handler for products
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QueuedEmail, EmailStatus
+from utils.instrumentation import timer
+
+
+def enqueue_email(subject, body, from_email, recipients):
+    """Queue an email for the send_queued_emails worker instead of sending it in the request."""
+    return QueuedEmail.objects.create(
+        subject=subject, body=body, from_email=from_email, recipients=list(recipients)
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def record_failure(email, error, now):
+    # the attempt was counted when the email was claimed
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = EmailStatus.FAILED
+    else:
+        email.available_at = now + retry_delay(email.attempts)
+
+
+def claim_emails(batch_size, now):
+    """
+    Take up to `batch_size` due emails for this worker in a short transaction:
+    counts the attempt and moves them EMAIL_QUEUE_CLAIM_TIMEOUT seconds ahead,
+    so other workers skip them while they are sent, and pick them up again
+    should this one die before recording the outcome.
+    """
+    with transaction.atomic():
+        emails = list(
+            QueuedEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailStatus.QUEUED, available_at__lte=now)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if emails:
+            QueuedEmail.objects.filter(id__in=[email.id for email in emails]).update(
+                attempts=F('attempts') + 1,
+                available_at=now + timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT),
+            )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Send one batch of due emails over a single SMTP connection. The emails are
+    claimed first and sent outside any transaction, so a slow SMTP server
+    holds no locks, and several workers can share the queue. Failed emails are
+    retried with exponential backoff until EMAIL_QUEUE_MAX_ATTEMPTS.
+    Returns the number of emails sent.
+    """
+    batch_size = batch_size or settings.EMAIL_QUEUE_BATCH_SIZE
+    now = timezone.now()
+    sent = 0
+
+    emails = claim_emails(batch_size, now)
+    if not emails:
+        return 0
+
+    try:
+        connection = get_connection()
+        with timer('smtp'):
+            connection.open()
+    except Exception as e:
+        for email in emails:
+            record_failure(email, e, now)
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email, email.recipients, connection=connection
+                )
+                try:
+                    with timer('smtp'):
+                        message.send()
+                except Exception as e:
+                    record_failure(email, e, now)
+                else:
+                    email.status = EmailStatus.SENT
+                    email.sent_at = timezone.now()
+                    sent += 1
+        finally:
+            connection.close()
+
+    QueuedEmail.objects.bulk_update(
+        emails, ['status', 'last_error', 'available_at', 'sent_at']
+    )
+    return sent
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails in batches over a reused SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send one batch and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_QUEUE_BATCH_SIZE, help='Emails sent per connection')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_emails(options['batch_size'])
+            if sent:
+                self.stdout.write(f'Sent {sent} emails')
+
+            if options['once']:
+                break
+            if sent < options['batch_size']:
+                time.sleep(options['interval'])
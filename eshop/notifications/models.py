@@ -0,0 +1,30 @@
+from django.db import models
+from django.utils import timezone
+
+# Create your models here.
+class EmailStatus(models.TextChoices):
+    QUEUED = 'QUEUED'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+
+
+# Outbound email queue, drained by the send_queued_emails worker
+class QueuedEmail(models.Model):
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=20, choices=EmailStatus.choices, default=EmailStatus.QUEUED)
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(default='', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at'], condition=models.Q(status='QUEUED'), name='queued_email_available_idx'),
+        ]
+    
+    def __str__(self):
+        return str(self.subject)
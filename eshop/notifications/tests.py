@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .mail import claim_emails, enqueue_email, send_queued_emails
+from .models import QueuedEmail, EmailStatus
+
+# Create your tests here.
+
+
+class CountingBackend(BaseEmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+class TransactionCheckingBackend(BaseEmailBackend):
+    atomic_blocks = None
+
+    def send_messages(self, messages):
+        TransactionCheckingBackend.atomic_blocks = len(connection.atomic_blocks)
+        return len(messages)
+
+
+class FailingBackend(BaseEmailBackend):
+
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP server unavailable')
+
+
+@override_settings(EMAIL_QUEUE_RETRY_DELAY=30, EMAIL_QUEUE_MAX_ATTEMPTS=2)
+class EmailQueueTest(TestCase):
+
+    def enqueue(self, count=1):
+        for i in range(count):
+            enqueue_email(f'Subject {i}', 'Body', 'noreply@eshop.com', [f'user{i}@eshop.com'])
+
+    @override_settings(EMAIL_BACKEND='notifications.tests.CountingBackend')
+    def test_batch_is_sent_over_one_connection(self):
+        CountingBackend.opened = 0
+        self.enqueue(3)
+
+        self.assertEqual(send_queued_emails(), 3)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(QueuedEmail.objects.filter(status=EmailStatus.SENT).count(), 3)
+
+        self.assertEqual(send_queued_emails(), 0)
+
+    @override_settings(EMAIL_BACKEND='notifications.tests.TransactionCheckingBackend')
+    def test_emails_are_sent_outside_a_transaction(self):
+        self.enqueue()
+        # the test case's own
+        outer = len(connection.atomic_blocks)
+
+        self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(TransactionCheckingBackend.atomic_blocks, outer)
+
+    @override_settings(EMAIL_QUEUE_CLAIM_TIMEOUT=60)
+    def test_claimed_emails_are_skipped_until_their_claim_runs_out(self):
+        self.enqueue()
+        now = timezone.now()
+
+        email, = claim_emails(10, now)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(claim_emails(10, now), [])
+
+        email, = claim_emails(10, now + timedelta(seconds=61))
+        self.assertEqual(email.attempts, 2)
+
+    def test_batch_size(self):
+        self.enqueue(3)
+        self.assertEqual(send_queued_emails(batch_size=2), 2)
+        self.assertEqual(send_queued_emails(batch_size=2), 1)
+
+    @override_settings(EMAIL_BACKEND='notifications.tests.FailingBackend')
+    def test_failures_back_off_then_give_up(self):
+        self.enqueue()
+
+        self.assertEqual(send_queued_emails(), 0)
+        email = QueuedEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.QUEUED, 1))
+        self.assertGreater(email.available_at, timezone.now() + timedelta(seconds=25))
+        self.assertIn('SMTP server unavailable', email.last_error)
+
+        # not due yet
+        self.assertEqual(send_queued_emails(), 0)
+        self.assertEqual(QueuedEmail.objects.get().attempts, 1)
+
+        QueuedEmail.objects.update(available_at=timezone.now())
+        send_queued_emails()
+        email = QueuedEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (EmailStatus.FAILED, 2))
@@ -4,3 +4,5 @@ from .models import *
 # Register your models here.
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(StripeEvent)
+admin.site.register(StockReservation)
@@ -0,0 +1,29 @@
+from django.shortcuts import aget_object_or_404
+
+from rest_framework.permissions import IsAuthenticated
+
+from .models import Order
+from .serializers import order_projection
+from .filters import OrderFilter
+from utils.async_views import async_api_view, render
+from utils.pagination import get_paginator
+
+# Async versions of the order read views, served instead of views.py over ASGI (eshop/asgi_urls.py)
+
+
+# Get all orders
+@async_api_view(['GET'], permission_classes=[IsAuthenticated])
+async def get_orders(request):
+    filterset = OrderFilter(request.GET, queryset=Order.objects.all().order_by('id'))
+    paginator = get_paginator(request, ordering=('created_at', 'id'))
+
+    rows = await paginator.apaginate_queryset(order_projection.values(filterset.qs), request)
+
+    return render({**paginator.get_page_info(), 'order': await order_projection.aserialize(rows)})
+
+
+# Get order by pk
+@async_api_view(['GET'], permission_classes=[IsAuthenticated])
+async def get_order(request, pk):
+    order = await aget_object_or_404(order_projection.values(Order.objects.all()), id=pk)
+    return render((await order_projection.aserialize([order]))[0])
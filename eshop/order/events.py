@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StripeEvent, EventStatus, PaymentStatus, PaymentMode
+from .placement import place_order
+from .reservations import claim_reservations
+from .stripe_client import get_stripe_client
+
+
+# Event types the webhook stores for processing, everything else is acknowledged and dropped
+HANDLED_EVENTS = ('checkout.session.completed',)
+
+MAX_ATTEMPTS = 5
+
+
+def record_event(event_id, event_type, payload):
+    """Store a webhook event once. Returns False if it was already stored."""
+    _, created = StripeEvent.objects.get_or_create(
+        event_id=event_id, defaults={'type': event_type, 'payload': payload}
+    )
+    return created
+
+
+def handle_checkout_session_completed(session, client):
+    metadata = session['metadata']
+    # the stock reserved at checkout, if it wasn't released yet (sessions from before reservations have no key)
+    held = claim_reservations(metadata['reservation']) if metadata.get('reservation') else {}
+
+    place_order(
+        User(id=int(metadata['user'])),
+        client.list_line_items(session['id']),
+        check_stock=False,
+        held=held,
+        street=metadata['street'],
+        state=metadata['state'],
+        city=metadata['city'],
+        zip_code=metadata['zip_code'],
+        country=metadata['country'],
+        phone_no=metadata['phone_no'],
+        total_amount=Decimal(session['amount_total']) / 100,
+        payment_status=PaymentStatus.PAID,
+        payment_mode=PaymentMode.CARD,
+    )
+
+
+HANDLERS = {
+    'checkout.session.completed': handle_checkout_session_completed,
+}
+
+
+def process_event(event, client):
+    HANDLERS[event.type](event.payload['data']['object'], client)
+
+
+def process_pending_events(client=None, limit=100):
+    """
+    Process up to `limit` pending events, oldest first. Each event is claimed
+    and handled in its own transaction, so several workers can run at once and
+    a failing event only rolls back itself. Failed events are retried on later
+    runs until MAX_ATTEMPTS. Returns the number of events processed.
+    """
+    client = client or get_stripe_client()
+    processed = 0
+    last_id = 0
+
+    while processed < limit:
+        with transaction.atomic():
+            event = (
+                StripeEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=EventStatus.PENDING, id__gt=last_id)
+                .order_by('id')
+                .first()
+            )
+            if event is None:
+                break
+            last_id = event.id
+
+            try:
+                with transaction.atomic():
+                    process_event(event, client)
+            except Exception as e:
+                event.attempts += 1
+                event.error = str(e)
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = EventStatus.FAILED
+            else:
+                event.status = EventStatus.PROCESSED
+                event.processed_at = timezone.now()
+                processed += 1
+
+            event.save()
+
+    return processed
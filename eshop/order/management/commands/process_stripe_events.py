@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.events import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Process stored Stripe webhook events (turn completed checkouts into orders)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the pending events and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events processed per pass')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_events(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} events')
+
+            if options['once']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
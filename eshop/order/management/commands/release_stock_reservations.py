@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.reservations import release_expired_reservations
+from product.stock import sync_sharded_stock
+
+
+class Command(BaseCommand):
+    help = 'Give the stock of expired checkout reservations back and bring the stock of sharded products up to date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Release the expired reservations and exit')
+        parser.add_argument('--interval', type=float, default=30.0, help='Seconds to sleep between passes')
+        parser.add_argument('--batch-size', type=int, default=500, help='Reservations released per transaction')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_reservations(batch_size=options['batch_size'])
+            if released:
+                self.stdout.write(f'Released {released} reservations')
+            synced = sync_sharded_stock()
+            if synced:
+                self.stdout.write(f'Updated the stock of {synced} sharded products')
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -26,12 +26,29 @@ class Order(models.Model):
     zip_code = models.CharField(max_length=100, default='', blank=False)
     country = models.CharField(max_length=100, default='', blank=False)
     phone_no = models.CharField(max_length=100, default='', blank=False)
-    total_amount = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     payment_status = models.CharField(max_length=20, choices=PaymentStatus.choices, default=PaymentStatus.UNPAID)
     status = models.CharField(max_length=50, choices=OrderStatus.choices, default=OrderStatus.PROCESSING)
     payment_mode = models.CharField(max_length=20, choices=PaymentMode.choices, default=PaymentMode.COD)
     created_at = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    # indexed by order_user_created_idx
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, db_index=False)
+    
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            # a user's orders, newest first
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+            # OrderFilter: status[, payment_status][, payment_mode], payment_status[, payment_mode], payment_mode
+            models.Index(fields=['status', 'payment_status', 'payment_mode'], name='order_status_idx'),
+            models.Index(fields=['payment_status', 'payment_mode'], name='order_payment_status_idx'),
+            models.Index(fields=['payment_mode'], name='order_payment_mode_idx'),
+            # the orders still to ship, a small slice of the table
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(status='PROCESSING'), name='order_processing_idx',
+            ),
+        ]
     
     def __str__(self):
         return str(self.id)
@@ -48,3 +65,49 @@ class OrderItem(models.Model):
     def __str__(self):
         return str(self.name)
     
+
+
+# Stock taken off for a checkout session until it is paid for or expires, see order/reservations.py
+class StockReservation(models.Model):
+    # shared by the reservations of one checkout session, sent to Stripe in its metadata
+    key = models.CharField(max_length=32, db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            # the sweeper, oldest first
+            models.Index(fields=['expires_at', 'id'], name='reservation_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return str(self.key)
+
+
+class EventStatus(models.TextChoices):
+    PENDING = 'PENDING'
+    PROCESSED = 'PROCESSED'
+    FAILED = 'FAILED'
+
+
+# Stripe webhook events, stored once per event id and processed by a worker
+class StripeEvent(models.Model):
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=EventStatus.choices, default=EventStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(default='', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(status='PENDING'), name='stripe_event_pending_idx'),
+        ]
+    
+    def __str__(self):
+        return str(self.event_id)
@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Order, OrderItem
+from product.stock import lock_products, return_stock, take_stock
+from product import cache as product_cache
+from analytics.rollups import record_order
+
+
+class OrderPlacementError(Exception):
+    pass
+
+
+class ProductNotFound(OrderPlacementError):
+
+    def __init__(self, ids):
+        super().__init__('Products not found: {ids}'.format(ids=', '.join(map(str, sorted(ids)))))
+        self.ids = ids
+
+
+class OutOfStock(OrderPlacementError):
+
+    def __init__(self, ids):
+        super().__init__('Not enough stock for products: {ids}'.format(ids=', '.join(map(str, sorted(ids)))))
+        self.ids = ids
+
+
+def get_quantities(items):
+    quantities = defaultdict(int)
+    for item in items:
+        quantity = int(item['quantity'])
+        if quantity <= 0:
+            raise OrderPlacementError('Quantity must be at least 1')
+        quantities[int(item['product'])] += quantity
+    return quantities
+
+
+def place_order(user, items, check_stock=True, held=None, **fields):
+    """
+    Create an order and its items, take them off stock and add them to the
+    sales rollups, all or nothing.
+
+    items are dicts with `product` (id), `quantity`, `price` and optionally
+    `image`; fields are passed on to the Order. Orders that are already paid
+    for pass check_stock=False to be recorded even if stock runs short. held
+    is {product id: quantity} already taken off stock for this order by a
+    checkout reservation; whatever of it the order doesn't use goes back.
+    """
+    quantities = get_quantities(items)
+    if not quantities:
+        raise OrderPlacementError('No Order Items. Please add atleast one product')
+    held = held or {}
+
+    with transaction.atomic():
+        products = lock_products(quantities)
+
+        missing = set(quantities) - set(products)
+        if missing:
+            raise ProductNotFound(missing)
+
+        to_take = {
+            product_id: quantity - held.get(product_id, 0)
+            for product_id, quantity in quantities.items() if quantity > held.get(product_id, 0)
+        }
+        short = take_stock(products, to_take, check_stock)
+        if short:
+            raise OutOfStock(short)
+
+        unused = {
+            product_id: quantity - quantities.get(product_id, 0)
+            for product_id, quantity in held.items() if quantity > quantities.get(product_id, 0)
+        }
+        if unused:
+            return_stock(unused)
+
+        order = Order.objects.create(user=user, **fields)
+        order_items = OrderItem.objects.bulk_create([
+            OrderItem(
+                product=products[int(item['product'])],
+                order=order,
+                name=products[int(item['product'])].name,
+                quantity=item['quantity'],
+                price=item['price'],
+                image=item.get('image', ''),
+            )
+            for item in items
+        ])
+
+        record_order(order, order_items)
+
+        product_cache.bump_products(*quantities, *held)
+
+    return order
@@ -0,0 +1,89 @@
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .placement import ProductNotFound, get_quantities
+from product.models import Product, ProductImages
+from product import cache as product_cache
+
+
+# Server-side cart pricing.
+#
+# Carts are priced from the products table, never from the prices, names and
+# images the client sends: one query reads the price, stock, name and first
+# image of every product in the cart, and the totals are exact Decimals. A
+# priced cart is cached for CART_PRICING_TIMEOUT seconds under the versions of
+# its products, so the checkout page, the order or Stripe session that follows
+# reuse it, and any write to one of the products prices it afresh. Without
+# SHARED_CACHE, where a write only bumps the versions of one worker, every cart
+# is priced afresh.
+
+CENT = Decimal('0.01')
+
+
+def cart_cache_key(quantities):
+    versions = product_cache.product_versions(quantities)
+    cart = ','.join(f'{pk}:{quantity}:{versions[pk]}' for pk, quantity in sorted(quantities.items()))
+    return 'order:cart:' + hashlib.md5(cart.encode()).hexdigest()
+
+
+def image_url(name):
+    return ProductImages._meta.get_field('image').storage.url(name) if name else ''
+
+
+def _price(quantities):
+    first_image = ProductImages.objects.filter(product=OuterRef('pk')).order_by('id').values('image')[:1]
+    products = {
+        row['id']: row
+        for row in Product.objects.filter(id__in=quantities).values(
+            'id', 'name', 'price', 'stock', image=Subquery(first_image)
+        )
+    }
+
+    missing = set(quantities) - set(products)
+    if missing:
+        raise ProductNotFound(missing)
+
+    items = []
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        items.append({
+            'product': product_id,
+            'name': product['name'],
+            'image': image_url(product['image']),
+            'price': product['price'],
+            'quantity': quantity,
+            'total': (product['price'] * quantity).quantize(CENT),
+            # as far as the stock column knows, the order or reservation checks again
+            'available': product['stock'] >= quantity,
+        })
+
+    return {
+        'items': items,
+        'total': sum((item['total'] for item in items), Decimal(0)).quantize(CENT),
+        'available': all(item['available'] for item in items),
+    }
+
+
+def price_cart(items):
+    """
+    Price a cart of {product, quantity} dicts, repeated products added up.
+    Returns {'items': [{product, name, image, price, quantity, total,
+    available}], 'total', 'available'}, cached while its products don't
+    change. Raises OrderPlacementError for bad quantities, ProductNotFound.
+    """
+    quantities = get_quantities(items)
+    if not quantities:
+        return {'items': [], 'total': Decimal('0.00'), 'available': False}
+    if not settings.SHARED_CACHE:
+        return _price(quantities)
+
+    key = cart_cache_key(quantities)
+    cart = cache.get(key)
+    if cart is None:
+        cart = _price(quantities)
+        cache.set(key, cart, settings.CART_PRICING_TIMEOUT)
+    return cart
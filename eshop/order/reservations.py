@@ -0,0 +1,121 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import StockReservation
+from .placement import OrderPlacementError, OutOfStock, ProductNotFound, get_quantities
+from product.stock import lock_products, return_stock, take_stock
+from product import cache as product_cache
+
+
+# Stock held for checkout sessions.
+#
+# create_checkout_session takes the cart off stock straight away and records it
+# as StockReservations under one key, which goes to Stripe in the session
+# metadata, so a flash sale can't sell the same units to more buyers than there
+# are. When the payment completes the webhook worker claims the reservations
+# for the order. Sessions nobody pays for expire, and the
+# release_stock_reservations worker gives the stock of their reservations back.
+
+
+def reserve_stock(user, items):
+    """
+    Take the items off stock and reserve them for STOCK_RESERVATION_TTL
+    seconds, all or nothing. Returns the reservation key and when the checkout
+    session should expire. Raises ProductNotFound or OutOfStock.
+    """
+    quantities = get_quantities(items)
+    if not quantities:
+        raise OrderPlacementError('No Order Items. Please add atleast one product')
+    now = timezone.now()
+    session_expires_at = now + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    key = uuid.uuid4().hex
+
+    with transaction.atomic():
+        products = lock_products(quantities)
+
+        missing = set(quantities) - set(products)
+        if missing:
+            raise ProductNotFound(missing)
+
+        short = take_stock(products, quantities)
+        if short:
+            raise OutOfStock(short)
+
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                key=key, product_id=product_id, quantity=quantity, user=user,
+                # a payment made at the last moment still finds its stock when the webhook comes in
+                expires_at=session_expires_at + timedelta(seconds=settings.STOCK_RESERVATION_GRACE),
+            )
+            for product_id, quantity in quantities.items()
+        ])
+
+        product_cache.bump_products(*quantities)
+
+    return key, session_expires_at
+
+
+def claim_reservations(key):
+    """
+    Delete the reservations made under `key` and return what they held, as
+    {product id: quantity}. Reservations released already aren't there any
+    more. Call in the transaction that uses the stock.
+    """
+    held = defaultdict(int)
+    reservations = StockReservation.objects.select_for_update().filter(key=key).order_by('id')
+    for product_id, quantity in reservations.values_list('product_id', 'quantity'):
+        held[product_id] += quantity
+
+    if held:
+        StockReservation.objects.filter(key=key).delete()
+    return dict(held)
+
+
+def release_reservations(key):
+    """Give the stock reserved under `key` back now, e.g. when no checkout session could be made."""
+    with transaction.atomic():
+        held = claim_reservations(key)
+        if held:
+            return_stock(held)
+            product_cache.bump_products(*held)
+
+
+def release_expired_reservations(batch_size=500, now=None):
+    """
+    Give the stock of expired reservations back, oldest first, `batch_size`
+    at a time. Each batch is its own transaction and skips reservations
+    locked by a webhook claiming them, so several sweepers can run at once.
+    Returns the number of reservations released.
+    """
+    now = now or timezone.now()
+    released = 0
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at', 'id')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                break
+
+            quantities = defaultdict(int)
+            for _, product_id, quantity in batch:
+                quantities[product_id] += quantity
+
+            return_stock(quantities)
+            StockReservation.objects.filter(id__in=[reservation_id for reservation_id, _, _ in batch]).delete()
+            product_cache.bump_products(*quantities)
+
+        released += len(batch)
+        if len(batch) < batch_size:
+            break
+
+    return released
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Order, OrderItem
+from utils.projection import Projection, Children
 
 class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,4 +20,27 @@ class OrderSerializer(serializers.ModelSerializer):
     def get_order_items(self, obj):
         order_items = obj.orderitems.all()
         serializers = OrderItemSerializer(order_items, many=True)
-        return serializers.data 
\ No newline at end of file
+        return serializers.data
+
+
+# Read-only projection for order reads, same output as OrderSerializer
+order_projection = Projection(OrderSerializer, related={
+    'orderItems': Children(Projection(OrderItemSerializer), OrderItem.objects.order_by('id'), 'order'),
+})
+
+
+class PricedCartItemSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    name = serializers.CharField()
+    image = serializers.CharField()
+    price = serializers.DecimalField(max_digits=7, decimal_places=2)
+    quantity = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=10, decimal_places=2)
+    available = serializers.BooleanField()
+
+
+# Output of pricing.price_cart
+class PricedCartSerializer(serializers.Serializer):
+    items = PricedCartItemSerializer(many=True)
+    total = serializers.DecimalField(max_digits=10, decimal_places=2)
+    available = serializers.BooleanField()
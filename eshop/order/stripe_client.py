@@ -0,0 +1,50 @@
+import os
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from utils.instrumentation import timer
+
+import stripe
+
+
+stripe.api_key = os.environ.get('STRIPE_PRIVATE_KEY')
+
+
+class StripeClient:
+    """
+    The Stripe calls the order app makes. Point settings.STRIPE_CLIENT at
+    another class with the same methods to swap it out, e.g. in tests.
+    """
+
+    # Raises ValueError for an invalid payload, stripe.error.SignatureVerificationError for a bad signature
+    def construct_event(self, payload, sig_header, secret):
+        return stripe.Webhook.construct_event(payload, sig_header, secret)
+
+    def create_checkout_session(self, **params):
+        with timer('stripe'):
+            return stripe.checkout.Session.create(**params)
+
+    def list_line_items(self, session_id):
+        """
+        Line items of a checkout session with their products expanded, in one
+        call per 100 items, as dicts with product (id), quantity, price and image.
+        """
+        with timer('stripe'):
+            line_items = stripe.checkout.Session.list_line_items(
+                session_id, limit=100, expand=['data.price.product']
+            )
+            return [
+                {
+                    'product': int(item.price.product.metadata.product_id),
+                    'quantity': item.quantity,
+                    'price': Decimal(item.price.unit_amount) / 100,
+                    'image': item.price.product.images[0] if item.price.product.images else '',
+                }
+                for item in line_items.auto_paging_iter()
+            ]
+
+
+def get_stripe_client():
+    return import_string(settings.STRIPE_CLIENT)()
@@ -1,3 +1,556 @@
-from django.test import TestCase
+import itertools
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+import stripe
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from .models import Order, OrderItem, StripeEvent, EventStatus, StockReservation
+from .serializers import OrderSerializer
+from .filters import OrderFilter
+from benchmarks.seed import seed
+from utils.query_plan import PLAN_VENDORS, sequential_scans
+from .events import process_pending_events
+from .reservations import release_expired_reservations
+from .pricing import price_cart
+from . import async_views
+from product.models import Product, ProductImages
+from product.stock import shard_stock
+from product.tests import TEST_STORAGES
 
 # Create your tests here.
+
+
+class OrderPaginationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        cls.orders = [Order.objects.create(user=cls.user, total_amount=i) for i in range(5)]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_page_numbers(self):
+        res = self.client.get('/api/orders/', {'page': 3})
+
+        self.assertEqual(res.json()['count'], 5)
+        self.assertEqual([o['id'] for o in res.json()['order']], [self.orders[4].id])
+
+    def test_cursor_pagination(self):
+        res = self.client.get('/api/orders/', {'pagination': 'cursor', 'resPerPage': 4})
+        self.assertEqual(len(res.json()['order']), 4)
+
+        res = self.client.get('/api/orders/', {'cursor': res.json()['next'], 'resPerPage': 4})
+        self.assertEqual([o['id'] for o in res.json()['order']], [self.orders[4].id])
+        self.assertIsNone(res.json()['next'])
+
+
+class OrderProjectionTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        product = Product.objects.create(name='Lamp', category='Home', price='12.50')
+        cls.orders = [Order.objects.create(user=cls.user if i else None, total_amount=i * 10) for i in range(3)]
+        for i, order in enumerate(cls.orders):
+            for j in range(i):
+                OrderItem.objects.create(
+                    order=order, product=product if j else None, name='Lamp \u00e9', quantity=j + 1, price='12.5',
+                )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_orders_are_byte_compatible_with_serializer(self):
+        res = self.client.get('/api/orders/', {'resPerPage': 3})
+
+        expected = OrderSerializer(Order.objects.order_by('id'), many=True).data
+        self.assertEqual(res.content, JSONRenderer().render({'count': 3, 'resPerPage': 3, 'order': expected}))
+
+    def test_order_is_byte_compatible_with_serializer(self):
+        order = self.orders[2]
+        res = self.client.get(f'/api/orders/{order.id}/')
+
+        self.assertEqual(res.content, JSONRenderer().render(OrderSerializer(order).data))
+        self.assertEqual(self.client.get('/api/orders/0/').status_code, 404)
+
+
+class AsyncOrderViewTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        product = Product.objects.create(name='Lamp', category='Home', price='12.50')
+        cls.orders = [Order.objects.create(user=cls.user, total_amount=i * 10) for i in range(3)]
+        for i, order in enumerate(cls.orders):
+            for j in range(i):
+                OrderItem.objects.create(order=order, product=product, name='Lamp \u00e9', quantity=j + 1, price='12.5')
+
+    def setUp(self):
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def get(self, path, data=None, headers=None):
+        """The response of the sync view and the one of its async version, as served over ASGI."""
+        sync = self.client.get(path, data, headers=headers)
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            self.assertEqual(resolve(path).func.__module__, async_views.__name__)
+            asynchronous = async_to_sync(self.async_client.get)(path, data, headers=headers)
+        return sync, asynchronous
+
+    def assertSameResponse(self, path, data=None, headers=None):
+        sync, asynchronous = self.get(path, data, headers or self.headers)
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(asynchronous['Content-Type'], sync['Content-Type'])
+        self.assertEqual(asynchronous.content, sync.content)
+        return asynchronous
+
+    def test_orders(self):
+        self.assertSameResponse('/api/orders/', {'resPerPage': 2, 'page': 2})
+        self.assertSameResponse('/api/orders/', {'pagination': 'cursor', 'status': 'Processing'})
+        self.assertSameResponse('/api/orders/', {'page': 9})
+
+    def test_order(self):
+        self.assertSameResponse(f'/api/orders/{self.orders[2].id}/')
+        self.assertSameResponse('/api/orders/0/')
+
+    def test_authentication_errors(self):
+        res = self.assertSameResponse('/api/orders/', headers={'Accept': 'application/json'})
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res['WWW-Authenticate'], 'Bearer realm="api"')
+
+        res = self.assertSameResponse('/api/orders/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(res.status_code, 401)
+
+
+@skipUnless(connection.vendor in PLAN_VENDORS, 'No query plan check for this database')
+class OrderQueryPlanTest(APITestCase):
+    FILTERS = {'status': 'SHIPPED', 'id': 7, 'payment_status': 'PAID', 'payment_mode': 'CARD'}
+    TABLES = (Order._meta.db_table, OrderItem._meta.db_table)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(products=20, images=0, reviews=0, users=5, orders=500)
+
+    def test_every_filter_combination_uses_indexes(self):
+        for size in range(1, len(self.FILTERS) + 1):
+            for names in itertools.combinations(self.FILTERS, size):
+                params = {name: self.FILTERS[name] for name in names}
+                queryset = OrderFilter(params, queryset=Order.objects.all().order_by('id')).qs
+
+                # count, page and keyset page
+                for query in (queryset.order_by(), queryset[:20], queryset.order_by('created_at', 'id')[:20]):
+                    with self.subTest(params=params, sql=str(query.query)):
+                        self.assertEqual(sequential_scans(query, self.TABLES), [])
+
+    def test_user_orders_and_items_use_indexes(self):
+        self.assertEqual(sequential_scans(Order.objects.filter(user_id=1).order_by('-created_at')[:20], self.TABLES), [])
+        self.assertEqual(sequential_scans(OrderItem.objects.filter(order__in=[1, 2, 3]), self.TABLES), [])
+
+
+SHIPPING = {
+    'street': '1 Main St', 'city': 'London', 'state': 'London',
+    'zip_code': 'N1', 'country': 'UK', 'phone_no': '0123',
+}
+
+
+class NewOrderTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        cls.products = [Product.objects.create(name=f'Product {i}', price=5, stock=10) for i in range(5)]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def order(self, items):
+        return self.client.post('/api/orders/new/', {**SHIPPING, 'orderItems': items}, format='json')
+
+    def test_places_order_and_updates_stock(self):
+        res = self.order([{'product': p.id, 'quantity': 2, 'price': 5} for p in self.products])
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['total_amount'], '50.00')
+        self.assertEqual(len(res.json()['orderItems']), 5)
+        self.assertEqual(sorted(Product.objects.values_list('stock', flat=True)), [8] * 5)
+
+    def test_query_count_does_not_grow_with_items(self):
+        # pricing + ... + sales rollup insert and update
+        with self.assertNumQueries(10):
+            self.order([{'product': self.products[0].id, 'quantity': 1, 'price': 5}])
+        with self.assertNumQueries(10):
+            self.order([{'product': p.id, 'quantity': 1, 'price': 5} for p in self.products])
+
+    def test_oversell_rolls_back_everything(self):
+        res = self.order([
+            {'product': self.products[0].id, 'quantity': 1, 'price': 5},
+            {'product': self.products[1].id, 'quantity': 11, 'price': 5},
+        ])
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 10)
+
+    def test_unknown_product(self):
+        res = self.order([{'product': 0, 'quantity': 1, 'price': 5}])
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class ConcurrentOrderTest(APITransactionTestCase):
+
+    def test_concurrent_orders_never_oversell(self):
+        product = Product.objects.create(name='Flash sale', price=5, stock=5)
+        users = [User.objects.create(username=f'buyer{i}@eshop.com') for i in range(10)]
+        barrier = threading.Barrier(len(users))
+        statuses = []
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                res = client.post(
+                    '/api/orders/new/',
+                    {**SHIPPING, 'orderItems': [{'product': product.id, 'quantity': 1, 'price': 5}]},
+                    format='json',
+                )
+                statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(statuses.count(200), 5)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.count(), 5)
+
+    def test_concurrent_orders_of_a_sharded_product_never_oversell(self):
+        product = Product.objects.create(name='Flash sale', price=5, stock=5)
+        shard_stock(product.id, 3)
+        users = [User.objects.create(username=f'buyer{i}@eshop.com') for i in range(10)]
+        barrier = threading.Barrier(len(users))
+        statuses = []
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                res = client.post(
+                    '/api/orders/new/',
+                    {**SHIPPING, 'orderItems': [{'product': product.id, 'quantity': 1, 'price': 5}]},
+                    format='json',
+                )
+                statuses.append(res.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(200), 5)
+        self.assertEqual(sum(product.shards.values_list('stock', flat=True)), 0)
+
+
+class StubStripeClient:
+    line_items = {}
+    sessions = []
+    fail = False
+
+    def construct_event(self, payload, sig_header, secret):
+        if sig_header != 'valid':
+            raise stripe.error.SignatureVerificationError('Bad signature', sig_header)
+        return json.loads(payload)
+
+    def list_line_items(self, session_id):
+        return self.line_items[session_id]
+
+    def create_checkout_session(self, **params):
+        if self.fail:
+            raise stripe.error.APIConnectionError('Stripe is down')
+        self.sessions.append(params)
+        return {'id': f'cs_{len(self.sessions)}'}
+
+
+@override_settings(STRIPE_CLIENT='order.tests.StubStripeClient')
+class StripeWebhookTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com')
+        cls.product = Product.objects.create(name='Lamp', price=12, stock=4)
+
+    def setUp(self):
+        StubStripeClient.line_items = {
+            'cs_1': [{'product': self.product.id, 'quantity': 3, 'price': 12, 'image': 'lamp.jpg'}],
+        }
+
+    def send(self, event_id='evt_1', signature='valid'):
+        event = {
+            'id': event_id,
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': 'cs_1',
+                'amount_total': 3600,
+                'metadata': {**SHIPPING, 'user': str(self.user.id)},
+            }},
+        }
+        return self.client.post(
+            '/api/order/webhook/', json.dumps(event), content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def test_webhook_only_stores_event(self):
+        res = self.send()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(StripeEvent.objects.get().status, EventStatus.PENDING)
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_signature(self):
+        self.assertEqual(self.send(signature='forged').status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_replayed_event_creates_one_order(self):
+        self.send()
+        self.send()
+        process_pending_events()
+        self.send()
+        process_pending_events()
+
+        order = Order.objects.get()
+        self.assertEqual(order.payment_status, 'PAID')
+        self.assertEqual(order.total_amount, 36)
+        self.assertEqual(order.orderitems.get().image, 'lamp.jpg')
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 1)
+        self.assertEqual(StripeEvent.objects.get().status, EventStatus.PROCESSED)
+
+    def test_failed_event_is_retried(self):
+        StubStripeClient.line_items = {}
+        self.send()
+
+        self.assertEqual(process_pending_events(), 0)
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (EventStatus.PENDING, 1))
+
+        StubStripeClient.line_items = {
+            'cs_1': [{'product': self.product.id, 'quantity': 1, 'price': 12}],
+        }
+        self.assertEqual(process_pending_events(), 1)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@override_settings(STRIPE_CLIENT='order.tests.StubStripeClient')
+class StockReservationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com', email='buyer@eshop.com')
+        cls.lamp = Product.objects.create(name='Lamp', price=12, stock=4)
+        cls.rug = Product.objects.create(name='Rug', price=30, stock=2)
+
+    def setUp(self):
+        StubStripeClient.sessions = []
+        StubStripeClient.fail = False
+        self.client.force_authenticate(self.user)
+
+    def checkout(self, *items):
+        order_items = [
+            {'product': product.id, 'name': product.name, 'image': '', 'quantity': quantity, 'price': 12}
+            for product, quantity in items
+        ]
+        return self.client.post('/api/create_checkout_session/', {**SHIPPING, 'orderItems': order_items}, format='json')
+
+    def stock(self):
+        return list(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def complete(self, session):
+        StubStripeClient.line_items = {'cs_1': [
+            {'product': item['price_data']['product_data']['metadata']['product_id'], 'quantity': item['quantity'],
+             'price': 12}
+            for item in session['line_items']
+        ]}
+        event = {
+            'id': 'evt_1',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_1', 'amount_total': 3600, 'metadata': session['metadata']}},
+        }
+        self.client.post(
+            '/api/order/webhook/', json.dumps(event), content_type='application/json', HTTP_STRIPE_SIGNATURE='valid',
+        )
+        return process_pending_events()
+
+    def test_checkout_holds_stock_until_the_session_expires(self):
+        res = self.checkout((self.lamp, 3), (self.rug, 1))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.stock(), [1, 1])
+        session, = StubStripeClient.sessions
+        reservation = StockReservation.objects.filter(key=session['metadata']['reservation']).first()
+        expires_at = (reservation.created_at + timedelta(seconds=settings.STOCK_RESERVATION_TTL)).timestamp()
+        self.assertAlmostEqual(session['expires_at'], expires_at, delta=1)
+        # what Stripe accepts, with time to spare
+        self.assertGreater(session['expires_at'], (timezone.now() + timedelta(minutes=31)).timestamp())
+
+        # a second buyer can't have the same lamps
+        self.assertEqual(self.checkout((self.lamp, 2)).status_code, 400)
+        self.assertEqual(len(StubStripeClient.sessions), 1)
+
+    def test_paid_session_turns_its_reservations_into_the_sale(self):
+        self.checkout((self.lamp, 3), (self.rug, 1))
+        self.assertEqual(self.complete(StubStripeClient.sessions[0]), 1)
+
+        self.assertEqual(self.stock(), [1, 1])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Order.objects.get().orderitems.count(), 2)
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.stock(), [1, 1])
+
+    def test_sweeper_releases_expired_holds_in_batches(self):
+        for _ in range(3):
+            self.checkout((self.lamp, 1))
+        self.checkout((self.rug, 2))
+        self.assertEqual(self.stock(), [1, 0])
+
+        self.assertEqual(release_expired_reservations(), 0)
+        self.assertEqual(release_expired_reservations(batch_size=3, now=timezone.now() + timedelta(hours=1)), 4)
+        self.assertEqual(self.stock(), [4, 2])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_session_paid_after_its_hold_was_released_is_still_recorded(self):
+        self.checkout((self.lamp, 3))
+        release_expired_reservations(now=timezone.now() + timedelta(hours=1))
+        self.checkout((self.lamp, 4))
+
+        self.assertEqual(self.complete(StubStripeClient.sessions[0]), 1)
+        self.assertEqual(self.stock(), [-3, 2])
+
+    def test_hold_is_released_when_stripe_fails(self):
+        StubStripeClient.fail = True
+        self.client.raise_request_exception = False
+
+        self.assertEqual(self.checkout((self.lamp, 3)).status_code, 500)
+        self.assertEqual(self.stock(), [4, 2])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_incomplete_checkout_holds_nothing(self):
+        data = {'street': '1 High St', 'orderItems': [{'product': self.lamp.id, 'quantity': 4}]}
+        res = self.client.post('/api/create_checkout_session/', data, format='json')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['error'], 'Missing state, city, zip_code, country, phone_no')
+        self.assertEqual(self.stock(), [4, 2])
+        self.assertFalse(StockReservation.objects.exists())
+
+
+@override_settings(STRIPE_CLIENT='order.tests.StubStripeClient', STORAGES=TEST_STORAGES)
+class CartPricingTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='buyer@eshop.com', email='buyer@eshop.com')
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.pen = Product.objects.create(name='Pen', price='1.99', stock=10, user=cls.admin)
+        cls.pad = Product.objects.create(name='Pad', price='3.35', stock=1, user=cls.admin)
+        ProductImages.objects.create(product=cls.pad, image='products/pad.jpg')
+        ProductImages.objects.create(product=cls.pad, image='products/pad_back.jpg')
+
+    def setUp(self):
+        cache.clear()
+        StubStripeClient.sessions = []
+        StubStripeClient.fail = False
+        self.client.force_authenticate(self.user)
+
+    # the client's prices, names and images are ignored
+    def cart(self, pens=3, pads=1):
+        return {**SHIPPING, 'orderItems': [
+            {'product': self.pen.id, 'quantity': pens, 'price': 0.01, 'name': 'Free pen', 'image': 'x.jpg'},
+            {'product': self.pad.id, 'quantity': pads, 'price': 0.01, 'name': 'Free pad', 'image': 'x.jpg'},
+        ]}
+
+    def test_prices_the_cart_from_the_products(self):
+        res = self.client.post('/api/cart/price/', self.cart(pads=2), format='json')
+
+        self.assertEqual(res.json(), {
+            'items': [
+                {'product': self.pen.id, 'name': 'Pen', 'image': '', 'price': '1.99', 'quantity': 3,
+                 'total': '5.97', 'available': True},
+                {'product': self.pad.id, 'name': 'Pad', 'image': '/products/pad.jpg', 'price': '3.35', 'quantity': 2,
+                 'total': '6.70', 'available': False},
+            ],
+            'total': '12.67',
+            'available': False,
+        })
+
+    @override_settings(SHARED_CACHE=True)
+    def test_one_query_then_cached_until_a_product_changes(self):
+        with self.assertNumQueries(1):
+            price_cart(self.cart()['orderItems'])
+        with self.assertNumQueries(0):
+            cart = price_cart(self.cart()['orderItems'])
+        self.assertEqual(cart['total'], Decimal('9.32'))
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{self.pen.id}/update/', {'price': '2.49'}, format='json')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(price_cart(self.cart()['orderItems'])['total'], Decimal('10.82'))
+
+    def test_priced_afresh_without_a_shared_cache(self):
+        price_cart(self.cart()['orderItems'])
+        with self.assertNumQueries(1):
+            price_cart(self.cart()['orderItems'])
+
+    def test_order_is_placed_at_current_prices_to_the_penny(self):
+        res = self.client.post('/api/orders/new/', self.cart(), format='json')
+
+        self.assertEqual(res.json()['total_amount'], '9.32')
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('9.32'))
+        self.assertEqual(
+            list(order.orderitems.order_by('id').values_list('name', 'price', 'image')),
+            [('Pen', Decimal('1.99'), ''), ('Pad', Decimal('3.35'), '/products/pad.jpg')],
+        )
+
+    def test_checkout_session_gets_current_prices(self):
+        self.client.post('/api/create_checkout_session/', self.cart(), format='json')
+
+        session, = StubStripeClient.sessions
+        self.assertEqual(
+            [(item['price_data']['product_data']['name'], item['price_data']['product_data']['images'],
+              item['price_data']['unit_amount'], item['quantity']) for item in session['line_items']],
+            [('Pen', [], 199, 3), ('Pad', ['/products/pad.jpg'], 335, 1)],
+        )
+
+    def test_unknown_product(self):
+        res = self.client.post('/api/cart/price/', {'orderItems': [{'product': 0, 'quantity': 1}]}, format='json')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['error'], 'Products not found: 0')
@@ -8,6 +8,7 @@ urlpatterns = [
     path('orders/<str:pk>/process/', views.process_order, name='process_order'),
     path('orders/<str:pk>/delete/', views.delete_order, name='delete_order'),
     
+    path('cart/price/', views.price_cart, name='price_cart'),
     path('create_checkout_session/', views.create_checkout_session, name='create_checkout_session'),
     path('order/webhook/', views.stripe_webhook, name='stripe_webhook'),
 ]
\ No newline at end of file
@@ -1,20 +1,24 @@
 from django.shortcuts import get_object_or_404
-from django.contrib.auth.models import User
+import json
 import os 
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 
-from .models import Order, OrderItem
-from .serializers import OrderSerializer
-from product.models import Product 
+from .models import Order
+from .serializers import OrderSerializer, PricedCartSerializer, order_projection
 from .filters import OrderFilter
+from .placement import place_order, OrderPlacementError
+from .reservations import reserve_stock, release_reservations
+from . import pricing
+from .events import HANDLED_EVENTS, record_event
+from .stripe_client import get_stripe_client
 
 import stripe 
 from utils.helpers import get_current_host
+from utils.pagination import get_paginator
 
 
 
@@ -28,42 +32,41 @@ def new_order(request):
     
     order_items = data['orderItems']
     
-    if order_items and len(order_items) == 0:
+    if not order_items:
         return Response({'error': 'No Order Items. Please add atleast one product'}, status=status.HTTP_400_BAD_REQUEST)
-    else:
-        # Create order
-        
-        total_amount = sum([item['price'] * item['quantity'] for item in order_items])
-        
-        order = Order.objects.create(
-            user=user,
+    
+    # Create order, order items and update stock in one transaction, at the current prices
+    try:
+        cart = pricing.price_cart(order_items)
+        order = place_order(
+            user,
+            cart['items'],
             street = data['street'],
             state = data['state'],
             city = data['city'],
             zip_code = data['zip_code'],
             country = data['country'],
             phone_no = data['phone_no'],
-            total_amount=total_amount
+            total_amount=cart['total']
         )
-        
-        # Create order items
-        for i in order_items:
-            product = Product.objects.get(id=i['product'])
-            
-            item = OrderItem.objects.create(
-                product=product,
-                order=order,
-                name=product.name,
-                quantity=i['quantity'],
-                price=i['price']
-            )
-            
-            # Update stock
-            product.stock -= item.quantity
-            product.save()
-        
-        serializer = OrderSerializer(order, many=False)
-        return Response(serializer.data)
+    except OrderPlacementError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = OrderSerializer(order, many=False)
+    return Response(serializer.data)
+
+
+# Price a cart at the current prices, for the checkout page
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def price_cart(request):
+    
+    try:
+        cart = pricing.price_cart(request.data.get('orderItems', []))
+    except OrderPlacementError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(PricedCartSerializer(cart).data)
 
 
 # Get all orders
@@ -72,19 +75,14 @@ def new_order(request):
 def get_orders(request):
     
     filterset = OrderFilter(request.GET, queryset=Order.objects.all().order_by('id'))
-    count = filterset.qs.count()
     
-    # pagination
-    resPerPage = 2
+    # pagination (page numbers, or keyset with ?cursor=)
+    paginator = get_paginator(request, ordering=('created_at', 'id'))
     
-    paginator = PageNumberPagination()
-    paginator.page_size = resPerPage
+    rows = paginator.paginate_queryset(order_projection.values(filterset.qs), request)
     
-    queryset = paginator.paginate_queryset(filterset.qs, request)
-    
-    # orders = Order.objects.all()
-    serializer = OrderSerializer(queryset, many=True)
-    return Response({'count': count, 'resPerPage': resPerPage, 'order': serializer.data}, status=status.HTTP_200_OK)
+    # Serializing the page from plain rows, same output as OrderSerializer
+    return Response({**paginator.get_page_info(), 'order': order_projection.serialize(rows)}, status=status.HTTP_200_OK)
 
 
 # Get order by pk
@@ -92,9 +90,8 @@ def get_orders(request):
 @permission_classes([IsAuthenticated])
 def get_order(request, pk):
     
-    order = get_object_or_404(Order, id=pk)
-    serializer = OrderSerializer(order, many=False)
-    return Response(serializer.data)
+    order = get_object_or_404(order_projection.values(Order.objects.all()), id=pk)
+    return Response(order_projection.serialize([order])[0])
 
 
 @api_view(['PUT'])
@@ -120,7 +117,7 @@ def delete_order(request, pk):
     return Response({'message': 'Order deleted'}, status=status.HTTP_200_OK)
 
 
-stripe.api_key = os.environ.get('STRIPE_PRIVATE_KEY')
+CHECKOUT_FIELDS = ('orderItems', 'street', 'state', 'city', 'zip_code', 'country', 'phone_no')
 
 
 @api_view(['POST'])
@@ -132,7 +129,10 @@ def create_checkout_session(request):
     user = request.user
     data = request.data
     
-    order_items = data['orderItems']
+    # Read and check everything the session needs before any stock is held
+    missing = [field for field in CHECKOUT_FIELDS if field not in data]
+    if missing:
+        return Response({'error': 'Missing ' + ', '.join(missing)}, status=status.HTTP_400_BAD_REQUEST)
     
     shipping_details = {
         'street': data['street'],
@@ -141,35 +141,54 @@ def create_checkout_session(request):
         'zip_code': data['zip_code'],
         'country': data['country'],
         'phone_no': data['phone_no'],
-        'user' : user.id
+        'user' : user.id,
     }
     
+    try:
+        cart = pricing.price_cart(data['orderItems'])
+    except OrderPlacementError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     checkout_order_items = []
-    for i in order_items:
+    for i in cart['items']:
         checkout_order_items.append({
             'price_data': {
                 'currency': 'gbp',
                 'product_data': {
                     'name': i['name'],
-                    'images': [i['image']],
+                    'images': [i['image']] if i['image'] else [],
                     'metadata': {
                         'product_id': i['product'],
                     },  
                 },
+                # pence, exact for Decimal prices
                 'unit_amount': int(i['price'] * 100)
             },
             'quantity': i['quantity'],
         })
+    
+    # Hold the stock until the session is paid for or expires
+    try:
+        reservation, expires_at = reserve_stock(user, cart['items'])
+    except OrderPlacementError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        metadata= shipping_details,
-        line_items=checkout_order_items,
-        customer_email=user.email,
-        mode='payment',
-        success_url=YOUR_DOMAIN, # + '/payment/success/',
-        cancel_url=YOUR_DOMAIN #+ '/payment/cancel/',
-    )
+    # no session, no way to pay for the stock: give it back on any error
+    try:
+        session = get_stripe_client().create_checkout_session(
+            payment_method_types=['card'],
+            metadata={**shipping_details, 'reservation': reservation},
+            line_items=checkout_order_items,
+            customer_email=user.email,
+            mode='payment',
+            # can't be paid for after the reservation is released
+            expires_at=int(expires_at.timestamp()),
+            success_url=YOUR_DOMAIN, # + '/payment/success/',
+            cancel_url=YOUR_DOMAIN #+ '/payment/cancel/',
+        )
+    except Exception:
+        release_reservations(reservation)
+        raise
     
     return Response({'session': session}, status=status.HTTP_200_OK)
 
@@ -182,7 +201,7 @@ def  stripe_webhook(request):
     event = None
     
     try:
-        event = stripe.Webhook.construct_event(
+        event = get_stripe_client().construct_event(
             payload, sig_header, webhook_secret
         )
     except ValueError as e:
@@ -192,46 +211,8 @@ def  stripe_webhook(request):
         # Invalid signature
         return Response({'error' : 'Invalid Signature'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Handle the event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        
-        # print('session', session)
-        line_items = stripe.checkout.Session.list_line_items(session['id'])
-        
-        price = session['amount_total'] / 100
-        
-        order = Order.objects.create(
-            user = User(session.metadata.user),
-            street = session.metadata.street,
-            state = session.metadata.state,
-            city = session.metadata.city,
-            zip_code = session.metadata.zip_code,
-            country = session.metadata.country,
-            phone_no = session.metadata.phone_no,
-            total_amount = price,
-            payment_status = "PAID",
-            payment_mode = "Card"
-        )
-        
-        for item in line_items['data']:
-            
-            line_product = stripe.Product.retrieve(item.price.product)
-            product_id = line_product.metadata.product_id
-            
-            product = Product.objects.get(id=product_id)
-            
-            order_item = OrderItem.objects.create(
-                product=product,
-                order=order,
-                name=product.name,
-                quantity=item.quantity,
-                price=item.price.unit_amount / 100,
-                image = line_product.images[0]
-            )
-            
-            product.stock -= item.quantity
-            product.save()
-        
-        
-        return Response({'details': 'Payment successful'}, status=status.HTTP_200_OK)
\ No newline at end of file
+    # Store the event for the process_stripe_events worker; replays of the same event id are ignored
+    if event['type'] in HANDLED_EVENTS:
+        record_event(event['id'], event['type'], json.loads(payload))
+    
+    return Response({'details': 'Event received'}, status=status.HTTP_200_OK)
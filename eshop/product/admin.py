@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Product
+from .models import Product, StockShard
 
 # Register your models here.
 
 admin.site.register(Product)
+admin.site.register(StockShard)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        post_migrate.connect(repair_search_index, sender=self)
+
+
+# SQLite drops the search triggers whenever a migration rebuilds the product table
+def repair_search_index(sender, using, **kwargs):
+    from django.db import connections
+    from . import search
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and search.sqlite_triggers_missing(connection):
+        search.install(connection)
@@ -0,0 +1,50 @@
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.cache import cache_control
+
+from .models import Product
+from .filters import ProductsFilter
+from .serializers import ProductSerializer, product_projection
+from utils.async_views import acondition, async_api_view, render
+from utils.pagination import get_paginator
+from . import cache
+
+# Async versions of the product read views, served instead of views.py over ASGI (eshop/asgi_urls.py)
+
+
+# get all products
+@cache_control(public=True, max_age=0, must_revalidate=True)
+@acondition(etag_func=cache.aproducts_etag, last_modified_func=cache.aproducts_last_modified)
+@async_api_view(['GET'])
+async def get_products(request):
+    key = await cache.aproducts_cache_key(request)
+    data = await cache.aget_response_data(key)
+    if data is not None:
+        return render(data)
+
+    filterset = ProductsFilter(request.GET, queryset=Product.objects.all().order_by('id'))
+    paginator = get_paginator(request, ordering=('createdAt', 'id'))
+
+    rows = await paginator.apaginate_queryset(product_projection.values(filterset.qs, 'createdAt'), request)
+
+    data = {
+        **paginator.get_page_info(),
+        'products': await product_projection.aserialize(rows)
+        }
+    await cache.aset_response_data(key, data)
+    return render(data)
+
+
+# get product details
+@cache_control(public=True, max_age=0, must_revalidate=True)
+@acondition(etag_func=cache.aproduct_etag, last_modified_func=cache.aproduct_last_modified)
+@async_api_view(['GET'])
+async def get_product(request, pk):
+    key = await cache.aproduct_cache_key(pk)
+    data = await cache.aget_response_data(key)
+    if data is not None:
+        return render(data)
+
+    product = await aget_object_or_404(ProductSerializer.setup_eager_loading(Product.objects.all()), id=pk)
+    data = {'product': ProductSerializer(product, many=False).data}
+    await cache.aset_response_data(key, data)
+    return render(data)
@@ -0,0 +1,199 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from utils import replicas
+
+
+# Versioned response cache for public product reads.
+#
+# Every product has a version, and the catalog as a whole has one. A version is
+# a nanosecond timestamp, so it doubles as the Last-Modified time. Writes bump
+# the versions instead of deleting cached responses; responses cached under an
+# old version are simply never looked up again and expire on their own.
+#
+# Versions only hold when every worker reads them from the same cache, so
+# without SHARED_CACHE nothing is cached and no validators are sent.
+
+CATALOG_VERSION_KEY = 'product:version:catalog'
+
+# An expired version is recreated as "now", which only causes a cache miss
+VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def product_version_key(pk):
+    return f'product:version:{pk}'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def _bump(keys):
+    now = time.time_ns()
+    versions = cache.get_many(keys)
+    cache.set_many({key: max(now, versions.get(key, 0) + 1) for key in keys}, VERSION_TIMEOUT)
+
+
+async def _aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), VERSION_TIMEOUT)
+        version = await cache.aget(key)
+    return version
+
+
+def catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def product_version(pk):
+    return _get_version(product_version_key(pk))
+
+
+async def acatalog_version():
+    return await _aget_version(CATALOG_VERSION_KEY)
+
+
+async def aproduct_version(pk):
+    return await _aget_version(product_version_key(pk))
+
+
+def product_versions(pks):
+    """{pk: version} of the given products, in one cache read once they all have one."""
+    keys = {product_version_key(pk): pk for pk in pks}
+    versions = cache.get_many(list(keys))
+    return {pk: versions[key] if key in versions else _get_version(key) for key, pk in keys.items()}
+
+
+# Bumps run after commit, so a concurrent read can't cache pre-commit data under the new version
+def bump_catalog():
+    transaction.on_commit(lambda: _bump([CATALOG_VERSION_KEY]))
+
+
+# bump the given products, and the catalog since listings embed them
+def bump_products(*pks):
+    keys = [CATALOG_VERSION_KEY] + [product_version_key(pk) for pk in pks]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _query_string(request):
+    return urlencode(sorted((k, v) for k, values in request.GET.lists() for v in values))
+
+
+def _query_digest(request):
+    return hashlib.md5(_query_string(request).encode()).hexdigest()
+
+
+def products_cache_key(request):
+    return f'product:products:{catalog_version()}:{_query_digest(request)}'
+
+
+async def aproducts_cache_key(request):
+    return f'product:products:{await acatalog_version()}:{_query_digest(request)}'
+
+
+# Facets are keyed by the cleaned filter values, so spelling, order and
+# pagination params of the query string don't matter
+def facets_cache_key(filters):
+    values = sorted((name, str(value)) for name, value in filters.items() if value not in (None, ''))
+    digest = hashlib.md5(urlencode(values).encode()).hexdigest()
+    return f'product:facets:{catalog_version()}:{digest}'
+
+
+def product_cache_key(pk):
+    return f'product:detail:{pk}:{product_version(pk)}'
+
+
+async def aproduct_cache_key(pk):
+    return f'product:detail:{pk}:{await aproduct_version(pk)}'
+
+
+def _etag(key):
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def _last_modified(version):
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+# A response read from a lagging replica may be older than the current version,
+# and a client revalidating it would get 304 until the next write
+def _validated():
+    return settings.SHARED_CACHE and not replicas.reading_replica()
+
+
+# etag/last_modified functions for django.views.decorators.http.condition
+def products_etag(request):
+    if _validated():
+        return _etag(products_cache_key(request))
+
+
+def products_last_modified(request):
+    if _validated():
+        return _last_modified(catalog_version())
+
+
+def product_etag(request, pk):
+    if _validated():
+        return _etag(product_cache_key(pk))
+
+
+def product_last_modified(request, pk):
+    if _validated():
+        return _last_modified(product_version(pk))
+
+
+# the same for utils.async_views.acondition, without blocking the event loop
+async def aproducts_etag(request):
+    if _validated():
+        return _etag(await aproducts_cache_key(request))
+
+
+async def aproducts_last_modified(request):
+    if _validated():
+        return _last_modified(await acatalog_version())
+
+
+async def aproduct_etag(request, pk):
+    if _validated():
+        return _etag(await aproduct_cache_key(pk))
+
+
+async def aproduct_last_modified(request, pk):
+    if _validated():
+        return _last_modified(await aproduct_version(pk))
+
+
+# Clients that have just written skip cached responses, and responses read
+# from a lagging replica aren't cached, or they could be served as the current
+# version until it changes again
+def get_response_data(key):
+    if not settings.SHARED_CACHE or replicas.reading_primary():
+        return None
+    return cache.get(key)
+
+
+def set_response_data(key, data):
+    if settings.SHARED_CACHE and not replicas.reading_replica():
+        cache.set(key, data, settings.PRODUCT_CACHE_TIMEOUT)
+
+
+async def aget_response_data(key):
+    if not settings.SHARED_CACHE or replicas.reading_primary():
+        return None
+    return await cache.aget(key)
+
+
+async def aset_response_data(key, data):
+    if settings.SHARED_CACHE and not replicas.reading_replica():
+        await cache.aset(key, data, settings.PRODUCT_CACHE_TIMEOUT)
@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import serializers
+
+from .models import Product
+from .stock import stock_writes
+from . import cache
+
+
+# Catalog import and export, streamed in batches so memory stays flat whatever the catalog size
+
+FORMATS = ('csv', 'ndjson')
+IMPORT_FIELDS = ('sku', 'name', 'price', 'description', 'brand', 'category', 'stock')
+EXPORT_FIELDS = ('id', ) + IMPORT_FIELDS
+MAX_REPORTED_ERRORS = 100
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Product
+        fields = IMPORT_FIELDS
+        extra_kwargs = {
+            # uniqueness is what the upsert is for, don't query for it row by row
+            'sku': {'required': True, 'allow_null': False, 'allow_blank': False, 'validators': []},
+            'name': {'required': True, 'allow_blank': False},
+            'description': {'required': True, 'allow_blank': False},
+            'brand': {'required': True, 'allow_blank': False},
+            'category': {'required': True},
+        }
+
+
+def get_format(name):
+    """'csv' or 'ndjson', from an explicit format or a file name. ValueError for anything else."""
+    if name in FORMATS:
+        return name
+
+    extension = os.path.splitext(name or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.json', '.jsonl', '.ndjson'):
+        return 'ndjson'
+    raise ValueError(f'Unknown catalog format {name!r}, use one of: {", ".join(FORMATS)}')
+
+
+# binary file -> dict per row, read line by line
+def read_rows(file, format):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        if format == 'csv':
+            yield from csv.DictReader(text)
+        else:
+            for line in text:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        # leave the underlying file to its owner
+        text.detach()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_products(rows, user=None, batch_size=1000):
+    """
+    Upsert products by sku, `batch_size` rows at a time: each batch is validated
+    by one serializer without queries, then written with one INSERT ... ON
+    CONFLICT (sku) DO UPDATE in its own transaction. Invalid rows are skipped
+    and reported by row number (1-based). New products belong to `user`.
+    Returns {'created', 'updated', 'invalid', 'errors'}.
+    """
+    result = {'created': 0, 'updated': 0, 'invalid': 0, 'errors': []}
+    row_number = 0
+
+    for batch in batched(rows, batch_size):
+        validator = ProductImportSerializer()
+
+        # the last row of a sku wins, one statement can't update a row twice
+        products = {}
+        for row in batch:
+            row_number += 1
+            try:
+                data = validator.run_validation(row)
+            except serializers.ValidationError as e:
+                result['invalid'] += 1
+                if len(result['errors']) < MAX_REPORTED_ERRORS:
+                    result['errors'].append({'row': row_number, 'errors': e.detail})
+                continue
+            products[data['sku']] = Product(user=user, **data)
+
+        if not products:
+            continue
+
+        with stock_writes(Product.objects.filter(sku__in=products)):
+            existing = Product.objects.filter(sku__in=products).count()
+            Product.objects.bulk_create(
+                products.values(),
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=[field for field in IMPORT_FIELDS if field != 'sku'],
+            )
+            cache.bump_products(*[product.pk for product in products.values() if product.pk is not None])
+
+        result['updated'] += existing
+        result['created'] += len(products) - existing
+
+    cache.bump_catalog()
+    return result
+
+
+def export_rows(format, queryset=None, chunk_size=2000):
+    """Yield the catalog as CSV or NDJSON text, one line at a time, reading `chunk_size` rows per query."""
+    queryset = queryset if queryset is not None else Product.objects.order_by('id')
+    rows = queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    if format == 'csv':
+        buffer = _LineBuffer()
+        writer = csv.writer(buffer)
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+# csv.writer target that hands each line back instead of storing it
+class _LineBuffer:
+
+    def write(self, value):
+        return value
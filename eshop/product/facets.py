@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+
+# Facet counts for a filtered product listing: per category, per brand and per price bucket
+
+
+def price_buckets():
+    """[(min, max), ...] from the PRODUCT_PRICE_BUCKETS bounds; the last bucket has no max."""
+    bounds = [0] + list(settings.PRODUCT_PRICE_BUCKETS)
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def facet_counts(queryset):
+    """
+    Category, brand and price bucket counts of the products in `queryset`, from
+    one query grouped by (category, brand, bucket). The rows that come back are
+    summed up per facet here, there are at most categories x brands x buckets.
+    """
+    buckets = price_buckets()
+    bucket = Case(
+        *[When(price__lt=Decimal(high), then=Value(i)) for i, (_, high) in enumerate(buckets[:-1])],
+        default=Value(len(buckets) - 1),
+        output_field=IntegerField(),
+    )
+    rows = (
+        queryset.order_by()
+        .annotate(price_bucket=bucket)
+        .values('category', 'brand', 'price_bucket')
+        .annotate(count=Count('id'))
+    )
+
+    categories, brands, prices = {}, {}, [0] * len(buckets)
+    total = 0
+    for row in rows:
+        categories[row['category']] = categories.get(row['category'], 0) + row['count']
+        brands[row['brand']] = brands.get(row['brand'], 0) + row['count']
+        prices[row['price_bucket']] += row['count']
+        total += row['count']
+
+    return {
+        'count': total,
+        'categories': [{'category': name, 'count': count} for name, count in _by_count(categories)],
+        'brands': [{'brand': name, 'count': count} for name, count in _by_count(brands)],
+        'prices': [{'min': low, 'max': high, 'count': count} for (low, high), count in zip(buckets, prices)],
+    }
+
+
+def _by_count(counts):
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
@@ -1,12 +1,17 @@
 from django_filters import rest_framework as filters
 from .models import Product
+from .search import search_products
 
 class ProductsFilter(filters.FilterSet):
     
-    keyword = filters.CharFilter(field_name='name', lookup_expr='icontains')
+    keyword = filters.CharFilter(method='search')
     min_price = filters.NumberFilter(field_name='price' or 0, lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price' or 1000000, lookup_expr='lte')
     
     class Meta:
         model = Product
-        fields = ('category', 'brand', 'min_price', 'max_price', 'keyword')
\ No newline at end of file
+        fields = ('category', 'brand', 'min_price', 'max_price', 'keyword')
+        
+    # Full-text search, ranked by relevance
+    def search(self, queryset, name, value):
+        return search_products(queryset, value)
\ No newline at end of file
@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from PIL import Image
+
+from .models import ProductImages, VariantStatus
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Bounded pool shared by all requests, so concurrent uploads can't open unlimited storage connections
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_UPLOAD_WORKERS, thread_name_prefix='image-upload')
+    return _executor
+
+
+def upload_images(product, files):
+    """
+    Stream the uploaded files to storage in parallel and insert their rows in
+    one query. If any upload fails, the files already stored are removed and
+    the error is raised. Returns the new ProductImages, in the order of `files`.
+    """
+    field = ProductImages._meta.get_field('image')
+    images = [ProductImages(product=product) for _ in files]
+
+    futures = [
+        get_executor().submit(
+            field.storage.save, field.generate_filename(image, file.name), file, max_length=field.max_length
+        )
+        for image, file in zip(images, files)
+    ]
+
+    names, error = [], None
+    for future in futures:
+        try:
+            names.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        for name in names:
+            field.storage.delete(name)
+        raise error
+
+    for image, name in zip(images, names):
+        image.image = name
+    return ProductImages.objects.bulk_create(images)
+
+
+def variant_sizes():
+    return {'thumbnail': settings.IMAGE_THUMBNAIL_SIZE, 'web': settings.IMAGE_WEB_SIZE}
+
+
+# original resized to fit in size, in the original's format
+def resize(original, size):
+    variant = original.copy()
+    variant.thumbnail(size)
+
+    buffer = BytesIO()
+    variant.save(buffer, format=original.format)
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(image):
+    """Store the thumbnail and web variants of one image next to its original."""
+    with image.image.open('rb') as f:
+        original = Image.open(f)
+        original.load()
+
+    root, ext = os.path.splitext(os.path.basename(image.image.name))
+    for name, size in variant_sizes().items():
+        getattr(image, name).save(f'{root}_{name}{ext}', resize(original, size), save=False)
+
+
+def generate_pending_variants(limit=100):
+    """
+    Make the variants of up to `limit` pending images, oldest first. Each image
+    is claimed in its own transaction, so several workers can run at once.
+    Images that can't be read or resized are marked FAILED. Returns the number
+    of images processed.
+    """
+    processed = 0
+    last_id = 0
+
+    while processed < limit:
+        with transaction.atomic():
+            image = (
+                ProductImages.objects.select_for_update(skip_locked=True)
+                .filter(variants_status=VariantStatus.PENDING, id__gt=last_id)
+                .order_by('id')
+                .first()
+            )
+            if image is None:
+                break
+            last_id = image.id
+
+            try:
+                make_variants(image)
+            except Exception:
+                logger.exception('Could not make variants of product image %s', image.id)
+                image.variants_status = VariantStatus.FAILED
+            else:
+                image.variants_status = VariantStatus.READY
+                processed += 1
+
+            image.save(update_fields=['thumbnail', 'web', 'variants_status'])
+
+    return processed
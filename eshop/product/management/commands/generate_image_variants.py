@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.images import generate_pending_variants
+
+
+class Command(BaseCommand):
+    help = 'Make the thumbnail and web variants of uploaded product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the pending images and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--batch-size', type=int, default=100, help='Images processed per pass')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = generate_pending_variants(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f'Processed {processed} images')
+
+            if options['once']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from product import catalog
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by sku from a CSV or NDJSON catalog file, streamed in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file, or - for stdin")
+        parser.add_argument('--format', choices=catalog.FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows validated and upserted per query')
+        parser.add_argument('--user', help='Username of the owner of new products')
+
+    def handle(self, *args, **options):
+        try:
+            format = catalog.get_format(options['format'] or options['path'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'No user {options["user"]!r}')
+
+        if options['path'] == '-':
+            result = self.import_file(sys.stdin.buffer, format, user, options['batch_size'])
+        else:
+            with open(options['path'], 'rb') as file:
+                result = self.import_file(file, format, user, options['batch_size'])
+
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']}, updated {result['updated']}, skipped {result['invalid']} invalid rows"
+        ))
+
+    def import_file(self, file, format, user, batch_size):
+        try:
+            return catalog.import_products(catalog.read_rows(file, format), user=user, batch_size=batch_size)
+        except ValueError as e:
+            raise CommandError(f'Could not read the catalog: {e}')
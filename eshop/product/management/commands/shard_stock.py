@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from product.models import Product
+from product.stock import shard_stock
+
+
+class Command(BaseCommand):
+    help = 'Spread the stock of hot products over several rows, so concurrent orders lock different ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='+', type=int)
+        parser.add_argument(
+            '--shards', type=int, default=8, help='Rows per product, 0 moves the stock back into the product row'
+        )
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError('--shards must be 0 or more')
+
+        for product_id in options['product_ids']:
+            try:
+                shard_stock(product_id, options['shards'])
+            except Product.DoesNotExist:
+                raise CommandError(f'Product {product_id} not found')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stock of {len(options['product_ids'])} products spread over {options['shards']} shards"
+        ))
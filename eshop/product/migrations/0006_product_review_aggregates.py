@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Review = apps.get_model('product', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    review_count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+
+    Product.objects.update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        ratings=Cast(
+            Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 0.0),
+            DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_review_aggregates, migrations.RunPython.noop),
+    ]
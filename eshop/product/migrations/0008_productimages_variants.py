@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0007_review_product_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimages',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default='', upload_to='products'),
+        ),
+        migrations.AddField(
+            model_name='productimages',
+            name='variants_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='productimages',
+            name='web',
+            field=models.ImageField(blank=True, default='', upload_to='products'),
+        ),
+        migrations.AddIndex(
+            model_name='productimages',
+            index=models.Index(condition=models.Q(('variants_status', 'PENDING')), fields=['id'], name='image_variants_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, FloatField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+# Keep only the latest review of every user and product, then fix the aggregates of the products involved
+def remove_duplicate_reviews(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    Review = apps.get_model('product', 'Review')
+
+    duplicates = (
+        Review.objects.filter(user__isnull=False).values('product', 'user')
+        .annotate(count=Count('id'), latest=Max('id')).filter(count__gt=1)
+    )
+    products = set()
+    for row in duplicates:
+        Review.objects.filter(product=row['product'], user=row['user'], id__lt=row['latest']).delete()
+        products.add(row['product'])
+
+    if not products:
+        return
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    review_count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+
+    Product.objects.filter(id__in=products).update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        ratings=Cast(
+            Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 0.0),
+            DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_productimages_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'brand', 'price'], name='product_category_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'price'], name='product_brand_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('product', 'user'), name='review_product_user_unique'),
+        ),
+    ]
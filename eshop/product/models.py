@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F, FloatField, DecimalField, Count, Sum, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth.models import User
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
@@ -14,23 +16,93 @@ class Category(models.TextChoices):
 
 
 class Product(models.Model):
+    # supplier stock keeping unit, the key of catalog imports
+    sku = models.CharField(max_length=100, unique=True, null=True, blank=True)
     name = models.CharField(max_length=200, default="", blank=False, null=False)
     price = models.DecimalField(max_digits=7, decimal_places=2, default=0)
     description = models.TextField(max_length=1000, default="", blank=False, null=False)
     brand = models.CharField(max_length=200, default="", blank=False, null=False)
     category = models.CharField(max_length=30, choices=Category.choices)
     ratings = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    # running review aggregates, ratings = rating_sum / review_count
+    review_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
     stock = models.IntegerField(default=0)
+    # > 0: the stock is spread over this many StockShard rows, see product/stock.py
+    stock_shards = models.IntegerField(default=0)
     createdAt = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['createdAt', 'id'], name='product_created_id_idx'),
+            # ProductsFilter: category[, brand][, price range], brand[, price range], price range
+            models.Index(fields=['category', 'brand', 'price'], name='product_category_brand_idx'),
+            models.Index(fields=['brand', 'price'], name='product_brand_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
+    def apply_review_change(self, count_delta, rating_delta):
+        """
+        Adjust the review aggregates with a single UPDATE, so concurrent reviews
+        and stock changes don't overwrite each other. Call inside the same
+        transaction as the review change.
+        """
+        review_count = F('review_count') + count_delta
+        rating_sum = F('rating_sum') + rating_delta
+        
+        Product.objects.filter(id=self.id).update(
+            review_count=review_count,
+            rating_sum=rating_sum,
+            ratings=average_rating(rating_sum, review_count),
+        )
+    
+    
+# ratings expression for the given sum and count expressions, 0 without reviews
+def average_rating(rating_sum, review_count):
+    return Cast(
+        Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, 0), 0.0),
+        DecimalField(max_digits=3, decimal_places=2),
+    )
+    
+    
+# A slice of a hot product's stock, sales take from one shard at a time
+class StockShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.IntegerField()
+    stock = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='stock_shard_product_unique'),
+        ]
+    
+    def __str__(self):
+        return f'{self.product_id}/{self.shard}'
+    
+    
+class VariantStatus(models.TextChoices):
+    PENDING = 'PENDING'
+    READY = 'READY'
+    FAILED = 'FAILED'
+    
+    
 class ProductImages(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, related_name="images")
     image = models.ImageField(upload_to="products")
+    # resized copies, made next to the original by the generate_image_variants worker
+    thumbnail = models.ImageField(upload_to="products", blank=True, default='')
+    web = models.ImageField(upload_to="products", blank=True, default='')
+    variants_status = models.CharField(max_length=20, choices=VariantStatus.choices, default=VariantStatus.PENDING)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(variants_status='PENDING'), name='image_variants_pending_idx'),
+        ]
     
     def __str__(self):
         return self.product.name
@@ -39,8 +111,9 @@ class ProductImages(models.Model):
 # Signal to delete related images when product is deleted
 @receiver(post_delete, sender = ProductImages)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
-    if instance.image:
-        instance.image.delete(save=False)
+    for file in (instance.image, instance.thumbnail, instance.web):
+        if file:
+            file.delete(save=False)
 
 
 # Review model
@@ -51,5 +124,28 @@ class Review(models.Model):
     comment = models.TextField(max_length=1000, default="", blank=False)
     createdAt = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        constraints = [
+            # one review per user and product
+            models.UniqueConstraint(fields=['product', 'user'], name='review_product_user_unique'),
+        ]
+        indexes = [
+            # reviews of a product, newest first
+            models.Index(fields=['product', '-createdAt', '-id'], name='review_product_created_idx'),
+        ]
+    
     def __str__(self):
-        return str(self.comment)
\ No newline at end of file
+        return str(self.comment)
+    
+    
+# Recompute the review aggregates of the given products from the reviews table
+def rebuild_review_aggregates(products):
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    review_count = Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0)
+    rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+    
+    return products.update(
+        review_count=review_count,
+        rating_sum=rating_sum,
+        ratings=average_rating(rating_sum, review_count),
+    )
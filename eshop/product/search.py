@@ -0,0 +1,148 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+# Full-text search over product name, brand and description.
+#
+# PostgreSQL keeps a weighted tsvector in a generated column with a GIN index.
+# SQLite keeps an external-content FTS5 table in sync with triggers.
+# Other backends fall back to a name__icontains lookup.
+
+SEARCH_TABLE = 'product_search'
+
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(brand, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS product_search_vector_idx ON {table} USING GIN (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {search} USING fts5(
+        name, brand, description,
+        content='{table}', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {search}_ai AFTER INSERT ON {table} BEGIN
+        INSERT INTO {search}(rowid, name, brand, description)
+        VALUES (new.id, new.name, new.brand, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {search}_ad AFTER DELETE ON {table} BEGIN
+        INSERT INTO {search}({search}, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {search}_au AFTER UPDATE OF name, brand, description ON {table} BEGIN
+        INSERT INTO {search}({search}, rowid, name, brand, description)
+        VALUES ('delete', old.id, old.name, old.brand, old.description);
+        INSERT INTO {search}(rowid, name, brand, description)
+        VALUES (new.id, new.name, new.brand, new.description);
+    END
+    """,
+    "INSERT INTO {search}({search}) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS {search}_ai",
+    "DROP TRIGGER IF EXISTS {search}_ad",
+    "DROP TRIGGER IF EXISTS {search}_au",
+    "DROP TABLE IF EXISTS {search}",
+]
+
+
+def _execute(connection, statements):
+    table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql.format(table=table, search=SEARCH_TABLE))
+
+
+def install(connection):
+    """Create (or repair) the search index. Safe to run more than once."""
+    if connection.vendor == 'postgresql':
+        _execute(connection, POSTGRES_INSTALL)
+    elif connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_INSTALL)
+
+
+def uninstall(connection):
+    if connection.vendor == 'postgresql':
+        _execute(connection, POSTGRES_UNINSTALL)
+    elif connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL)
+
+
+def sqlite_triggers_missing(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+            [f'{SEARCH_TABLE}_%'],
+        )
+        return cursor.fetchone()[0] < 3
+
+
+def get_terms(keyword):
+    return re.findall(r'\w+', keyword.lower())
+
+
+def search_products(queryset, keyword):
+    """
+    Filter a product queryset by keyword, every term matched as a prefix,
+    and annotate it with `rank` (higher is more relevant).
+    """
+    terms = get_terms(keyword)
+    if not terms:
+        return queryset
+
+    table = Product._meta.db_table
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        match = RawSQL(
+            f"{table}.search_vector @@ to_tsquery('english', %s)", [query],
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f"ts_rank({table}.search_vector, to_tsquery('english', %s))", [query],
+            output_field=FloatField(),
+        )
+    elif vendor == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        match = RawSQL(
+            f"{table}.id IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s)", [query],
+            output_field=BooleanField(),
+        )
+        # bm25 is lower-is-better, weighted name > brand > description
+        rank = RawSQL(
+            f"(SELECT -bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id)", [query],
+            output_field=FloatField(),
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term)
+        return queryset.filter(condition)
+
+    return queryset.filter(match).annotate(rank=rank).order_by('-rank', 'id')
@@ -1,5 +1,8 @@
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
 from .models import *
+from utils.projection import Projection, Children
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -17,21 +20,94 @@ class ProductImageSerializer(serializers.ModelSerializer):
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    # Products embed only their latest reviews, the rest come from products/<pk>/reviews/
+    LATEST_REVIEWS = 5
+    
     images = ProductImageSerializer(many=True, read_only=True)
     reviews = serializers.SerializerMethodField(method_name='get_reviews', read_only=True)
     
     class Meta:
         model = Product
-        fields = ('id', 'name', 'price', 'description', 'brand', 'ratings', 'reviews', 'category','stock', 'user', 'images')
+        fields = ('id', 'sku', 'name', 'price', 'description', 'brand', 'ratings', 'review_count', 'reviews', 'category','stock', 'user', 'images')
+        read_only_fields = ('review_count', )
         
         extra_kwargs = {
+            "sku": {'allow_blank': False},
             "name": {"required": True, 'allow_blank': False},
             "description": {"required": True, 'allow_blank': False},
             "brand": {"required": True, 'allow_blank': False},
             "category": {"required": True, 'allow_blank': False},
         }
         
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        # Load the nested images and latest reviews in one query each instead of one per product
+        latest_reviews = Review.objects.order_by('-createdAt', '-id')[:cls.LATEST_REVIEWS]
+        return queryset.prefetch_related(
+            'images',
+            Prefetch('reviews', queryset=latest_reviews, to_attr='latest_reviews'),
+        )
+        
     def get_reviews(self, obj):
-        reviews = obj.reviews.all()
+        reviews = getattr(obj, 'latest_reviews', None)
+        if reviews is None:
+            reviews = obj.reviews.order_by('-createdAt', '-id')[:self.LATEST_REVIEWS]
         serializer = ReviewSerializer(reviews, many=True)
         return serializer.data
+
+
+class ProductUpdateSerializer(serializers.ModelSerializer):
+    # added to the current stock in the UPDATE itself, so it can't overwrite concurrent orders
+    stock_delta = serializers.IntegerField(required=False, write_only=True)
+    
+    class Meta:
+        model = Product
+        fields = ('sku', 'name', 'price', 'description', 'brand', 'category', 'stock', 'stock_delta')
+        extra_kwargs = {
+            "sku": {'allow_blank': False},
+            "name": {'allow_blank': False},
+            "description": {'allow_blank': False},
+            "brand": {'allow_blank': False},
+            "category": {'required': False},
+        }
+        
+    def validate(self, attrs):
+        if 'stock' in attrs and 'stock_delta' in attrs:
+            raise serializers.ValidationError('Send either stock or stock_delta, not both')
+        return attrs
+        
+        
+# One row of a bulk update, picked by id or sku
+class ProductBulkUpdateSerializer(ProductUpdateSerializer):
+    id = serializers.IntegerField(required=False)
+    
+    class Meta(ProductUpdateSerializer.Meta):
+        fields = ('id', ) + ProductUpdateSerializer.Meta.fields
+        extra_kwargs = {
+            **ProductUpdateSerializer.Meta.extra_kwargs,
+            # a key here, not a new value; no uniqueness query per row
+            "sku": {'allow_blank': False, 'validators': []},
+        }
+        
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if ('id' in attrs) == ('sku' in attrs):
+            raise serializers.ValidationError('Pick the product with either id or sku')
+        if len(attrs) == 1:
+            raise serializers.ValidationError('Nothing to update')
+        return attrs
+
+
+# the latest reviews of every product, numbered per product like the sliced Prefetch above
+def latest_reviews():
+    return Review.objects.annotate(
+        row=Window(RowNumber(), partition_by=F('product'), order_by=(F('createdAt').desc(), F('id').desc())),
+    ).filter(row__lte=ProductSerializer.LATEST_REVIEWS).order_by('-createdAt', '-id')
+
+
+# Read-only projections for the product list, same output as ProductSerializer
+review_projection = Projection(ReviewSerializer)
+product_projection = Projection(ProductSerializer, related={
+    'images': Children(Projection(ProductImageSerializer), ProductImages.objects.order_by('id'), 'product'),
+    'reviews': Children(review_projection, latest_reviews, 'product'),
+})
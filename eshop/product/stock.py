@@ -0,0 +1,192 @@
+import random
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+from .models import Product, StockShard
+from . import cache
+
+
+# Stock counters.
+#
+# A product's stock is its `stock` column, and every sale locks the product row
+# until its transaction commits, so in a flash sale the orders of a hot product
+# queue up one behind the other. `shard_stock` spreads such a product's stock
+# over `stock_shards` StockShard rows instead: a sale takes from one random
+# shard that has enough, so concurrent sales mostly lock different rows.
+#
+# Sales of a sharded product don't touch its `stock` column, which falls behind
+# until sync_sharded_stock (run by the release_stock_reservations worker) sets
+# it to the total again. Writes to it go through stock_writes, which totals the
+# shards first and spreads what is written back over them after.
+
+
+def shard_total():
+    shards = StockShard.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return Coalesce(Subquery(shards.annotate(total=Sum('stock')).values('total')), 0)
+
+
+def lock_products(ids):
+    """
+    {id: product} of the given products. Unsharded products are locked, in id
+    order so concurrent orders can't deadlock. Sharded ones are only read,
+    their sales lock a shard instead.
+    """
+    products = {
+        product.id: product
+        for product in Product.objects.select_for_update().filter(id__in=ids, stock_shards=0).order_by('id')
+    }
+    rest = set(ids) - set(products)
+    if rest:
+        products.update((product.id, product) for product in Product.objects.filter(id__in=rest))
+    return products
+
+
+def decrement_stock(quantities, check_stock=True):
+    """
+    Take the quantities off the stock columns in one UPDATE. With check_stock
+    each row only matches while it still has enough stock. Returns whether
+    every row matched.
+    """
+    in_stock = Q()
+    for product_id, quantity in quantities.items():
+        in_stock |= Q(id=product_id, stock__gte=quantity) if check_stock else Q(id=product_id)
+
+    updated = Product.objects.filter(in_stock).update(stock=Case(
+        *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+        default=F('stock'),
+    ))
+    return updated == len(quantities)
+
+
+def take_from_shards(product, quantity, check_stock=True):
+    """Take `quantity` off a sharded product's stock. Returns False if it doesn't have that many."""
+    for shard in random.sample(range(product.stock_shards), product.stock_shards):
+        taken = StockShard.objects.filter(product=product, shard=shard, stock__gte=quantity).update(
+            stock=F('stock') - quantity
+        )
+        if taken:
+            return True
+
+    # no shard has enough on its own, take it from all of them
+    shards = list(StockShard.objects.select_for_update().filter(product=product).order_by('shard'))
+    if check_stock and sum(max(shard.stock, 0) for shard in shards) < quantity:
+        return False
+
+    remaining = quantity
+    for shard in shards:
+        taken = min(max(shard.stock, 0), remaining)
+        shard.stock -= taken
+        remaining -= taken
+    # only without check_stock: the first shard goes below 0 like the column would
+    shards[0].stock -= remaining
+    StockShard.objects.bulk_update(shards, ['stock'])
+    return True
+
+
+def take_stock(products, quantities, check_stock=True):
+    """
+    Take {product id: quantity} off stock, `products` being lock_products of
+    those ids. Returns the ids of the products without enough stock, in which
+    case the caller must roll back, as something may have been taken already.
+    check_stock=False takes the quantities even if stock runs short.
+    """
+    plain = {
+        product_id: quantity for product_id, quantity in quantities.items()
+        if not products[product_id].stock_shards
+    }
+    if check_stock:
+        short = {product_id for product_id, quantity in plain.items() if products[product_id].stock < quantity}
+        if short:
+            return short
+
+    short = set()
+    # in id order, like lock_products, so orders of the same sharded products can't deadlock
+    for product_id in sorted(quantities):
+        if product_id not in plain and not take_from_shards(products[product_id], quantities[product_id], check_stock):
+            short.add(product_id)
+
+    if plain and not decrement_stock(plain, check_stock):
+        short |= set(plain)
+    return short
+
+
+def return_stock(quantities):
+    """Put {product id: quantity} back on stock, to a random shard of sharded products."""
+    sharded = dict(
+        Product.objects.filter(id__in=quantities, stock_shards__gt=0).values_list('id', 'stock_shards')
+    )
+    plain = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in sharded}
+
+    if plain:
+        Product.objects.filter(id__in=plain).update(stock=Case(
+            *[When(id=product_id, then=F('stock') + quantity) for product_id, quantity in plain.items()],
+            default=F('stock'),
+        ))
+    for product_id, shards in sorted(sharded.items()):
+        StockShard.objects.filter(product_id=product_id, shard=random.randrange(shards)).update(
+            stock=F('stock') + quantities[product_id]
+        )
+
+
+def fold_shards(ids):
+    """Lock the shards of the given sharded products and write their totals to the stock columns."""
+    list(StockShard.objects.select_for_update().filter(product__in=ids).order_by('product', 'shard').values('id'))
+    Product.objects.filter(id__in=ids).update(stock=shard_total())
+
+
+def spread_shards(ids):
+    """Replace the shards of the given products by `stock_shards` even slices of their stock column."""
+    StockShard.objects.filter(product__in=ids).delete()
+
+    shards = []
+    for product_id, stock, count in Product.objects.filter(id__in=ids, stock_shards__gt=0).values_list(
+        'id', 'stock', 'stock_shards'
+    ):
+        size, extra = divmod(stock, count)
+        shards += [
+            StockShard(product_id=product_id, shard=shard, stock=size + (1 if shard < extra else 0))
+            for shard in range(count)
+        ]
+    StockShard.objects.bulk_create(shards)
+
+
+@contextmanager
+def stock_writes(products):
+    """
+    Wrap writes to the stock column of `products` (a queryset). Sharded ones
+    have their shards locked and totalled into the column first, and whatever
+    is written there is spread back over the shards after.
+    """
+    with transaction.atomic():
+        sharded = list(products.filter(stock_shards__gt=0).values_list('id', flat=True))
+        if sharded:
+            fold_shards(sharded)
+        yield
+        if sharded:
+            spread_shards(sharded)
+
+
+def shard_stock(product_id, shards):
+    """Spread a product's stock over `shards` rows, or with 0 move it back into the stock column."""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(id=product_id)
+        if product.stock_shards:
+            fold_shards([product_id])
+
+        Product.objects.filter(id=product_id).update(stock_shards=shards)
+        spread_shards([product_id])
+        cache.bump_products(product_id)
+
+
+def sync_sharded_stock():
+    """Set the stock column of sharded products that fell behind to their shards' total. Returns how many."""
+    ids = list(
+        Product.objects.filter(stock_shards__gt=0).exclude(stock=shard_total()).values_list('id', flat=True)
+    )
+    if ids:
+        Product.objects.filter(id__in=ids).update(stock=shard_total())
+        cache.bump_products(*ids)
+    return len(ids)
@@ -1,3 +1,866 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from PIL import Image
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import Product, ProductImages, Review, StockShard, VariantStatus
+from .serializers import ProductSerializer, product_projection
+from .images import generate_pending_variants
+from .filters import ProductsFilter
+from .catalog import import_products
+from .stock import lock_products, shard_stock, sync_sharded_stock, take_stock
+from . import async_views
+from benchmarks.seed import seed
+from utils.query_plan import PLAN_VENDORS, sequential_scans
 
 # Create your tests here.
+
+TEST_STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.InMemoryStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ProductTestCase(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+
+
+class ProductQueryBudgetTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create(username=f'user{i}@eshop.com') for i in range(3)]
+        cls.products = []
+        for i in range(6):
+            product = Product.objects.create(
+                name=f'Product {i}', price=10 + i, description='desc',
+                brand='Brand', category='Electronics', stock=10
+            )
+            for j in range(3):
+                ProductImages.objects.create(product=product, image=f'products/{i}-{j}.jpg')
+            for user in cls.users:
+                Review.objects.create(product=product, user=user, rating=4, comment='Good')
+            cls.products.append(product)
+
+    def test_get_products_query_budget(self):
+        # count + page + images + reviews
+        with self.assertNumQueries(4):
+            res = self.client.get('/api/products/')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['count'], 6)
+        self.assertEqual(len(res.json()['products'][0]['images']), 3)
+        self.assertEqual(len(res.json()['products'][0]['reviews']), 3)
+
+    def test_get_products_query_budget_is_constant(self):
+        for i in range(4):
+            product = Product.objects.create(name=f'Extra {i}', category='Food')
+            ProductImages.objects.create(product=product, image=f'products/extra-{i}.jpg')
+            Review.objects.create(product=product, user=self.users[0], rating=5, comment='Nice')
+
+        with self.assertNumQueries(4):
+            self.client.get('/api/products/', {'page': 2})
+
+    def test_get_product_query_budget(self):
+        # product + images + reviews
+        with self.assertNumQueries(3):
+            res = self.client.get(f'/api/products/{self.products[0].id}/')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()['product']['reviews']), 3)
+
+
+class ProductPaginationTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Product {i}', price=10 + i, category='Electronics')
+            for i in range(5)
+        ]
+
+    def test_page_size_is_configurable(self):
+        res = self.client.get('/api/products/', {'resPerPage': 3})
+
+        self.assertEqual(res.json()['resPerPage'], 3)
+        self.assertEqual(len(res.json()['products']), 3)
+
+    def test_cursor_pagination_walks_every_product_once(self):
+        res = self.client.get('/api/products/', {'pagination': 'cursor'})
+        ids = [p['id'] for p in res.json()['products']]
+
+        while res.json()['next']:
+            res = self.client.get('/api/products/', {'cursor': res.json()['next']})
+            ids += [p['id'] for p in res.json()['products']]
+
+        self.assertEqual(ids, [p.id for p in self.products])
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/api/products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_cached_count_skips_count_query(self):
+        self.client.get('/api/products/', {'count': 'cached'})
+
+        # page + images + reviews
+        with self.assertNumQueries(3):
+            res = self.client.get('/api/products/', {'count': 'cached', 'page': 2})
+        self.assertEqual(res.json()['count'], 5)
+
+
+class ProductSearchTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.iphone = Product.objects.create(
+            name='iPhone 15', brand='Apple', description='Smartphone with a great camera', category='Electronics'
+        )
+        cls.macbook = Product.objects.create(
+            name='MacBook Air', brand='Apple', description='Thin laptop', category='Laptops'
+        )
+        cls.galaxy = Product.objects.create(
+            name='Galaxy S24', brand='Samsung', description='Android phone, works well with an iPhone charger',
+            category='Electronics'
+        )
+
+    def search(self, keyword):
+        res = self.client.get('/api/products/', {'keyword': keyword})
+        return [p['id'] for p in res.json()['products']]
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.search('iph'), [self.iphone.id, self.galaxy.id])
+
+    def test_matches_brand_and_description(self):
+        self.assertCountEqual(self.search('apple'), [self.iphone.id, self.macbook.id])
+        self.assertEqual(self.search('laptop'), [self.macbook.id])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('apple thin'), [self.macbook.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.macbook.name = 'MacBook Pro'
+        self.macbook.save()
+        self.assertEqual(self.search('pro'), [self.macbook.id])
+
+        self.macbook.delete()
+        self.assertEqual(self.search('macbook'), [])
+
+    def test_punctuation_only_keyword_returns_everything(self):
+        res = self.client.get('/api/products/', {'keyword': '"*'})
+        self.assertEqual(res.json()['count'], 3)
+
+
+# one test process, so its local memory cache is shared
+@override_settings(SHARED_CACHE=True)
+class ProductCacheTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reviewer@eshop.com')
+        cls.product = Product.objects.create(name='Kettle', price=20, category='Kitchen', stock=3)
+
+    def test_cached_product_skips_database(self):
+        url = f'/api/products/{self.product.id}/'
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(url)
+        self.assertEqual(res.json()['product']['name'], 'Kettle')
+
+    def test_conditional_get_returns_not_modified(self):
+        for url in (f'/api/products/{self.product.id}/', '/api/products/'):
+            res = self.client.get(url)
+            self.assertIn('ETag', res)
+            self.assertIn('Last-Modified', res)
+
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+            self.assertEqual(res.status_code, 304)
+
+    def test_listing_etag_depends_on_query(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.assertNotEqual(self.client.get('/api/products/', {'category': 'Food'})['ETag'], etag)
+
+    def test_review_invalidates_product_and_listing(self):
+        url = f'/api/products/{self.product.id}/'
+        detail_etag = self.client.get(url)['ETag']
+        listing_etag = self.client.get('/api/products/')['ETag']
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{url}reviews/', {'rating': 4, 'comment': 'Boils fast'}, format='json')
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json()['product']['reviews']), 1)
+        self.assertNotEqual(self.client.get('/api/products/')['ETag'], listing_etag)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_nothing_cached_without_a_shared_cache(self):
+        url = f'/api/products/{self.product.id}/'
+        self.client.get(url)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(url)
+        self.assertNotIn('ETag', res)
+        self.assertNotIn('Last-Modified', res)
+
+
+@override_settings(SHARED_CACHE=True)
+class ProductFacetsTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.products = [
+            Product.objects.create(
+                name=name, brand=brand, price=price, category=category, description='desc', user=cls.admin
+            )
+            for name, brand, price, category in [
+                ('iPhone 15', 'Apple', 999, 'Electronics'),
+                ('AirPods', 'Apple', 199, 'Electronics'),
+                ('MacBook Air', 'Apple', 1299, 'Laptops'),
+                ('Galaxy S24', 'Samsung', 899, 'Electronics'),
+                ('Galaxy Book', 'Samsung', 5, 'Laptops'),
+            ]
+        ]
+
+    def facets(self, **params):
+        res = self.client.get('/api/products/facets/', params)
+        self.assertEqual(res.status_code, 200)
+        return res.json()['facets']
+
+    def test_counts_per_facet(self):
+        facets = self.facets()
+        self.assertEqual(facets['count'], 5)
+        self.assertEqual(facets['categories'], [
+            {'category': 'Electronics', 'count': 3}, {'category': 'Laptops', 'count': 2},
+        ])
+        self.assertEqual(facets['brands'], [{'brand': 'Apple', 'count': 3}, {'brand': 'Samsung', 'count': 2}])
+        self.assertEqual(facets['prices'][0], {'min': 0, 'max': 10, 'count': 1})
+        self.assertEqual(facets['prices'][-1], {'min': 1000, 'max': None, 'count': 1})
+        self.assertEqual(
+            {(bucket['min'], bucket['count']) for bucket in facets['prices'] if bucket['count']},
+            {(0, 1), (100, 1), (500, 2), (1000, 1)},
+        )
+
+    def test_counts_follow_the_listing_filters(self):
+        params = {'category': 'Electronics', 'min_price': 500, 'keyword': 'galaxy'}
+        facets = self.facets(**params)
+        self.assertEqual(facets['count'], 1)
+        self.assertEqual(facets['brands'], [{'brand': 'Samsung', 'count': 1}])
+        self.assertEqual(facets['count'], self.client.get('/api/products/', params).json()['count'])
+
+    def test_one_query_then_cached_per_filter_set(self):
+        with self.assertNumQueries(1):
+            self.facets(brand='Apple', category='Laptops')
+
+        # same filters, in another order and with pagination params
+        with self.assertNumQueries(0):
+            facets = self.facets(category='Laptops', brand='Apple', page=2, resPerPage=10)
+        self.assertEqual(facets['count'], 1)
+
+        with self.assertNumQueries(1):
+            self.facets(brand='Samsung')
+
+    def test_product_changes_invalidate_cached_counts(self):
+        self.assertEqual(self.facets(category='Laptops')['count'], 2)
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{self.products[0].id}/update/', {'category': 'Laptops'}, format='json')
+
+        self.assertEqual(self.facets(category='Laptops')['count'], 3)
+
+
+class AsyncProductViewTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(products=5, images=2, reviews=4, users=4, orders=0, items=0)
+        cls.product = Product.objects.order_by('id').last()
+
+    def assertSameResponse(self, path, data=None, headers=None):
+        """The sync view and its async version, as served over ASGI, answer the same."""
+        sync = self.client.get(path, data, headers=headers)
+        cache.clear()
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            self.assertEqual(resolve(path).func.__module__, async_views.__name__)
+            asynchronous = async_to_sync(self.async_client.get)(path, data, headers=headers)
+
+        self.assertEqual(asynchronous.status_code, sync.status_code)
+        self.assertEqual(asynchronous['Content-Type'], sync['Content-Type'])
+        self.assertEqual(asynchronous.content, sync.content)
+        return asynchronous
+
+    def test_products(self):
+        self.assertSameResponse('/api/products/', {'resPerPage': 2, 'page': 2})
+        self.assertSameResponse('/api/products/', {'pagination': 'cursor', 'resPerPage': 3})
+        self.assertSameResponse('/api/products/', {'keyword': self.product.name.split()[0], 'count': 'cached'})
+        self.assertSameResponse('/api/products/', {'cursor': 'nonsense'})
+
+    def test_product(self):
+        self.assertSameResponse(f'/api/products/{self.product.id}/')
+        self.assertSameResponse('/api/products/0/')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_cached_response_and_conditional_get(self):
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            get = async_to_sync(self.async_client.get)
+            res = get(f'/api/products/{self.product.id}/')
+
+            with self.assertNumQueries(0):
+                self.assertEqual(get(f'/api/products/{self.product.id}/').content, res.content)
+            res = get(f'/api/products/{self.product.id}/', headers={'If-None-Match': res['ETag']})
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_versions_are_awaited(self):
+        # the sync version lookups would block the event loop on a network cache
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'), \
+                mock.patch('product.cache._get_version', side_effect=AssertionError('blocking cache call')):
+            get = async_to_sync(self.async_client.get)
+            for path in ('/api/products/', f'/api/products/{self.product.id}/'):
+                res = get(path)
+                self.assertEqual(res.status_code, 200)
+                self.assertEqual(get(path, headers={'If-None-Match': res['ETag']}).status_code, 304)
+                self.assertEqual(get(path, headers={'If-Modified-Since': res['Last-Modified']}).status_code, 304)
+
+
+class ReviewAggregateTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(username='alice@eshop.com')
+        cls.bob = User.objects.create(username='bob@eshop.com')
+        cls.product = Product.objects.create(name='Toaster', category='Kitchen', stock=7)
+
+    def review(self, user, rating):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            f'/api/products/{self.product.id}/reviews/', {'rating': rating, 'comment': 'ok'}, format='json'
+        )
+
+    def assertAggregates(self, review_count, rating_sum, ratings):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, review_count)
+        self.assertEqual(self.product.rating_sum, rating_sum)
+        self.assertEqual(str(self.product.ratings), ratings)
+
+    def test_create_update_and_delete(self):
+        self.review(self.alice, 5)
+        self.review(self.bob, 2)
+        self.assertAggregates(2, 7, '3.50')
+
+        self.review(self.bob, 4)
+        self.assertAggregates(2, 9, '4.50')
+
+        self.client.delete(f'/api/products/{self.product.id}/reviews/delete/')
+        self.assertAggregates(1, 5, '5.00')
+
+        self.client.force_authenticate(self.alice)
+        self.client.delete(f'/api/products/{self.product.id}/reviews/delete/')
+        self.assertAggregates(0, 0, '0.00')
+
+    def test_review_does_not_overwrite_stock(self):
+        self.review(self.alice, 3)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 7)
+
+    def test_rebuild_command_repairs_drift(self):
+        Review.objects.create(product=self.product, user=self.alice, rating=4)
+        Review.objects.create(product=self.product, user=self.bob, rating=1)
+        Product.objects.filter(id=self.product.id).update(review_count=9, rating_sum=1)
+
+        call_command('rebuild_review_aggregates', stdout=StringIO())
+        self.assertAggregates(2, 5, '2.50')
+
+
+class ProductReviewsTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Blender', category='Kitchen')
+        users = [User.objects.create(username=f'critic{i}@eshop.com') for i in range(8)]
+        cls.reviews = [
+            Review.objects.create(product=cls.product, user=user, rating=3, comment=f'Review {i}')
+            for i, user in enumerate(users)
+        ]
+        Product.objects.filter(id=cls.product.id).update(review_count=8, rating_sum=24)
+
+    def test_product_embeds_only_latest_reviews(self):
+        product = self.client.get(f'/api/products/{self.product.id}/').json()['product']
+
+        self.assertEqual(product['review_count'], 8)
+        self.assertEqual(
+            [r['id'] for r in product['reviews']],
+            [r.id for r in reversed(self.reviews[-ProductSerializer.LATEST_REVIEWS:])],
+        )
+
+    def test_listing_embeds_only_latest_reviews(self):
+        product = self.client.get('/api/products/').json()['products'][0]
+        self.assertEqual(len(product['reviews']), ProductSerializer.LATEST_REVIEWS)
+
+    def test_reviews_endpoint_pages_newest_first(self):
+        url = f'/api/products/{self.product.id}/reviews/'
+
+        # product + page, the count comes from the product
+        with self.assertNumQueries(2):
+            res = self.client.get(url, {'resPerPage': 5})
+        ids = [r['id'] for r in res.json()['reviews']]
+        self.assertEqual(res.json()['count'], 8)
+
+        res = self.client.get(url, {'resPerPage': 5, 'cursor': res.json()['next']})
+        ids += [r['id'] for r in res.json()['reviews']]
+
+        self.assertIsNone(res.json()['next'])
+        self.assertEqual(ids, [r.id for r in reversed(self.reviews)])
+
+    def test_posting_reviews_still_requires_login(self):
+        res = self.client.post(f'/api/products/{self.product.id}/reviews/', {'rating': 5, 'comment': 'x'})
+        self.assertEqual(res.status_code, 401)
+
+
+class ProductProjectionTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='seller@eshop.com')
+        critics = [User.objects.create(username=f'critic{j}@eshop.com') for j in range(8)]
+        for i, price in enumerate(['9.5', '1234.99', '0']):
+            product = Product.objects.create(
+                name=f'Product \u00e9 {i}', price=price, ratings='4.25', description='desc',
+                brand='Brand', category='Home', stock=i, user=user if i else None,
+            )
+            for j in range(i):
+                ProductImages.objects.create(product=product, image=f'products/{i}-{j}.jpg')
+            for j in range(i * 4):
+                Review.objects.create(product=product, user=critics[j], rating=j % 5, comment=f'Review {j}')
+
+    def test_output_is_byte_compatible_with_serializer(self):
+        products = Product.objects.order_by('id')
+
+        expected = ProductSerializer(ProductSerializer.setup_eager_loading(products), many=True).data
+        actual = product_projection.serialize(product_projection.values(products))
+
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_listing_uses_projection(self):
+        res = self.client.get('/api/products/', {'resPerPage': 3})
+
+        expected = ProductSerializer(ProductSerializer.setup_eager_loading(Product.objects.order_by('id')), many=True)
+        self.assertEqual(
+            res.content,
+            JSONRenderer().render({'count': 3, 'resPerPage': 3, 'products': expected.data}),
+        )
+
+
+def image_file(name, size=(1600, 800), format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format=format)
+    return SimpleUploadedFile(name, buffer.getvalue(), f'image/{format.lower()}')
+
+
+class ProductImageUploadTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='seller@eshop.com')
+        cls.product = Product.objects.create(name='Kettle', category='Kitchen')
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storages = {**TEST_STORAGES, 'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'}}
+        self.enterContext(override_settings(STORAGES=storages, MEDIA_ROOT=self.media_root))
+        self.client.force_authenticate(self.user)
+
+    def upload(self, product, count):
+        files = [image_file(f'kettle-{i}.png') for i in range(count)]
+        return self.client.post('/api/products/upload_images/', {'product': product, 'images': files}, format='multipart')
+
+    def test_upload_stores_files_and_inserts_rows_at_once(self):
+        # product + one bulk insert
+        with self.assertNumQueries(2):
+            res = self.upload(self.product.id, 3)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([os.path.basename(i['image']) for i in res.json()], [f'kettle-{i}.png' for i in range(3)])
+        for image in ProductImages.objects.filter(product=self.product):
+            self.assertTrue(os.path.exists(image.image.path))
+            self.assertEqual(image.variants_status, VariantStatus.PENDING)
+
+    def test_unknown_product(self):
+        res = self.upload(0, 1)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(os.listdir(self.media_root), [])
+
+    def test_failed_upload_removes_stored_files(self):
+        save = FileSystemStorage.save
+
+        def flaky_save(storage, name, content, max_length=None):
+            if name.endswith('kettle-1.png'):
+                raise OSError('storage is down')
+            return save(storage, name, content, max_length=max_length)
+
+        with mock.patch.object(FileSystemStorage, 'save', flaky_save), self.assertRaises(OSError):
+            self.upload(self.product.id, 3)
+
+        self.assertFalse(ProductImages.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'products')), [])
+
+    def test_worker_makes_variants_next_to_original(self):
+        self.upload(self.product.id, 2)
+        broken = ProductImages.objects.create(
+            product=self.product, image=SimpleUploadedFile('broken.png', b'not an image')
+        )
+
+        with self.assertLogs('product.images', 'ERROR'):
+            self.assertEqual(generate_pending_variants(), 2)
+
+        for image in ProductImages.objects.exclude(id=broken.id):
+            self.assertEqual(image.variants_status, VariantStatus.READY)
+            self.assertEqual(os.path.dirname(image.thumbnail.name), os.path.dirname(image.image.name))
+            self.assertEqual(Image.open(image.thumbnail.path).size, (200, 100))
+            self.assertEqual(Image.open(image.web.path).size, (1200, 600))
+
+        broken.refresh_from_db()
+        self.assertEqual(broken.variants_status, VariantStatus.FAILED)
+        self.assertEqual(generate_pending_variants(), 0)
+
+
+@skipUnless(connection.vendor in PLAN_VENDORS, 'No query plan check for this database')
+class ProductQueryPlanTest(ProductTestCase):
+    FILTERS = {'category': 'Home', 'brand': 'Sony', 'min_price': 10, 'max_price': 500, 'keyword': 'wireless'}
+    TABLES = (Product._meta.db_table, Review._meta.db_table, ProductImages._meta.db_table)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(products=500, images=1, reviews=3, users=5, orders=0)
+
+    def test_every_filter_combination_uses_indexes(self):
+        for size in range(1, len(self.FILTERS) + 1):
+            for names in itertools.combinations(self.FILTERS, size):
+                params = {name: self.FILTERS[name] for name in names}
+                queryset = ProductsFilter(params, queryset=Product.objects.all().order_by('id')).qs
+
+                # count, page and keyset page. A lone min or max price matches most of the catalogue,
+                # for its pages walking the table in page order until the page is full beats the price index.
+                queries = [queryset.order_by()]
+                if names not in (('min_price',), ('max_price',)):
+                    queries += [queryset[:20], queryset.order_by('createdAt', 'id')[:20]]
+
+                for query in queries:
+                    with self.subTest(params=params, sql=str(query.query)):
+                        self.assertEqual(sequential_scans(query, self.TABLES), [])
+
+    def test_review_lookup_uses_unique_index(self):
+        product = Product.objects.first()
+        query = Review.objects.filter(product=product, user_id=1)
+        self.assertEqual(sequential_scans(query, self.TABLES), [])
+
+
+CATALOG_CSV = (
+    'sku,name,price,description,brand,category,stock\n'
+    'KET-1,Kettle,19.99,Electric kettle,Bosch,Kitchen,10\n'
+    'LMP-1,Desk lamp,25,LED desk lamp,Ikea,Home,5\n'
+    'BAD-1,,abc,Broken row,Ikea,Garden,x\n'
+)
+
+
+class CatalogImportExportTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.kettle = Product.objects.create(sku='KET-1', name='Old kettle', price=5, category='Kitchen', stock=1)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self, content, name='catalog.csv', **data):
+        file = SimpleUploadedFile(name, content.encode())
+        return self.client.post('/api/products/import/', {'file': file, **data}, format='multipart')
+
+    def test_csv_import_upserts_by_sku(self):
+        res = self.upload(CATALOG_CSV)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({k: res.json()[k] for k in ('created', 'updated', 'invalid')}, {'created': 1, 'updated': 1, 'invalid': 1})
+        self.assertEqual(res.json()['errors'][0]['row'], 3)
+        self.assertCountEqual(res.json()['errors'][0]['errors'], ['name', 'price', 'category', 'stock'])
+
+        self.kettle.refresh_from_db()
+        self.assertEqual((self.kettle.name, str(self.kettle.price), self.kettle.stock), ('Kettle', '19.99', 10))
+        lamp = Product.objects.get(sku='LMP-1')
+        self.assertEqual(lamp.user, self.admin)
+
+        # the search index follows upserts
+        keyword = lambda word: [p['sku'] for p in self.client.get('/api/products/', {'keyword': word}).json()['products']]
+        self.assertEqual(keyword('electric'), ['KET-1'])
+        self.assertEqual(keyword('lamp'), ['LMP-1'])
+
+    def test_ndjson_import_with_command(self):
+        rows = [{'sku': f'SKU-{i}', 'name': f'Item {i}', 'price': '1.50', 'description': 'Item',
+                 'brand': 'Lego', 'category': 'Arts', 'stock': i} for i in range(5)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write('\n'.join(map(json.dumps, rows)) + '\n')
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_products', f.name, '--batch-size', '2', stdout=out)
+
+        self.assertIn('Created 5, updated 0', out.getvalue())
+        self.assertEqual(Product.objects.filter(sku__startswith='SKU-').count(), 5)
+
+    def test_queries_grow_with_batches_not_rows(self):
+        def rows(count):
+            return ({'sku': f'Q-{i}', 'name': 'Q', 'price': 1, 'description': 'Q', 'brand': 'Q', 'category': 'Home', 'stock': 1}
+                    for i in range(count))
+
+        with CaptureQueriesContext(connection) as few:
+            import_products(rows(5), batch_size=100)
+        with CaptureQueriesContext(connection) as many:
+            import_products(rows(50), batch_size=100)
+
+        self.assertEqual(len(many), len(few))
+
+    def test_export_streams_every_product(self):
+        self.upload(CATALOG_CSV)
+
+        res = self.client.get('/api/products/export/')
+        self.assertTrue(res.streaming)
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,sku,name,price,description,brand,category,stock')
+        self.assertEqual(lines[1], f'{self.kettle.id},KET-1,Kettle,19.99,Electric kettle,Bosch,Kitchen,10')
+        self.assertEqual(len(lines), 3)
+
+        res = self.client.get('/api/products/export/', {'type': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(res.streaming_content).decode().splitlines()]
+        self.assertEqual(rows[1]['sku'], 'LMP-1')
+        self.assertEqual(rows[1]['price'], '25.00')
+
+    def test_export_round_trips(self):
+        self.upload(CATALOG_CSV)
+        exported = b''.join(self.client.get('/api/products/export/').streaming_content).decode()
+
+        res = self.upload(exported)
+        self.assertEqual({k: res.json()[k] for k in ('created', 'updated', 'invalid')}, {'created': 0, 'updated': 2, 'invalid': 0})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.upload('x', name='catalog.xml').status_code, 400)
+        self.assertEqual(self.upload('{"sku": ', name='catalog.ndjson').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/export/', {'type': 'xml'}).status_code, 400)
+
+        self.client.force_authenticate(User.objects.create(username='shopper@eshop.com'))
+        self.assertEqual(self.upload(CATALOG_CSV).status_code, 403)
+        self.assertEqual(self.client.get('/api/products/export/').status_code, 403)
+
+
+class ProductUpdateTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.products = [
+            Product.objects.create(
+                sku=f'SKU-{i}', name=f'Product {i}', price=10, description='desc', brand='Brand',
+                category='Home', stock=10, user=cls.admin,
+            )
+            for i in range(6)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.admin)
+
+    def test_patch_writes_only_sent_columns(self):
+        product = self.products[0]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.patch(f'/api/products/{product.id}/update/', {'price': '12.50'}, format='json')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['product']['price'], '12.50')
+        update, = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertIn('SET "price" =', update)
+        self.assertNotIn('"stock"', update)
+
+    def test_patch_stock_delta_keeps_concurrent_changes(self):
+        product = self.products[0]
+        # an order taking stock after the product was read
+        Product.objects.filter(id=product.id).update(stock=7)
+
+        res = self.client.patch(f'/api/products/{product.id}/update/', {'stock_delta': 5}, format='json')
+
+        self.assertEqual(res.json()['product']['stock'], 12)
+        self.assertEqual(
+            self.client.patch(f'/api/products/{product.id}/update/', {'stock': 1, 'stock_delta': 1}, format='json').status_code,
+            400,
+        )
+
+    def test_patch_invalidates_cached_product(self):
+        product = self.products[0]
+        self.client.get(f'/api/products/{product.id}/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/products/{product.id}/update/', {'name': 'Renamed'}, format='json')
+
+        self.assertEqual(self.client.get(f'/api/products/{product.id}/').json()['product']['name'], 'Renamed')
+
+    def test_put_keeps_review_aggregates(self):
+        product = self.products[0]
+        # a review saved after the product was read
+        Product.objects.filter(id=product.id).update(review_count=1, rating_sum=4, ratings=4)
+
+        data = {
+            'name': 'Renamed', 'price': '11.00', 'description': 'desc', 'brand': 'Brand', 'category': 'Home',
+            'stock': 3, 'ratings': 1,
+        }
+        self.assertEqual(self.client.put(f'/api/products/{product.id}/update/', data, format='json').status_code, 200)
+
+        self.assertEqual(
+            Product.objects.filter(id=product.id).values_list('name', 'stock', 'review_count', 'rating_sum', 'ratings').get(),
+            ('Renamed', 3, 1, 4, 4),
+        )
+
+    def test_bulk_update_uses_set_based_statements(self):
+        rows = [{'sku': p.sku, 'price': '15.00'} for p in self.products[:3]]
+        rows += [{'id': p.id, 'stock_delta': 5} for p in self.products[3:]]
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post('/api/products/bulk_update/', {'products': rows}, format='json')
+
+        self.assertEqual(res.json(), {'updated': 6})
+        # one UPDATE for the repriced products, one for the restocked ones
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('price', 'stock')),
+            [(Decimal('15.00'), 10)] * 3 + [(Decimal('10.00'), 15)] * 3,
+        )
+
+    def test_bulk_update_is_all_or_nothing(self):
+        rows = [{'sku': 'SKU-0', 'price': '1.00'}, {'sku': 'NOPE', 'price': '1.00'}]
+        res = self.client.post('/api/products/bulk_update/', {'products': rows}, format='json')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['error'], 'Products not found: NOPE')
+        self.assertEqual(Product.objects.get(sku='SKU-0').price, 10)
+
+        duplicate = [{'sku': 'SKU-0', 'price': '1.00'}, {'id': self.products[0].id, 'stock': 1}]
+        self.assertEqual(self.client.post('/api/products/bulk_update/', {'products': duplicate}, format='json').status_code, 400)
+
+        res = self.client.post('/api/products/bulk_update/', {'products': [{'price': '1.00'}, {'id': 1}]}, format='json')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(len(res.json()['products']), 2)
+
+        self.assertEqual(self.client.post('/api/products/bulk_update/', rows, format='json').status_code, 400)
+
+    def test_bulk_update_only_touches_own_products(self):
+        other = User.objects.create(username='other@eshop.com', is_staff=True)
+        theirs = Product.objects.create(sku='THEIRS', name='Theirs', price=10, stock=10, user=other)
+        rows = [{'sku': 'SKU-0', 'price': '1.00'}, {'sku': 'THEIRS', 'price': '1.00'}]
+
+        res = self.client.post('/api/products/bulk_update/', {'products': rows}, format='json')
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json()['error'], f'You are not authorized to update products: {theirs.id}')
+        self.assertEqual(list(Product.objects.filter(sku__in=['SKU-0', 'THEIRS']).values_list('price', flat=True)), [10, 10])
+
+    def test_bulk_update_cannot_take_stock_below_zero(self):
+        rows = [{'id': self.products[0].id, 'stock_delta': -4}, {'id': self.products[1].id, 'stock_delta': -11}]
+        res = self.client.post('/api/products/bulk_update/', {'products': rows}, format='json')
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.json()['error'], f'Not enough stock for products: {self.products[1].id}')
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', flat=True)[:2]), [10, 10])
+
+
+class StockShardTest(ProductTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        cls.product = Product.objects.create(name='Flash sale', price=5, stock=10, user=cls.admin)
+
+    def setUp(self):
+        super().setUp()
+        shard_stock(self.product.id, 4)
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.product).order_by('shard').values_list('stock', flat=True))
+
+    def take(self, quantity):
+        return take_stock(lock_products([self.product.id]), {self.product.id: quantity})
+
+    def test_stock_is_spread_and_moved_back(self):
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+
+        shard_stock(self.product.id, 0)
+        self.assertEqual(self.shards(), [])
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 10)
+
+    def test_sales_take_from_one_shard_without_locking_the_product(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.take(2), set())
+
+        self.assertEqual(sum(self.shards()), 8)
+        self.assertFalse([q for q in queries if 'UPDATE "product_product"' in q['sql']])
+        # the stock column catches up later
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 10)
+        self.assertEqual(sync_sharded_stock(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 8)
+
+    def test_shards_are_taken_in_product_order(self):
+        other = Product.objects.create(name='Also on sale', price=5, stock=10)
+        shard_stock(other.id, 2)
+        quantities = {other.id: 1, self.product.id: 1}
+
+        with mock.patch('product.stock.take_from_shards', return_value=True) as take_from_shards:
+            take_stock(lock_products(quantities), quantities)
+        self.assertEqual([c.args[0].id for c in take_from_shards.call_args_list], [self.product.id, other.id])
+
+    def test_sales_larger_than_any_shard_take_from_all(self):
+        self.assertEqual(self.take(9), set())
+        self.assertEqual(sum(self.shards()), 1)
+        self.assertEqual(self.take(2), {self.product.id})
+
+    def test_stock_written_through_the_api_is_spread(self):
+        self.take(2)
+        self.client.force_authenticate(self.admin)
+
+        self.client.patch(f'/api/products/{self.product.id}/update/', {'stock_delta': 4}, format='json')
+        self.assertEqual(self.shards(), [3, 3, 3, 3])
+
+        rows = [{'id': self.product.id, 'stock': 5}]
+        self.client.post('/api/products/bulk_update/', {'products': rows}, format='json')
+        self.assertEqual(self.shards(), [2, 1, 1, 1])
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 5)
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Product
+from .stock import stock_writes
+from . import cache
+
+
+class BulkUpdateError(Exception):
+    pass
+
+
+class BulkUpdateUnauthorized(BulkUpdateError):
+    pass
+
+
+def stock_change(data):
+    return F('stock') + data['stock_delta'] if 'stock_delta' in data else data['stock']
+
+
+def update_columns(product, data):
+    """
+    Write the validated ProductUpdateSerializer `data` to `product` with one
+    UPDATE of just those columns. Returns the names of the columns written.
+    """
+    changes = {field: value for field, value in data.items() if field not in ('stock', 'stock_delta')}
+    if 'stock' in data or 'stock_delta' in data:
+        changes['stock'] = stock_change(data)
+
+    if changes:
+        with stock_writes(Product.objects.filter(id=product.id) if 'stock' in changes else Product.objects.none()):
+            Product.objects.filter(id=product.id).update(**changes)
+        cache.bump_products(product.id)
+    return list(changes)
+
+
+def bulk_update_products(rows, user):
+    """
+    Apply validated ProductBulkUpdateSerializer rows, all or nothing. The
+    products are locked in id order with one query, then rows that change the
+    same columns are written together with bulk_update, a CASE per column and
+    one UPDATE per batch, however many products there are. Like
+    update_product, only `user`'s own products can be updated, and a
+    stock_delta can't take stock below 0.
+    Returns the number of products updated.
+    """
+    ids = {row['id'] for row in rows if 'id' in row}
+    skus = {row['sku'] for row in rows if 'sku' in row}
+
+    with transaction.atomic():
+        # Same lock order as place_order, so concurrent orders can't deadlock with us
+        found = list(
+            Product.objects.select_for_update().filter(Q(id__in=ids) | Q(sku__in=skus))
+            .order_by('id').values_list('id', 'sku', 'user')
+        )
+        sku_ids = {sku: pk for pk, sku, _ in found if sku is not None}
+
+        missing = sorted(map(str, ids - {pk for pk, _, _ in found})) + sorted(skus - set(sku_ids))
+        if missing:
+            raise BulkUpdateError('Products not found: {keys}'.format(keys=', '.join(missing)))
+
+        others = [str(pk) for pk, _, owner in found if owner != user.id]
+        if others:
+            raise BulkUpdateUnauthorized(
+                'You are not authorized to update products: {keys}'.format(keys=', '.join(others))
+            )
+
+        groups = defaultdict(list)
+        seen = set()
+        stocked = []
+        decreased = []
+        for row in rows:
+            pk = row['id'] if 'id' in row else sku_ids[row['sku']]
+            if pk in seen:
+                raise BulkUpdateError(f'Product {pk} is listed more than once')
+            seen.add(pk)
+
+            product = Product(id=pk)
+            fields = []
+            for field, value in row.items():
+                if field in ('id', 'sku', 'stock', 'stock_delta'):
+                    continue
+                setattr(product, field, value)
+                fields.append(field)
+            if 'stock' in row or 'stock_delta' in row:
+                product.stock = stock_change(row)
+                fields.append('stock')
+                stocked.append(pk)
+                if row.get('stock_delta', 0) < 0:
+                    decreased.append(pk)
+
+            groups[tuple(sorted(fields))].append(product)
+
+        with stock_writes(Product.objects.filter(id__in=stocked)):
+            for fields, products in groups.items():
+                Product.objects.bulk_update(sorted(products, key=lambda product: product.id), fields)
+
+            # checked after the write, on the locked rows and the shard totals, and rolled back
+            short = sorted(Product.objects.filter(id__in=decreased, stock__lt=0).values_list('id', flat=True))
+            if short:
+                raise BulkUpdateError('Not enough stock for products: {keys}'.format(keys=', '.join(map(str, short))))
+
+        cache.bump_products(*seen)
+
+    return len(seen)
@@ -3,12 +3,16 @@ from . import views
 
 urlpatterns = [
     path('products/', views.get_products, name='products'),
+    path('products/facets/', views.get_product_facets, name='product_facets'),
     path('products/new/', views.new_product, name='new_product'),
     path('products/upload_images/', views.upload_product_images, name='upload_product_images'),
+    path('products/import/', views.import_products, name='import_products'),
+    path('products/export/', views.export_products, name='export_products'),
+    path('products/bulk_update/', views.bulk_update_products, name='bulk_update_products'),
     path('products/<str:pk>/', views.get_product, name='get_product_details'),
     path('products/<str:pk>/update/', views.update_product, name='update_product'),
     path('products/<str:pk>/delete/', views.delete_product, name='delete_product'),
     
-    path('products/<str:pk>/reviews/', views.create_review, name='create_update_reviews'),
+    path('products/<str:pk>/reviews/', views.reviews, name='create_update_reviews'),
     path('products/<str:pk>/reviews/delete/', views.delete_review, name='delete_review'),
 ]
\ No newline at end of file
@@ -1,53 +1,88 @@
 # Django imports
 from django.shortcuts import get_object_or_404
-from django.db.models import Avg
+from django.http import StreamingHttpResponse
+from django.db import IntegrityError, transaction
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 
 # Django-REST-Framework imports
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
 
 # 
 from .models import Product, ProductImages, Review
 from .filters import ProductsFilter
-from .serializers import ProductSerializer, ProductImageSerializer
+from .images import upload_images
+from .facets import facet_counts
+from .stock import stock_writes
+from .serializers import (
+    ProductSerializer, ProductImageSerializer, ReviewSerializer, ProductUpdateSerializer, ProductBulkUpdateSerializer,
+    product_projection,
+)
+from utils.pagination import get_paginator, KeysetPagination
+from utils.instrumentation import timer
+from . import cache, catalog, updates
 
 # Create your views here.
 
 # get all products
 @api_view(['GET'])
+@cache_control(public=True, max_age=0, must_revalidate=True)
+@condition(etag_func=cache.products_etag, last_modified_func=cache.products_last_modified)
 def get_products(request):
+    key = cache.products_cache_key(request)
+    data = cache.get_response_data(key)
+    if data is not None:
+        return Response(data)
+    
     # Filtering products using Django-Filter
     filterset = ProductsFilter(request.GET, queryset=Product.objects.all().order_by('id'))
     
-    count = filterset.qs.count()
-    
-    # pagination 
-    resPerPage = 2
+    # pagination (page numbers, or keyset with ?cursor=)
+    paginator = get_paginator(request, ordering=('createdAt', 'id'))
     
-    paginator = PageNumberPagination()
-    paginator.page_size = resPerPage
+    rows = paginator.paginate_queryset(product_projection.values(filterset.qs, 'createdAt'), request)
     
-    queryset = paginator.paginate_queryset(filterset.qs, request)
-    
-    # Serializing the filtered products using Django-REST-Framework serializer
-    serializer = ProductSerializer(queryset, many=True)
-    return Response({
-        'count': count,
-        'resPerPage': resPerPage,
-        'products': serializer.data
-        })
+    # Serializing the page from plain rows, same output as ProductSerializer
+    data = {
+        **paginator.get_page_info(),
+        'products': product_projection.serialize(rows)
+        }
+    cache.set_response_data(key, data)
+    return Response(data)
+
+# facet counts (category, brand, price bucket) for the same filters as get_products
+@api_view(['GET'])
+def get_product_facets(request):
+    filterset = ProductsFilter(request.GET, queryset=Product.objects.all())
+    # like the listing, values that don't validate are left out of the filters
+    filterset.is_valid()
+
+    key = cache.facets_cache_key(filterset.form.cleaned_data)
+    data = cache.get_response_data(key)
+    if data is None:
+        data = {'facets': facet_counts(filterset.qs)}
+        cache.set_response_data(key, data)
+    return Response(data)
 
 # get product details
 @api_view(['GET'])
+@cache_control(public=True, max_age=0, must_revalidate=True)
+@condition(etag_func=cache.product_etag, last_modified_func=cache.product_last_modified)
 def get_product(request, pk):
+    key = cache.product_cache_key(pk)
+    data = cache.get_response_data(key)
+    if data is not None:
+        return Response(data)
 
-    product = get_object_or_404(Product, id=pk)
+    product = get_object_or_404(ProductSerializer.setup_eager_loading(Product.objects.all()), id=pk)
     serializer = ProductSerializer(product, many=False)
-    return Response({'product': serializer.data})
+    data = {'product': serializer.data}
+    cache.set_response_data(key, data)
+    return Response(data)
     
     
 # upload image files
@@ -57,12 +92,15 @@ def upload_product_images(request):
     
     data = request.data
     files = request.FILES.getlist('images')
+    
+    product = get_object_or_404(Product, id=data['product'])
 
-    images = []
-    for file in files:
-        image = ProductImages.objects.create(product=Product(data['product']), image=file)
-        images.append(image)
+    # stored in parallel, thumbnails and web sizes follow from the generate_image_variants worker
+    with timer('storage'):
+        images = upload_images(product, files)
         
+    cache.bump_products(product.id)
+    
     serializer = ProductImageSerializer(images, many=True)
     
     return Response(serializer.data)
@@ -79,6 +117,7 @@ def new_product(request):
     if serializer.is_valid():
         
         product = Product.objects.create(**data, user=request.user)
+        cache.bump_catalog()
         
         res = ProductSerializer(product, many=False)
         
@@ -88,7 +127,43 @@ def new_product(request):
         return Response(serializer.errors, status=400)
     
 
-@api_view(['PUT'])
+
+# Upsert products by sku from an uploaded CSV or NDJSON catalog
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def import_products(request):
+    file = request.FILES.get('file')
+    if file is None:
+        return Response({'error': 'Please upload a catalog file'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        format = catalog.get_format(request.data.get('type') or file.name)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # batches before an unreadable line stay imported
+    try:
+        result = catalog.import_products(catalog.read_rows(file.file, format), user=request.user)
+    except ValueError as e:
+        return Response({'error': f'Could not read the catalog: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+
+# Stream the whole catalog as ?type=csv (default) or ?type=ndjson
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def export_products(request):
+    format = request.query_params.get('type', 'csv')
+    if format not in catalog.FORMATS:
+        return Response({'error': f'type must be one of: {", ".join(catalog.FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(catalog.export_rows(format), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="products.{format}"'
+    return response
+
+
+@api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def update_product(request, pk):
     product = get_object_or_404(Product, id=pk)
@@ -97,20 +172,59 @@ def update_product(request, pk):
     if product.user != request.user:
         return Response({'error': 'You are not authorized to update this product'}, status=status.HTTP_401_UNAUTHORIZED)
     
+    if request.method == 'PATCH':
+        return patch_product(request, product)
+    
     product.name = request.data['name']
     product.price = request.data['price']
     product.description = request.data['description']
     product.brand = request.data['brand']
     product.category = request.data['category']
     product.stock = request.data['stock']
-    product.ratings = request.data['ratings']
     
-    product.save()
+    # the review aggregates are kept by reviews, never written from a stale read
+    with stock_writes(Product.objects.filter(id=product.id)):
+        product.save(update_fields=['name', 'price', 'description', 'brand', 'category', 'stock'])
+    cache.bump_products(product.id)
     
     serializer = ProductSerializer(product, many=False)
     return Response({'product': serializer.data})
 
 
+
+# write only the fields sent, stock can be changed relatively with stock_delta
+def patch_product(request, product):
+    serializer = ProductUpdateSerializer(product, data=request.data, partial=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    updates.update_columns(product, serializer.validated_data)
+    
+    product = Product.objects.get(id=product.id)
+    return Response({'product': ProductSerializer(product, many=False).data})
+
+
+# Update many products, picked by id or sku, in a few set-based UPDATEs
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def bulk_update_products(request):
+    if not isinstance(request.data, dict):
+        return Response({'error': 'Send {"products": [...]}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = ProductBulkUpdateSerializer(data=request.data.get('products', []), many=True, allow_empty=False)
+    if not serializer.is_valid():
+        return Response({'products': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        updated = updates.bulk_update_products(serializer.validated_data, request.user)
+    except updates.BulkUpdateUnauthorized as e:
+        return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    except updates.BulkUpdateError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({'updated': updated})
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def delete_product(request, pk):
@@ -127,39 +241,70 @@ def delete_product(request, pk):
         image.delete()
         
     product.delete()
+    cache.bump_products(pk)
     
     return Response({ 'details': 'Product is deleted' }, status=status.HTTP_204_NO_CONTENT)
 
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
+# list or create reviews
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def reviews(request, pk):
+    if request.method == 'GET':
+        return get_reviews(request, pk)
+    return create_review(request, pk)
+
+
+# get reviews of a product, newest first, with cursor pagination
+def get_reviews(request, pk):
+    product = get_object_or_404(Product, id=pk)
+    
+    paginator = KeysetPagination(ordering=('-createdAt', '-id'))
+    queryset = paginator.paginate_queryset(product.reviews.all(), request, count=product.review_count)
+    
+    serializer = ReviewSerializer(queryset, many=True)
+    return Response({
+        **paginator.get_page_info(),
+        'reviews': serializer.data
+        })
+
+
 def create_review(request, pk):
     user = request.user
     product = get_object_or_404(Product, id=pk)
     data = request.data
     
-    # Check if the user has already reviewed the product
-    review = product.reviews.filter(user=user)
-    
     if data['rating'] <= 0 or data['rating'] > 5:
         return Response({'error': 'Rating must be between 1 and 5'}, status=status.HTTP_400_BAD_REQUEST)
-    elif review.exists():
-        
-        new_review = {'rating': data['rating'], 'comment': data['comment']}
-        review.update(**new_review)
+    
+    with transaction.atomic():
+        # Check if the user has already reviewed the product (one lookup on review_product_user_unique)
+        review = product.reviews.select_for_update().filter(user=user).first()
         
-        rating = product.reviews.aggregate(avg_rating=Avg('rating'))
+        if review is None:
+            try:
+                with transaction.atomic():
+                    Review.objects.create(product=product, user=user, rating=data['rating'], comment=data['comment'])
+            except IntegrityError:
+                # created by a concurrent request since the lookup, update that one instead
+                review = product.reviews.select_for_update().get(user=user)
+            else:
+                product.apply_review_change(1, data['rating'])
+                details = 'Review created successfully'
         
-        product.ratings = rating['avg_rating']
-        product.save()
+        if review is not None:
+            old_rating = review.rating
+            
+            review.rating = data['rating']
+            review.comment = data['comment']
+            review.save(update_fields=['rating', 'comment'])
+            
+            product.apply_review_change(0, review.rating - old_rating)
+            details = 'Review updated successfully'
         
-        return Response({'details': 'Review updated successfully'})
-    else:
-        Review.objects.create(product=product, user=user, rating=data['rating'], comment=data['comment'])  
-        rating = product.reviews.aggregate(avg_rating=Avg('rating'))
-        product.ratings = rating['avg_rating']
-        product.save()
-        return Response({'details': 'Review created successfully'})
+        cache.bump_products(product.id)
+    
+    return Response({'details': details})
     
 # delete review
 @api_view(['DELETE'])
@@ -168,17 +313,14 @@ def delete_review(request, pk):
     user = request.user
     product = get_object_or_404(Product, id=pk)
     
-    review = product.reviews.filter(user=user)
-    
-    if review.exists():
-        review.delete()
-        rating = product.reviews.aggregate(avg_rating=Avg('rating'))
+    with transaction.atomic():
+        review = product.reviews.select_for_update().filter(user=user).first()
         
-        if rating['avg_rating'] is None:
-            rating['avg_rating'] = 0
+        if review is None:
+            return Response({'error': 'You have not reviewed this product'}, status=status.HTTP_404_NOT_FOUND)
         
-        product.ratings = rating['avg_rating']
-        product.save()
-        return Response({'details': 'Review deleted successfully'})
-    else:
-        return Response({'error': 'You have not reviewed this product'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        review.delete()
+        product.apply_review_change(-1, -review.rating)
+        cache.bump_products(product.id)
+    
+    return Response({'details': 'Review deleted successfully'})
@@ -0,0 +1,112 @@
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.csrf import csrf_exempt
+from django.http import HttpResponse
+
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from account.authentication import CachedJWTAuthentication
+
+
+# Async stand-in for @api_view, for the read views served over ASGI.
+#
+# DRF views are sync only, so under ASGI every request to one is handed to a
+# worker thread. An @async_api_view function runs on the event loop instead and
+# gets what @api_view gives the sync views: JWT authentication, permission
+# classes, the project's exception handler and JSON rendering, so the responses
+# are the same bytes.
+
+renderer = JSONRenderer()
+authenticator = CachedJWTAuthentication()
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type, status=status, headers=headers)
+
+
+def async_api_view(http_method_names, permission_classes=()):
+    allowed_methods = [method.upper() for method in http_method_names] + ['OPTIONS']
+
+    def decorator(func):
+
+        @csrf_exempt
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            drf_request = Request(request)
+            try:
+                if request.method not in allowed_methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+
+                result = await authenticator.aauthenticate(request)
+                if result is not None:
+                    drf_request.user, drf_request.auth = result
+
+                for permission in (permission_class() for permission_class in permission_classes):
+                    if not permission.has_permission(drf_request, None):
+                        if result is None:
+                            raise exceptions.NotAuthenticated()
+                        raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+                response = await func(drf_request, *args, **kwargs)
+            except Exception as exc:
+                response = handle_exception(exc, drf_request, args, kwargs)
+
+            response['Allow'] = ', '.join(allowed_methods)
+            patch_vary_headers(response, ('Accept', ))
+            return response
+
+        return view
+
+    return decorator
+
+
+def acondition(etag_func=None, last_modified_func=None):
+    """
+    django.views.decorators.http.condition for async views, with coroutine
+    functions computing the ETag and last modified time, so they can await
+    the cache instead of blocking the event loop.
+    """
+
+    def decorator(func):
+
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            last_modified = await last_modified_func(request, *args, **kwargs) if last_modified_func else None
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag is not None else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await func(request, *args, **kwargs)
+
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+
+        return view
+
+    return decorator
+
+
+# what APIView.handle_exception does for the sync views
+def handle_exception(exc, request, args, kwargs):
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        exc.auth_header = authenticator.authenticate_header(request)
+
+    handler = api_settings.EXCEPTION_HANDLER
+    response = handler(exc, {'view': None, 'args': args, 'kwargs': kwargs, 'request': request})
+    if response is None:
+        raise exc
+
+    # WWW-Authenticate, Retry-After, ... but not the unrendered response's content type
+    headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+    return render(response.data, response.status_code, headers=headers)
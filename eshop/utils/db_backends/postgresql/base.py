@@ -0,0 +1,19 @@
+from django.db.backends.postgresql import base
+
+from utils.db_pool import DatabaseBusy, TrackedConnectionMixin
+
+try:
+    from psycopg_pool import PoolTimeout
+except ImportError:
+    # psycopg2, no pool
+    PoolTimeout = ()
+
+
+class DatabaseWrapper(TrackedConnectionMixin, base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        try:
+            return super().get_new_connection(conn_params)
+        except PoolTimeout:
+            # every pooled connection stayed busy for DATABASE_POOL_TIMEOUT
+            raise DatabaseBusy()
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from utils.db_pool import TrackedConnectionMixin
+
+
+class DatabaseWrapper(TrackedConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,149 @@
+import collections
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .instrumentation import timer
+
+
+# Database connection reuse and its numbers.
+#
+# With DATABASE_POOL on, connections are checked out of a psycopg pool of at
+# most DATABASE_POOL_MAX_SIZE, waiting up to DATABASE_POOL_TIMEOUT seconds for
+# one. Otherwise every worker thread keeps its connection for
+# DATABASE_CONN_MAX_AGE seconds. The backends in utils/db_backends count and
+# time every checkout, be it a new connection or one from the pool, so the
+# admin performance endpoint shows how many connections are in use, how many
+# threads wait for one and how long getting one takes.
+
+
+class DatabaseBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The service is busy, try again shortly.'
+    default_code = 'database_busy'
+
+    def __init__(self):
+        super().__init__()
+        # the exception handler turns it into Retry-After
+        self.wait = settings.DATABASE_POOL_RETRY_AFTER
+
+
+class ConnectionStats:
+    """Connection checkouts of one database alias in this process."""
+
+    def __init__(self, samples=1000):
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.failed = 0
+        # the latest acquire times, for the percentiles
+        self.timings = collections.deque(maxlen=samples)
+
+    def checkout(self, connect, *args):
+        """Call connect(*args) and count it as taking a connection."""
+        with self.lock:
+            self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = connect(*args)
+        except BaseException:
+            with self.lock:
+                self.waiting -= 1
+                self.failed += 1
+            raise
+
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.acquired += 1
+            self.timings.append(elapsed)
+        return connection
+
+    def checkin(self):
+        with self.lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        with self.lock:
+            timings = sorted(self.timings)
+            stats = {
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'failed': self.failed,
+            }
+
+        def ms(seconds):
+            return round(seconds * 1000, 3)
+
+        def percentile(p):
+            return ms(timings[max(0, math.ceil(p / 100 * len(timings)) - 1)])
+
+        stats['acquire_ms'] = {
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'max': ms(timings[-1]),
+            'mean': ms(sum(timings) / len(timings)),
+        } if timings else None
+        return stats
+
+    def reset(self):
+        with self.lock:
+            self.acquired = 0
+            self.failed = 0
+            self.timings.clear()
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def stats_for(alias):
+    with _stats_lock:
+        return _stats.setdefault(alias, ConnectionStats())
+
+
+class TrackedConnectionMixin:
+    """DatabaseWrapper mixin counting and timing the connections it takes and gives back."""
+
+    def get_new_connection(self, conn_params):
+        with timer('db_connect'):
+            return stats_for(self.alias).checkout(super().get_new_connection, conn_params)
+
+    def _close(self):
+        if self.connection is not None:
+            stats_for(self.alias).checkin()
+        return super()._close()
+
+
+def reuse_mode(connection):
+    if connection.settings_dict['OPTIONS'].get('pool'):
+        return 'pool'
+    return 'per_request' if connection.settings_dict['CONN_MAX_AGE'] == 0 else 'persistent'
+
+
+def connection_stats():
+    """{alias: checkout stats}, with the psycopg pool's own stats for pooled aliases."""
+    result = {}
+    for alias in connections:
+        connection = connections[alias]
+        stats = {'mode': reuse_mode(connection), **stats_for(alias).snapshot()}
+        if stats['mode'] == 'pool':
+            stats['pool'] = connection.pool.get_stats()
+        result[alias] = stats
+    return result
+
+
+def reset_connection_stats():
+    """Forget the counts and timings so far, the connections in use stay counted."""
+    with _stats_lock:
+        for stats in _stats.values():
+            stats.reset()
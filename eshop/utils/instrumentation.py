@@ -0,0 +1,203 @@
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+# Per-request performance timings.
+#
+# PerformanceMiddleware collects database time, view time, render time and any
+# `timer(name)` spans (stripe, storage, smtp, ...) for a sample of requests,
+# sends them back as a Server-Timing header and keeps the slowest requests of
+# every route in memory for the admin performance endpoint.
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.view_started = None
+
+    def add(self, name, seconds):
+        self.durations[name] += seconds
+        self.counts[name] += 1
+
+    def as_dict(self):
+        return {
+            name: {'ms': round(seconds * 1000, 3), 'count': self.counts[name]}
+            for name, seconds in self.durations.items()
+        }
+
+    def server_timing(self):
+        return ', '.join(
+            f'{name};dur={seconds * 1000:.1f};desc="{self.counts[name]}"'
+            for name, seconds in self.durations.items()
+        )
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block to the current request's timings, if it is being measured."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def _time_query(execute, sql, params, many, context):
+    with timer('db'):
+        return execute(sql, params, many, context)
+
+
+# Queries are timed by a wrapper that stays on every connection and does nothing
+# outside a measured request. Under ASGI the queries run on a worker thread, on
+# connections the middleware never sees, the request's timings reach them
+# through the context that sync_to_async copies.
+def install_query_timer(connection):
+    # first, under any connection.execute_wrapper() in progress, whose exit pops the last one
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _time_query)
+
+
+@receiver(connection_created)
+def _time_new_connection(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+class SlowRequestLog:
+    """The `size` slowest requests of every route, kept in a min-heap per route."""
+
+    def __init__(self, size):
+        self.size = size
+        self.routes = {}
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+
+    def record(self, route, duration, entry):
+        item = (duration, next(self.sequence), entry)
+        with self.lock:
+            heap = self.routes.setdefault(route, [])
+            if len(heap) < self.size:
+                heapq.heappush(heap, item)
+            elif duration > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                route: [entry for _, _, entry in sorted(heap, reverse=True)]
+                for route, heap in sorted(self.routes.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.routes.clear()
+
+
+slow_requests = SlowRequestLog(settings.PERF_SLOW_REQUESTS)
+# requests no URL pattern matched, 404s mostly
+UNRESOLVED_ROUTE = '<unresolved>'
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if not self.sampled():
+            return self.get_response(request)
+
+        # connections opened before this module was loaded
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def sampled(self):
+        return settings.PERF_INSTRUMENTATION and random.random() < settings.PERF_SAMPLE_RATE
+
+    def finish(self, request, response, timings, start):
+        end = time.perf_counter()
+        if 'view' not in timings.durations and timings.view_started is not None:
+            timings.add('view', end - timings.view_started)
+        timings.add('total', end - start)
+
+        # routes, not paths: paths carry ids, reset tokens and query strings,
+        # and every unknown path would get its own log
+        match = request.resolver_match
+        route = match.route if match else UNRESOLVED_ROUTE
+        slow_requests.record(route, end - start, {
+            'method': request.method,
+            'status': response.status_code,
+            'at': timezone.now().isoformat(),
+            'timings': timings.as_dict(),
+        })
+
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = _current.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    # DRF responses are rendered after the view returns, time the two separately
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is None or timings.view_started is None:
+            return response
+
+        render_started = time.perf_counter()
+        timings.add('view', render_started - timings.view_started)
+        response.add_post_render_callback(lambda r: timings.add('render', time.perf_counter() - render_started))
+        return response
@@ -0,0 +1,217 @@
+import base64
+import binascii
+import hashlib
+import json
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+
+
+COUNT_MODES = ('exact', 'cached', 'estimate')
+
+
+# get the count mode requested by the client, falling back to the configured default
+def get_count_mode(request):
+    mode = request.query_params.get('count', settings.PAGINATION_COUNT_MODE)
+    return mode if mode in COUNT_MODES else settings.PAGINATION_COUNT_MODE
+
+
+# get the page size requested by the client, capped at MAX_PAGE_SIZE
+def get_page_size(request):
+    try:
+        page_size = int(request.query_params.get('resPerPage', settings.PAGE_SIZE))
+    except ValueError:
+        return settings.PAGE_SIZE
+
+    if page_size <= 0:
+        return settings.PAGE_SIZE
+    return min(page_size, settings.MAX_PAGE_SIZE)
+
+
+def get_count(queryset, mode='exact'):
+    """
+    Count the rows of a queryset.
+
+    exact    - a plain COUNT(*)
+    cached   - a COUNT(*) kept in the cache for PAGINATION_COUNT_CACHE_TIMEOUT seconds
+    estimate - the planner's row estimate on PostgreSQL, cached count elsewhere
+    """
+    queryset = queryset.order_by()
+
+    if mode == 'exact':
+        return queryset.count()
+
+    if mode == 'estimate' and connections[queryset.db].vendor == 'postgresql':
+        return estimate_count(queryset)
+
+    key = count_cache_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+# get_count for async views
+async def aget_count(queryset, mode='exact'):
+    queryset = queryset.order_by()
+
+    if mode == 'exact':
+        return await queryset.acount()
+
+    if mode == 'estimate' and connections[queryset.db].vendor == 'postgresql':
+        return await sync_to_async(estimate_count)(queryset)
+
+    key = count_cache_key(queryset)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    return f'pagination:count:{digest}'
+
+
+def estimate_count(queryset):
+    sql, params = queryset.query.sql_with_params()
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountedPaginator(DjangoPaginator):
+
+    def __init__(self, *args, count_mode='exact', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_mode = count_mode
+
+    @cached_property
+    def count(self):
+        return get_count(self.object_list, self.count_mode)
+
+
+# Page number pagination (?page=) with a configurable page size and count mode
+class PagePagination(PageNumberPagination):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = get_page_size(request)
+        self.django_paginator_class = partial(CountedPaginator, count_mode=get_count_mode(request))
+
+        results = super().paginate_queryset(queryset, request, view)
+        self.count = self.page.paginator.count
+        return results
+
+    # paginate_queryset for async views: the count and the page are read with the async ORM
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = get_page_size(request)
+        self.count = await aget_count(queryset, get_count_mode(request))
+
+        paginator = DjangoPaginator(queryset, self.page_size)
+        paginator.count = self.count
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        return [row async for row in self.page.object_list]
+
+    def get_page_info(self):
+        return {'count': self.count, 'resPerPage': self.page_size}
+
+
+# Keyset pagination (?cursor=) over a (timestamp, id) ordering, descending when prefixed with '-'
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+        self.field, self.pk = (name.lstrip('-') for name in ordering)
+        self.lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+
+    # count skips the count query when the caller already knows it
+    def paginate_queryset(self, queryset, request, view=None, count=None):
+        self.page_size = get_page_size(request)
+        self.count = count if count is not None else get_count(queryset, get_count_mode(request))
+        return self.get_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None, count=None):
+        self.page_size = get_page_size(request)
+        self.count = count if count is not None else await aget_count(queryset, get_count_mode(request))
+        return self.get_page([row async for row in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, last_pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{self.lookup}': value})
+                | Q(**{self.field: value, f'{self.pk}__{self.lookup}': last_pk})
+            )
+
+        # Fetch one extra row to know whether there is a next page
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, results):
+        has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        self.next_cursor = self.encode_cursor(results[-1]) if has_next else None
+        return results
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            value, last_pk = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            value = parse_datetime(value)
+            last_pk = int(last_pk)
+        except (TypeError, ValueError, binascii.Error, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_pk
+
+    # rows are model instances or values() dicts
+    def encode_cursor(self, row):
+        if isinstance(row, dict):
+            position = [row[self.field].isoformat(), row[self.pk]]
+        else:
+            position = [getattr(row, self.field).isoformat(), getattr(row, self.pk)]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_page_info(self):
+        return {'count': self.count, 'resPerPage': self.page_size, 'next': self.next_cursor}
+
+
+# Keyset pagination when the client sends ?cursor= or ?pagination=cursor, page numbers otherwise
+def get_paginator(request, ordering):
+    if 'cursor' in request.query_params or request.query_params.get('pagination') == 'cursor':
+        return KeysetPagination(ordering)
+    return PagePagination()
@@ -0,0 +1,19 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+
+from .db_pool import connection_stats, reset_connection_stats
+from .instrumentation import slow_requests
+
+
+# Slowest sampled requests per route and database connection checkouts, DELETE resets both
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def slow_request_log(request):
+    if request.method == 'DELETE':
+        slow_requests.clear()
+        reset_connection_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response({'routes': slow_requests.snapshot(), 'connections': connection_stats()})
@@ -0,0 +1,50 @@
+import json
+import re
+
+from django.db import connections
+
+
+# Query plan checks for the tests: which tables would a query read in full?
+
+# databases whose plans are understood, tests of the others are skipped
+PLAN_VENDORS = ('postgresql', 'sqlite')
+
+
+def sequential_scans(queryset, tables):
+    """
+    The tables among `tables` that the database plans to read in full for
+    `queryset`. On PostgreSQL sequential scans are disabled while planning, so
+    a Seq Scan in the plan means no index can serve the query at all.
+    None on databases not in PLAN_VENDORS.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor not in PLAN_VENDORS:
+        return None
+    sql, params = queryset.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return sorted({
+                node['Relation Name'] for node in _plan_nodes(plan[0]['Plan'])
+                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') in tables
+            })
+
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            # 'SCAN table' reads a whole table or index, 'SEARCH table USING ...' seeks
+            scanned = (re.match(r'SCAN (\S+)', row[3]) for row in cursor.fetchall())
+            return sorted({match.group(1) for match in scanned if match and match.group(1) in tables})
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
@@ -0,0 +1,147 @@
+import contextvars
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Primary/replica routing.
+#
+# Writes always go to the primary (default). ReplicaMiddleware picks one of
+# DATABASE_READ_REPLICAS for a GET or HEAD to one of the REPLICA_READ_VIEWS, and
+# ReplicaRouter sends that request's reads there. Everything else uses the
+# primary.
+#
+# A client that has just written could read stale data from a replica that
+# hasn't caught up, so after any POST, PUT, PATCH or DELETE the client sticks to
+# the primary for REPLICA_STICKY_SECONDS. The client is known by a cookie and,
+# for token clients that don't keep cookies, by its Authorization header. That
+# one is remembered in the cache, so without SHARED_CACHE another worker
+# wouldn't know, and token clients always read the primary.
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+class _Routing:
+    """What ReplicaMiddleware knows about the current request."""
+
+    def __init__(self, sticky):
+        self.sticky = sticky
+        self.alias = None
+
+
+def reading_primary():
+    """Whether the current request's client has just written, so must not be served anything stale."""
+    routing = _replica.get()
+    return routing is not None and routing.sticky
+
+
+def reading_replica():
+    """Whether the current request reads from a replica, whose data may lag behind."""
+    routing = _replica.get()
+    return routing is not None and routing.alias is not None
+
+
+def sticky_cache_key(authorization):
+    return 'replicas:sticky:' + hashlib.md5(authorization.encode()).hexdigest()
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        routing = _replica.get()
+        if routing is None or routing.alias is None:
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # replicas hold the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if not settings.DATABASE_READ_REPLICAS:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            authorization = request.META.get('HTTP_AUTHORIZATION')
+            if authorization:
+                cache.set(sticky_cache_key(authorization), True, settings.REPLICA_STICKY_SECONDS)
+            return self.stick(response)
+
+        sticky = settings.REPLICA_STICKY_COOKIE in request.COOKIES
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if not sticky and authorization:
+            sticky = cache.get(sticky_cache_key(authorization), False) if settings.SHARED_CACHE else True
+
+        token = _replica.set(_Routing(sticky))
+        try:
+            return self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_READ_REPLICAS:
+            return await self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            authorization = request.META.get('HTTP_AUTHORIZATION')
+            if authorization:
+                await cache.aset(sticky_cache_key(authorization), True, settings.REPLICA_STICKY_SECONDS)
+            return self.stick(response)
+
+        sticky = settings.REPLICA_STICKY_COOKIE in request.COOKIES
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if not sticky and authorization:
+            sticky = await cache.aget(sticky_cache_key(authorization), False) if settings.SHARED_CACHE else True
+
+        token = _replica.set(_Routing(sticky))
+        try:
+            return await self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        routing = _replica.get()
+        if routing is None or routing.sticky:
+            return None
+
+        match = request.resolver_match
+        if match is not None and match.url_name in settings.REPLICA_READ_VIEWS:
+            # one replica for the whole request, so its reads are consistent with each other
+            routing.alias = random.choice(settings.DATABASE_READ_REPLICAS)
+        return None
+
+    def stick(self, response):
+        response.set_cookie(
+            settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True, samesite='Lax',
+        )
+        return response
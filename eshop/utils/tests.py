@@ -0,0 +1,277 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from product.models import Product
+from .db_pool import ConnectionStats, stats_for
+from .instrumentation import UNRESOLVED_ROUTE, SlowRequestLog, _time_query, install_query_timer, slow_requests, timer
+from .lru import LRUCache
+
+
+class PerformanceMiddlewareTest(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.create(name='Kettle', category='Kitchen')
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        slow_requests.clear()
+
+    def server_timing(self, response):
+        return {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_header(self):
+        timing = self.server_timing(self.client.get('/api/products/'))
+
+        self.assertEqual(set(timing), {'db', 'view', 'render', 'total'})
+        # count + page + images + reviews
+        self.assertIn('desc="4"', timing['db'])
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        res = self.client.get('/api/products/')
+
+        self.assertNotIn('Server-Timing', res)
+        self.assertEqual(slow_requests.snapshot(), {})
+
+    def test_admin_endpoint_lists_slow_requests_per_route(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/?page=1')
+
+        self.assertEqual(self.client.get('/api/performance/').status_code, 401)
+
+        self.client.force_authenticate(self.admin)
+        routes = self.client.get('/api/performance/').json()['routes']
+
+        self.assertEqual(len(routes['api/products/']), 2)
+        self.assertIn('total', routes['api/products/'][0]['timings'])
+
+    def test_unresolved_paths_share_one_log_and_no_paths_are_kept(self):
+        self.client.get('/api/products/?keyword=secret')
+        self.client.get('/no-such-page/')
+        self.client.get('/another/missing/page/')
+
+        routes = slow_requests.snapshot()
+        self.assertEqual(set(routes), {'api/products/', UNRESOLVED_ROUTE})
+        self.assertEqual(len(routes[UNRESOLVED_ROUTE]), 2)
+        self.assertNotIn('secret', str(routes))
+        self.assertNotIn('missing', str(routes))
+
+    def test_query_timer_survives_wrappers_around_new_connections(self):
+        def wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        wrappers = connection.execute_wrappers
+        connection.execute_wrappers = []
+        try:
+            # a connection made inside the block, as connection_created installs the timer
+            with connection.execute_wrapper(wrapper):
+                install_query_timer(connection)
+            self.assertEqual(connection.execute_wrappers, [_time_query])
+        finally:
+            connection.execute_wrappers = wrappers
+
+    def test_timer_outside_a_request_is_a_no_op(self):
+        with timer('stripe'):
+            pass
+
+
+class SlowRequestLogTest(TestCase):
+
+    def test_keeps_only_the_slowest(self):
+        log = SlowRequestLog(size=2)
+        for duration in (3, 1, 5, 2, 4):
+            log.record('route', duration, {'duration': duration})
+
+        self.assertEqual([e['duration'] for e in log.snapshot()['route']], [5, 4])
+
+
+class LRUCacheTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_entries_expire(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+
+        with mock.patch('utils.lru.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+REPLICA = 'replica_test'
+
+
+# A second SQLite database stands in for the replica. "Replication" is done by
+# hand, so rows that exist in only one of the two show where a read went.
+@override_settings(DATABASE_READ_REPLICAS=[REPLICA], SHARED_CACHE=True)
+class ReplicaRoutingTest(TestCase):
+    client_class = APIClient
+    # not {'default', REPLICA}: the runner checks those before the replica is added
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        default = connections.settings['default']
+        connections.settings[REPLICA] = {
+            **default,
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+            'TEST': {**default['TEST'], 'MIRROR': None},
+        }
+        call_command('migrate', database=REPLICA, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        User.objects.using(REPLICA).bulk_create([User(id=cls.admin.id, username='admin@eshop.com', is_staff=True)])
+        Product.objects.create(name='Kettle', category='Kitchen', user=cls.admin)
+        Product.objects.using(REPLICA).create(name='Stale kettle', category='Kitchen')
+
+    def setUp(self):
+        cache.clear()
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.admin)}'}
+
+    def product_names(self, path='/api/products/', **headers):
+        return [product['name'] for product in self.client.get(path, **headers).json()['products']]
+
+    def test_listed_reads_go_to_the_replica(self):
+        self.assertEqual(self.product_names(), ['Stale kettle'])
+        self.assertEqual(self.product_names(**self.headers), ['Stale kettle'])
+        self.assertEqual(self.client.get('/api/products/facets/').json()['facets']['count'], 1)
+
+        # replica reads weren't cached, the primary's rows are served as soon as it is read
+        with override_settings(DATABASE_READ_REPLICAS=[]):
+            self.assertEqual(self.product_names(), ['Kettle'])
+
+    def test_replica_reads_have_no_validators(self):
+        res = self.client.get('/api/products/')
+        self.assertNotIn('ETag', res)
+        self.assertNotIn('Last-Modified', res)
+
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            res = async_to_sync(self.async_client.get)('/api/products/')
+        self.assertNotIn('ETag', res)
+
+        with override_settings(DATABASE_READ_REPLICAS=[]):
+            self.assertIn('ETag', self.client.get('/api/products/'))
+
+    def test_async_reads_go_to_the_replica(self):
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            res = async_to_sync(self.async_client.get)('/api/products/')
+        self.assertEqual([product['name'] for product in res.json()['products']], ['Stale kettle'])
+
+    def test_users_are_authenticated_against_the_primary(self):
+        self.assertEqual(self.client.get('/api/me/', **self.headers).status_code, 200)
+
+        # deactivated on the primary, the replica hasn't caught up
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_active = False
+            self.admin.save()
+        self.assertTrue(User.objects.using(REPLICA).get(id=self.admin.id).is_active)
+
+        self.assertEqual(self.client.get('/api/me/', **self.headers).status_code, 401)
+        with override_settings(ROOT_URLCONF='eshop.asgi_urls'):
+            headers = {'Authorization': self.headers['HTTP_AUTHORIZATION']}
+            res = async_to_sync(self.async_client.get)('/api/me/', headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_token_client_sticks_to_the_primary_after_a_write(self):
+        data = {
+            'name': 'Toaster', 'price': 20, 'description': 'Toasts', 'brand': 'Acme', 'category': 'Kitchen', 'stock': 1,
+        }
+        APIClient().post('/api/products/new/', data, format='json', **self.headers)
+
+        # anyone else still reads the replica
+        self.assertEqual(self.product_names(), ['Stale kettle'])
+        self.assertEqual(sorted(self.product_names(**self.headers)), ['Kettle', 'Toaster'])
+
+    @override_settings(SHARED_CACHE=False)
+    def test_token_client_reads_the_primary_without_a_shared_cache(self):
+        self.assertEqual(self.product_names(), ['Stale kettle'])
+        self.assertEqual(self.product_names(**self.headers), ['Kettle'])
+
+    def test_cookie_client_sticks_to_the_primary_after_a_write(self):
+        res = self.client.post('/api/forgot_password/', {'email': 'nobody@eshop.com'})
+        self.assertEqual(res.cookies['db_primary']['max-age'], 5)
+
+        self.assertEqual(APIClient().get('/api/products/').json()['products'][0]['name'], 'Stale kettle')
+        self.assertEqual(self.product_names(), ['Kettle'])
+
+
+class ConnectionStatsTest(TestCase):
+    client_class = APIClient
+
+    def test_checkouts_are_counted_and_timed(self):
+        stats = stats_for('default')
+        before = stats.snapshot()
+        during = {}
+
+        # a thread of its own gets a connection of its own
+        def work():
+            connections['default'].ensure_connection()
+            during.update(stats.snapshot())
+            connections['default'].close()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(during['in_use'], before['in_use'] + 1)
+        self.assertEqual(during['acquired'], before['acquired'] + 1)
+        self.assertGreater(during['acquire_ms']['max'], 0)
+        self.assertEqual(stats.snapshot()['in_use'], before['in_use'])
+
+    def test_failed_checkouts_are_not_in_use(self):
+        stats = ConnectionStats()
+
+        def refuse():
+            raise ConnectionRefusedError()
+
+        with self.assertRaises(ConnectionRefusedError):
+            stats.checkout(refuse)
+
+        self.assertEqual(stats.snapshot(), {'in_use': 0, 'waiting': 0, 'acquired': 0, 'failed': 1, 'acquire_ms': None})
+
+    def test_admin_endpoint_shows_connection_stats(self):
+        admin = User.objects.create(username='admin@eshop.com', is_staff=True)
+        self.client.force_authenticate(admin)
+
+        stats = self.client.get('/api/performance/').json()['connections']
+        self.assertEqual(stats['default']['mode'], 'persistent')
+        self.assertIn('waiting', stats['default'])
+
+        self.client.delete('/api/performance/')
+        self.assertEqual(self.client.get('/api/performance/').json()['connections']['default']['acquired'], 0)